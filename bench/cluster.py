@@ -0,0 +1,138 @@
+"""Пропускная способность режима WORKERS=N: супервизор + N воркеров против фейкового Bot API.
+
+Для каждого N запускается `python main.py` с WORKERS=N и TELEGRAM_API_URL на bench.fake_api.
+Фейковый API отдаёт через getUpdates пачку callback'ов «Мой статус» и «Уведомление прочитано»
+от случайных пользователей; время — от первой выдачи апдейтов до последнего answerCallbackQuery.
+Сначала прогрев (по несколько апдейтов на каждый шард), чтобы не мерить запуск процессов.
+
+Запуск: python -m bench.cluster [--workers 1,2,4] [--users 10000] [--updates 5000] [--latency 0.005]
+"""
+import argparse
+import asyncio
+import os
+import random
+import shutil
+import signal
+import sys
+import tempfile
+import time
+
+from bench.e2e import BOT_TOKEN
+from bench.fake_api import FakeApiConfig, FakeBotApi
+from bench.seed import TG_ID_BASE, create_seeded
+
+WARMUP_UPDATES = 200
+
+
+def callback_dict(update_id: int, tg_id: int, data: str) -> dict:
+    return {
+        "update_id": update_id,
+        "callback_query": {
+            "id": str(update_id), "chat_instance": "bench", "data": data,
+            "from": {"id": tg_id, "is_bot": False, "first_name": "bench"},
+            "message": {
+                "message_id": 1, "date": 0, "text": "bench",
+                "chat": {"id": tg_id, "type": "private"},
+                "from": {"id": 123456, "is_bot": True, "first_name": "bench"},
+            },
+        },
+    }
+
+
+async def wait_for(predicate, timeout: float, what: str):
+    deadline = time.perf_counter() + timeout
+    while not predicate():
+        if time.perf_counter() > deadline:
+            raise RuntimeError(f"timeout waiting for {what}")
+        await asyncio.sleep(0.01)
+
+
+async def wait_answers(api: FakeBotApi, target: int, stall: float = 10.0) -> float:
+    # До target ответов или пока ответы не перестанут приходить (апдейт упал в воркере); время последнего ответа
+    last_count, last_at = -1, time.perf_counter()
+    while api.calls["answerCallbackQuery"] < target:
+        count = api.calls["answerCallbackQuery"]
+        if count != last_count:
+            last_count, last_at = count, time.perf_counter()
+        elif time.perf_counter() - last_at > stall:
+            return last_at
+        await asyncio.sleep(0.01)
+    return time.perf_counter()
+
+
+async def run_workers(n: int, seeded_db: str, tmp: str, args) -> dict:
+    db_path = os.path.join(tmp, f"cluster-{n}.db")
+    shutil.copy(seeded_db, db_path)
+    api = await FakeBotApi(FakeApiConfig(latency=args.latency, jitter=args.latency / 2)).start()
+    env = {
+        **os.environ,
+        "BOT_TOKEN": BOT_TOKEN,
+        "ACCESS_PHRASE": "bench",
+        "DB_PATH": db_path,
+        "TELEGRAM_API_URL": api.base_url,
+        "WORKERS": str(n),
+        "METRICS_PORT": "0",
+        "DB_SLOW_QUERY_MS": "1000000",
+    }
+    env.pop("WORKER_INDEX", None)
+    log = open(os.path.join(tmp, f"cluster-{n}.log"), "w")
+    proc = await asyncio.create_subprocess_exec(sys.executable, "main.py", env=env, stdout=log, stderr=log)
+    rnd = random.Random(args.seed)
+    update_id = 0
+
+    def batch(count: int) -> list[dict]:
+        nonlocal update_id
+        updates = []
+        for _ in range(count):
+            update_id += 1
+            data = "menu_status" if rnd.random() < 0.7 else "ack_dues"
+            updates.append(callback_dict(update_id, TG_ID_BASE + rnd.randrange(args.users), data))
+        return updates
+
+    try:
+        await wait_for(lambda: api.calls["getUpdates"] > 0, 60, "supervisor polling")
+        api.push_updates(batch(WARMUP_UPDATES))
+        await wait_answers(api, WARMUP_UPDATES, stall=30.0)
+        answered = api.calls["answerCallbackQuery"]
+        api.first_update_at = None
+        api.push_updates(batch(args.updates))
+        finished = await wait_answers(api, answered + args.updates)
+        done = api.calls["answerCallbackQuery"] - answered
+        elapsed = finished - api.first_update_at
+        return {"workers": n, "updates": done, "lost": args.updates - done, "seconds": elapsed, "throughput": done / elapsed}
+    finally:
+        if proc.returncode is None:
+            proc.send_signal(signal.SIGTERM)
+            await proc.wait()
+        log.close()
+        await api.stop()
+
+
+def handler_errors(log_path: str) -> int:
+    # Упавшие апдейты: в polling их логирует aiogram, в режиме воркеров — services.cluster
+    with open(log_path, encoding="utf-8", errors="replace") as f:
+        return sum(1 for line in f if "Cause exception while process update" in line or ("cluster: update" in line and "failed" in line))
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", default="1,2,4")
+    parser.add_argument("--users", type=int, default=10_000)
+    parser.add_argument("--updates", type=int, default=5000)
+    parser.add_argument("--latency", type=float, default=0.005, help="задержка фейкового Bot API, с")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory() as tmp:
+        seeded = os.path.join(tmp, "seeded.db")
+        await create_seeded(seeded, args.users)
+        print(f"users={args.users} updates={args.updates} api latency={args.latency * 1000:.0f}ms cpus={os.cpu_count()}", flush=True)
+        base = None
+        for n in (int(x) for x in args.workers.split(",") if x.strip()):
+            r = await run_workers(n, seeded, tmp, args)
+            r["errors"] = handler_errors(os.path.join(tmp, f"cluster-{n}.log"))
+            base = base or r["throughput"]
+            print(f"  N={n}: {r['seconds']:.2f}s, {r['throughput']:.0f} updates/s (x{r['throughput'] / base:.2f}), lost {r['lost']}, handler errors {r['errors']}", flush=True)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
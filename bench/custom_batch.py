@@ -0,0 +1,76 @@
+"""Создание батча кастомных уведомлений: построчные INSERT против set-based.
+
+Запуск: python -m bench.custom_batch [--recipients 10000] [--existing 0.5]
+"""
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+import uuid
+
+from db.dao import DAO
+
+
+async def per_row_batch(dao: DAO, text: str, tg_ids: list[int], sent_at: str, batch_id: str):
+    # Прежняя реализация: INSERT (+ создание пользователя) и last_insert_rowid() на каждого получателя
+    mapping = await dao.tg_to_internal_map(tg_ids)
+    created = []
+    async with dao._conn() as db:
+        await db.execute(
+            "INSERT INTO notification_batches(id,text,created_at) VALUES (?,?,?)",
+            (batch_id, text, sent_at)
+        )
+        for tg_id in tg_ids:
+            internal_id = mapping.get(tg_id)
+            if internal_id is None:
+                await db.execute("INSERT OR IGNORE INTO users(tg_id) VALUES(?)", (tg_id,))
+                cur = await db.execute("SELECT id FROM users WHERE tg_id=?", (tg_id,))
+                internal_id = (await cur.fetchone())[0]
+            await db.execute(
+                "INSERT INTO custom_notifications(user_id,sent_at,batch_id) VALUES (?,?,?)",
+                (internal_id, sent_at, batch_id)
+            )
+            cur = await db.execute("SELECT last_insert_rowid()")
+            created.append((tg_id, (await cur.fetchone())[0]))
+        await db.commit()
+    return created
+
+
+async def run(db_path: str, recipients: int, existing: float, fn) -> float:
+    dao = DAO(db_path)
+    await dao.migrate()
+    await dao.open()
+    try:
+        known = int(recipients * existing)
+        async with dao._conn() as db:
+            await db.executemany("INSERT OR IGNORE INTO users(tg_id, is_active) VALUES (?, 1)", [(5_000_000 + i,) for i in range(known)])
+            await db.commit()
+        tg_ids = [5_000_000 + i for i in range(recipients)]
+        t0 = time.perf_counter()
+        created = await fn(dao, "bench text " * 20, tg_ids, "2024-01-01T10:00:00", uuid.uuid4().hex)
+        elapsed = time.perf_counter() - t0
+        assert len(created) == recipients
+        return elapsed
+    finally:
+        await dao.close()
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--recipients", type=int, default=10_000)
+    parser.add_argument("--existing", type=float, default=0.5, help="доля получателей, уже заведённых в users")
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory() as tmp:
+        old = await run(os.path.join(tmp, "old.db"), args.recipients, args.existing, per_row_batch)
+        new = await run(
+            os.path.join(tmp, "new.db"), args.recipients, args.existing,
+            lambda dao, *a: dao.create_custom_notifications_batch(*a),
+        )
+    print(f"recipients={args.recipients} existing={args.existing:.0%}")
+    print(f"per-row   {old * 1000:9.1f}ms")
+    print(f"set-based {new * 1000:9.1f}ms  (x{old / new:.1f})")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
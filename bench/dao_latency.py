@@ -0,0 +1,72 @@
+"""Латентность одного вызова DAO: соединение на вызов против пула.
+
+Запуск: python -m bench.dao_latency [--calls 2000] [--users 1000]
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import tempfile
+import time
+import aiosqlite
+
+from db.dao import DAO
+
+
+async def seed(dao: DAO, users: int):
+    async with dao._conn() as db:
+        await db.executemany("INSERT OR IGNORE INTO users(tg_id, is_active) VALUES (?, 1)", [(100000 + i,) for i in range(users)])
+        await db.executemany(
+            "INSERT INTO payments(user_id,type,amount,paid_at) VALUES (?,?,?,?)",
+            [(i + 1, "dues" if i % 2 else "vpn", 500, "2024-01-01T00:00:00") for i in range(users)],
+        )
+        await db.commit()
+
+
+async def per_call_connect(db_path: str, tg_id: int):
+    # Прежнее поведение: новое соединение (и поток aiosqlite) на каждый вызов
+    async with aiosqlite.connect(db_path) as db:
+        db.row_factory = aiosqlite.Row
+        cur = await db.execute("SELECT * FROM users WHERE tg_id=?", (tg_id,))
+        await cur.fetchone()
+
+
+async def pooled(dao: DAO, tg_id: int):
+    await dao.get_or_create_user(tg_id)
+
+
+async def measure(fn, calls: int) -> list[float]:
+    samples = []
+    for i in range(calls):
+        t0 = time.perf_counter()
+        await fn(100000 + i % 1000)
+        samples.append((time.perf_counter() - t0) * 1000)
+    return samples
+
+
+def report(name: str, samples: list[float]):
+    samples = sorted(samples)
+    p95 = samples[int(len(samples) * 0.95) - 1]
+    print(f"{name:<18} mean={statistics.mean(samples):.3f}ms p50={statistics.median(samples):.3f}ms p95={p95:.3f}ms")
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--calls", type=int, default=2000)
+    parser.add_argument("--users", type=int, default=1000)
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "bench.db")
+        dao = DAO(db_path)
+        await dao.migrate()
+        await dao.open()
+        try:
+            await seed(dao, args.users)
+            report("connect-per-call", await measure(lambda tg: per_call_connect(db_path, tg), args.calls))
+            report("pooled", await measure(lambda tg: pooled(dao, tg), args.calls))
+        finally:
+            await dao.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,250 @@
+"""Сквозной бенчмарк против локального фейкового Bot API.
+
+Для каждого размера базы (по умолчанию 1k/10k/100k пользователей) в отдельном процессе:
+- наполняет SQLite пользователями и оплатами (bench.seed);
+- поднимает bench.fake_api с заданной задержкой, долей ошибок и 429;
+- замеряет send_daily_reminders, кастомную рассылку через outbox
+  и латентность callback'ов «Мой статус» и «Уведомление прочитано» через dp.feed_update.
+Результаты пишутся в JSON (по умолчанию bench-results/e2e-<commit>.json) для сравнения между коммитами.
+
+Лимит отправки по умолчанию поднят выше реальных 30/с: замеряется накладная стоимость бота, а не лимит Telegram.
+
+Запуск: python -m bench.e2e [--sizes 1000,10000,100000] [--latency 0.02] [--error-rate 0.01] [--rate-limit-rate 0.001]
+Сравнение: python -m bench.e2e --compare old.json new.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from datetime import datetime
+
+from bench.fake_api import FakeApiConfig, FakeBotApi
+from bench.seed import create_seeded
+
+BOT_TOKEN = "123456:BENCHMARK"
+
+
+def percentiles(samples: list[float]) -> dict:
+    samples = sorted(samples)
+    n = len(samples)
+    return {
+        "mean_ms": statistics.mean(samples) * 1000,
+        "p50_ms": samples[int(0.50 * (n - 1))] * 1000,
+        "p95_ms": samples[int(0.95 * (n - 1))] * 1000,
+        "p99_ms": samples[int(0.99 * (n - 1))] * 1000,
+    }
+
+
+def callback_update(update_id: int, tg_id: int, data: str):
+    from aiogram.types import Update
+    return Update.model_validate({
+        "update_id": update_id,
+        "callback_query": {
+            "id": str(update_id),
+            "chat_instance": "bench",
+            "from": {"id": tg_id, "is_bot": False, "first_name": "bench"},
+            "data": data,
+            "message": {
+                "message_id": 1, "date": 0, "text": "bench",
+                "chat": {"id": tg_id, "type": "private"},
+                "from": {"id": 123456, "is_bot": True, "first_name": "bench"},
+            },
+        },
+    })
+
+
+async def run_size(args) -> dict:
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "bench.db")
+        await create_seeded(db_path, args.size)
+        # main читает конфиг при импорте
+        os.environ.update({
+            "BOT_TOKEN": BOT_TOKEN,
+            "ACCESS_PHRASE": "bench",
+            "DB_PATH": db_path,
+            "METRICS_PORT": "0",
+            "DB_SLOW_QUERY_MS": "1000000",
+        })
+        import main
+        from aiogram import Bot
+        from aiogram.client.session.aiohttp import AiohttpSession
+        from aiogram.client.telegram import TelegramAPIServer
+        from aiogram.methods import TelegramMethod
+        from services.delivery import FanOutSender
+        from services.outbox import OutboxWorker
+        from services.reminders import send_daily_reminders
+
+        api = await FakeBotApi(FakeApiConfig(
+            latency=args.latency, jitter=args.jitter, error_rate=args.error_rate,
+            rate_limit_rate=args.rate_limit_rate, retry_after=args.retry_after,
+        )).start()
+        bot = Bot(BOT_TOKEN, session=AiohttpSession(api=TelegramAPIServer.from_base(api.base_url)))
+        dao = main.dao
+        await dao.migrate()
+        await dao.open()
+
+        def new_sender() -> FanOutSender:
+            return FanOutSender(rate=args.send_rate, concurrency=args.send_concurrency, per_chat_interval=args.per_chat_interval, max_retries=3)
+
+        result: dict = {"users": args.size}
+        try:
+            summary = await send_daily_reminders(bot, dao, "Europe/Moscow", 500, 250, sender=new_sender())
+            result["reminders"] = {
+                "wall_s": summary.wall_time, "sent": summary.sent, "failed": summary.failed,
+                "retried": summary.retried, "throughput": summary.throughput,
+            }
+
+            recipients = await dao.active_user_ids()
+            batch_id = uuid.uuid4().hex
+            t0 = time.perf_counter()
+            await dao.create_custom_notifications_batch("bench broadcast", recipients, datetime.now().isoformat(), batch_id)
+            created = time.perf_counter() - t0
+            worker = OutboxWorker(bot, dao, new_sender(), chunk_size=args.outbox_chunk)
+            t0 = time.perf_counter()
+            while await worker.drain_once():
+                pass
+            delivered = time.perf_counter() - t0
+            progress = await dao.batch_progress(batch_id)
+            result["broadcast"] = {
+                "recipients": len(recipients), "create_ms": created * 1000, "deliver_s": delivered,
+                "sent": progress["sent"], "failed": progress["failed"],
+                "throughput": len(recipients) / delivered if delivered else 0.0,
+            }
+
+            rnd = random.Random(7)
+            result["callbacks"] = {}
+            update_id = 1
+            for name, data in (("menu_status", "menu_status"), ("ack", "ack_dues")):
+                samples = []
+                errors = 0
+                for _ in range(args.callbacks):
+                    tg_id = rnd.choice(recipients)
+                    update_id += 1
+                    t0 = time.perf_counter()
+                    try:
+                        response = await main.dp.feed_update(bot, callback_update(update_id, tg_id, data))
+                        # Возвращённый хэндлером метод выполняется так же, как в polling
+                        if isinstance(response, TelegramMethod):
+                            await bot(response)
+                    except Exception:
+                        # Инжектированные ошибки API: в polling диспетчер их логирует и продолжает
+                        errors += 1
+                    samples.append(time.perf_counter() - t0)
+                result["callbacks"][name] = {**percentiles(samples), "errors": errors}
+            result["api_calls"] = dict(api.calls)
+            result["api_errors"] = dict(api.errors)
+        finally:
+            await dao.close()
+            await bot.session.close()
+            await api.stop()
+        return result
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True, stderr=subprocess.DEVNULL).strip()
+    except Exception:
+        return "unknown"
+
+
+def flatten(data: dict, prefix: str = "") -> dict:
+    flat = {}
+    for key, value in data.items():
+        name = f"{prefix}{key}"
+        if isinstance(value, dict):
+            flat.update(flatten(value, name + "."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[name] = value
+    return flat
+
+
+def compare(old_path: str, new_path: str):
+    with open(old_path, encoding="utf-8") as f:
+        old = json.load(f)
+    with open(new_path, encoding="utf-8") as f:
+        new = json.load(f)
+    print(f"{old.get('commit')} -> {new.get('commit')}")
+    old_flat = flatten(old["results"])
+    for key, value in flatten(new["results"]).items():
+        before = old_flat.get(key)
+        if before is None:
+            print(f"  {key:<45} {value:>12.3f} (new)")
+        elif before:
+            print(f"  {key:<45} {before:>12.3f} -> {value:>12.3f} ({(value - before) / before:+.1%})")
+
+
+def child_args(args) -> list[str]:
+    return [
+        "--latency", str(args.latency), "--jitter", str(args.jitter),
+        "--error-rate", str(args.error_rate), "--rate-limit-rate", str(args.rate_limit_rate),
+        "--retry-after", str(args.retry_after), "--send-rate", str(args.send_rate),
+        "--send-concurrency", str(args.send_concurrency), "--per-chat-interval", str(args.per_chat_interval),
+        "--outbox-chunk", str(args.outbox_chunk), "--callbacks", str(args.callbacks),
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", default="1000,10000,100000")
+    parser.add_argument("--size", type=int, help=argparse.SUPPRESS)
+    parser.add_argument("--latency", type=float, default=0.02)
+    parser.add_argument("--jitter", type=float, default=0.01)
+    parser.add_argument("--error-rate", type=float, default=0.01)
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0005)
+    parser.add_argument("--retry-after", type=int, default=1)
+    parser.add_argument("--send-rate", type=float, default=2000)
+    parser.add_argument("--send-concurrency", type=int, default=100)
+    parser.add_argument("--per-chat-interval", type=float, default=1.0)
+    parser.add_argument("--outbox-chunk", type=int, default=1000)
+    parser.add_argument("--callbacks", type=int, default=200)
+    parser.add_argument("--out")
+    parser.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"))
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        return
+    if args.size is not None:
+        # Дочерний процесс: один размер, результат — последней строкой stdout
+        print(json.dumps(asyncio.run(run_size(args))))
+        return
+
+    commit = git_commit()
+    results = {}
+    for size in (int(s) for s in args.sizes.split(",") if s.strip()):
+        print(f"users={size} ...", flush=True)
+        proc = subprocess.run(
+            [sys.executable, "-m", "bench.e2e", "--size", str(size), *child_args(args)],
+            capture_output=True, text=True,
+        )
+        if proc.returncode != 0:
+            print(proc.stderr[-4000:], file=sys.stderr)
+            sys.exit(proc.returncode)
+        results[str(size)] = result = json.loads(proc.stdout.strip().splitlines()[-1])
+        r, b, c = result["reminders"], result["broadcast"], result["callbacks"]
+        print(f"  reminders: {r['sent']} sent, {r['failed']} failed, {r['retried']} retried, {r['wall_s']:.2f}s, {r['throughput']:.0f}/s")
+        print(f"  broadcast: {b['recipients']} recipients, create {b['create_ms']:.0f}ms, deliver {b['deliver_s']:.2f}s, {b['throughput']:.0f}/s")
+        for name, p in c.items():
+            print(f"  callback {name}: p50 {p['p50_ms']:.1f}ms p95 {p['p95_ms']:.1f}ms p99 {p['p99_ms']:.1f}ms")
+
+    out = args.out or os.path.join("bench-results", f"e2e-{commit}.json")
+    os.makedirs(os.path.dirname(out) or ".", exist_ok=True)
+    with open(out, "w", encoding="utf-8") as f:
+        json.dump({
+            "commit": commit,
+            "created_at": datetime.now().isoformat(timespec="seconds"),
+            "params": {k: v for k, v in vars(args).items() if k not in ("size", "out", "compare")},
+            "results": results,
+        }, f, indent=2)
+    print(f"results: {out}")
+
+
+if __name__ == "__main__":
+    main()
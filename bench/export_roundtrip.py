@@ -0,0 +1,91 @@
+"""Проверка: выгрузка оплат (/export payments) принимается импортом CSV без правок.
+
+Наполняет базу оплатами с paid_at в тех видах, что пишет бот (isoformat с микросекундами,
+со смещением пояса, без долей секунды), выгружает их через services.export и импортирует
+в пустую базу. Оплаты в обеих базах должны совпасть, а повторный импорт в исходную —
+найти только дубли. Код возврата 1 при расхождении.
+
+Запуск: python -m bench.export_roundtrip [--payments 5000]
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import tempfile
+from datetime import datetime, timedelta, timezone
+
+from db.dao import DAO
+from services.export import ExportRequest, write_export
+from services.payment_import import check_payments_csv
+
+
+def paid_at(rnd: random.Random, base: datetime) -> str:
+    at = base + timedelta(seconds=rnd.randint(0, 86400 * 365), microseconds=rnd.randint(0, 999999))
+    kind = rnd.randrange(3)
+    if kind == 0:
+        return at.isoformat()
+    if kind == 1:
+        return at.replace(tzinfo=timezone(timedelta(hours=3))).isoformat()
+    return at.replace(microsecond=0).isoformat()
+
+
+async def payments(dao: DAO) -> list[tuple]:
+    rows = []
+    async for chunk in dao.iter_export("payments"):
+        # Без id: в другой базе он свой; дата — в том виде, в каком её нормализует импорт
+        rows += [(tg_id, type_, amount, datetime.fromisoformat(at).isoformat()) for _, tg_id, type_, amount, at in chunk]
+    return sorted(rows)
+
+
+async def main() -> int:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--payments", type=int, default=5000)
+    args = parser.parse_args()
+    rnd = random.Random(42)
+    base = datetime(2024, 1, 1)
+    rows = list({
+        (rnd.randint(1, args.payments // 5 + 1), rnd.choice(("dues", "vpn")), rnd.randint(100, 1000), paid_at(rnd, base))
+        for _ in range(args.payments)
+    })
+    failures = []
+    with tempfile.TemporaryDirectory() as tmp:
+        source = DAO(os.path.join(tmp, "source.db"), pool_size=1)
+        target = DAO(os.path.join(tmp, "target.db"), pool_size=1)
+        for dao in (source, target):
+            await dao.migrate()
+            await dao.open()
+        try:
+            await source.import_payments(rows)
+            with tempfile.SpooledTemporaryFile(max_size=1 << 20) as out:
+                exported = await write_export(source, ExportRequest("payments"), out)
+                out.seek(0)
+                check = await check_payments_csv(target, out, max_rows=len(rows))
+                if not check.ok:
+                    failures.append(f"импорт выгрузки: {len(check.errors)} ошибок, первые: {check.errors[:5]}")
+                else:
+                    await target.import_payments([(p.tg_id, p.type, p.amount, p.paid_at) for p in check.lines])
+                out.seek(0)
+                again = await check_payments_csv(source, out, max_rows=len(rows))
+            duplicates = sum(1 for _, error in again.errors if error == "такая оплата уже записана")
+            if duplicates != exported:
+                failures.append(f"повторный импорт в исходную базу: дублей {duplicates} из {exported}")
+            expected, actual = await payments(source), await payments(target)
+            if expected != actual:
+                failures.append(f"оплаты не совпали: в исходной {len(expected)}, после импорта {len(actual)}")
+            for dao in (source, target):
+                for type_ in ("dues", "vpn"):
+                    print(f"{os.path.basename(dao.db_path)} {type_}: {await dao.get_total_collected(type_)}")
+        finally:
+            for dao in (source, target):
+                await dao.close()
+    print(f"выгружено и импортировано оплат: {exported}")
+    for failure in failures:
+        print(f"FAIL {failure}")
+    if not failures:
+        print("export roundtrip ok")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
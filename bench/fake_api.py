@@ -0,0 +1,143 @@
+"""Локальная замена Bot API для бенчмарков.
+
+aiohttp-сервер отвечает на /bot<token>/<method> как Telegram: задержка с джиттером,
+доля ошибок 403 (бот заблокирован) и доля 429 с retry_after. Бот подключается через
+TelegramAPIServer.from_base(server.base_url). getUpdates отдаёт апдейты, добавленные через push_updates().
+
+Отдельный запуск: python -m bench.fake_api [--port 8089] [--latency 0.03] [--error-rate 0.01] [--rate-limit-rate 0.001]
+"""
+import argparse
+import asyncio
+import random
+import time
+from collections import Counter
+from dataclasses import dataclass
+from typing import Optional
+
+from aiohttp import web
+
+
+@dataclass
+class FakeApiConfig:
+    latency: float = 0.02
+    jitter: float = 0.01
+    error_rate: float = 0.0
+    rate_limit_rate: float = 0.0
+    retry_after: int = 1
+    seed: int = 42
+
+
+class FakeBotApi:
+    def __init__(self, config: Optional[FakeApiConfig] = None, host: str = "127.0.0.1", port: int = 0):
+        self.config = config or FakeApiConfig()
+        self.host = host
+        self.port = port
+        self.calls: Counter = Counter()
+        self.errors: Counter = Counter()
+        self._rnd = random.Random(self.config.seed)
+        self._message_id = 0
+        self._updates: list[dict] = []
+        self._updates_ready = asyncio.Event()
+        # Момент первой выдачи апдейтов через getUpdates
+        self.first_update_at: Optional[float] = None
+        self._runner: Optional[web.AppRunner] = None
+
+    @property
+    def base_url(self) -> str:
+        return f"http://{self.host}:{self.port}"
+
+    async def start(self) -> "FakeBotApi":
+        app = web.Application()
+        app.router.add_post("/bot{token}/{method}", self._handle)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, self.host, self.port)
+        await site.start()
+        # port=0 — свободный порт выбирает ОС
+        self.port = site._server.sockets[0].getsockname()[1]
+        return self
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+    def push_updates(self, updates: list[dict]):
+        self._updates.extend(updates)
+        self._updates_ready.set()
+
+    async def _get_updates(self, params: dict) -> web.Response:
+        # Long polling как у Telegram: ждём до timeout, если отдавать нечего; offset подтверждает выданное
+        offset = int(params.get("offset") or 0)
+        self._updates = [u for u in self._updates if u["update_id"] >= offset]
+        if not self._updates:
+            self._updates_ready.clear()
+            try:
+                await asyncio.wait_for(self._updates_ready.wait(), min(float(params.get("timeout") or 0), 1.0))
+            except asyncio.TimeoutError:
+                pass
+        batch = self._updates[:int(params.get("limit") or 100)]
+        if batch and self.first_update_at is None:
+            self.first_update_at = time.perf_counter()
+        return web.json_response({"ok": True, "result": batch})
+
+    async def _handle(self, request: web.Request) -> web.Response:
+        method = request.match_info["method"]
+        params = dict(await request.post())
+        self.calls[method] += 1
+        if method == "getUpdates":
+            return await self._get_updates(params)
+        cfg = self.config
+        delay = max(0.0, cfg.latency + self._rnd.uniform(-cfg.jitter, cfg.jitter))
+        if delay:
+            await asyncio.sleep(delay)
+        roll = self._rnd.random()
+        if roll < cfg.rate_limit_rate:
+            self.errors["429"] += 1
+            return web.json_response({
+                "ok": False, "error_code": 429,
+                "description": f"Too Many Requests: retry after {cfg.retry_after}",
+                "parameters": {"retry_after": cfg.retry_after},
+            }, status=429)
+        if roll < cfg.rate_limit_rate + cfg.error_rate and "chat_id" in params:
+            self.errors["403"] += 1
+            return web.json_response({"ok": False, "error_code": 403, "description": "Forbidden: bot was blocked by the user"}, status=403)
+        return web.json_response({"ok": True, "result": self._result(method, params)})
+
+    def _result(self, method: str, params: dict):
+        if method in ("sendMessage", "editMessageText", "sendDocument"):
+            self._message_id += 1
+            chat_id = int(params.get("chat_id") or 1)
+            return {
+                "message_id": self._message_id,
+                "date": int(time.time()),
+                "chat": {"id": chat_id, "type": "private"},
+                "text": params.get("text", ""),
+            }
+        if method == "getMe":
+            return {"id": 123456, "is_bot": True, "first_name": "bench"}
+        return True
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--latency", type=float, default=0.02)
+    parser.add_argument("--jitter", type=float, default=0.01)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0)
+    parser.add_argument("--retry-after", type=int, default=1)
+    args = parser.parse_args()
+    server = await FakeBotApi(
+        FakeApiConfig(args.latency, args.jitter, args.error_rate, args.rate_limit_rate, args.retry_after),
+        port=args.port,
+    ).start()
+    print(f"fake Bot API on {server.base_url}")
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await server.stop()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
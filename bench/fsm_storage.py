@@ -0,0 +1,99 @@
+"""Накладные расходы FSM-хранилища на один переход: MemoryStorage против SQLiteStorage.
+
+Переход — то, что делает шаг админского сценария: get_state, get_data, update_data и set_state
+(как ввод списка ID в AdminCustomAudience). Сравниваются:
+- memory — MemoryStorage aiogram;
+- sqlite write-behind — SQLiteStorage, flush фоновой задачей раз в --flush-interval;
+- sqlite write-through — тот же SQLiteStorage с flush после каждого перехода (для сравнения).
+Отдельно — время flush пакета из N изменённых ключей и загрузки состояний при старте.
+
+Запуск: python -m bench.fsm_storage [--keys 1000] [--transitions 20000] [--flush-interval 1.0]
+"""
+import argparse
+import asyncio
+import os
+import random
+import tempfile
+import time
+
+from aiogram.fsm.storage.base import StorageKey
+from aiogram.fsm.storage.memory import MemoryStorage
+
+from db.dao import DAO
+from services.fsm_storage import SQLiteStorage
+
+STATES = ("AdminCustomAudience:waiting_ids", "AdminCustomAudience:waiting_text_list", None)
+
+
+def storage_keys(n: int) -> list[StorageKey]:
+    return [StorageKey(bot_id=123456, chat_id=10_000_000 + i, user_id=10_000_000 + i) for i in range(n)]
+
+
+async def transitions(storage, keys: list[StorageKey], count: int, seed: int, after=None) -> float:
+    rnd = random.Random(seed)
+    t0 = time.perf_counter()
+    for i in range(count):
+        key = rnd.choice(keys)
+        await storage.get_state(key)
+        await storage.get_data(key)
+        await storage.update_data(key, {"tg_ids": [rnd.randint(1, 10**9) for _ in range(20)]})
+        await storage.set_state(key, STATES[i % len(STATES)])
+        if after is not None:
+            await after()
+        # Как между апдейтами в диспетчере: фоновый flush получает управление
+        await asyncio.sleep(0)
+    return (time.perf_counter() - t0) / count * 1e6
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--keys", type=int, default=1000)
+    parser.add_argument("--transitions", type=int, default=20_000)
+    parser.add_argument("--flush-interval", type=float, default=1.0)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    keys = storage_keys(args.keys)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        dao = DAO(os.path.join(tmp, "fsm.db"), pool_size=2)
+        await dao.migrate()
+        await dao.open()
+        try:
+            memory = await transitions(MemoryStorage(), keys, args.transitions, args.seed)
+
+            storage = SQLiteStorage(dao, flush_interval=args.flush_interval)
+            await storage.start()
+            behind = await transitions(storage, keys, args.transitions, args.seed)
+            await storage.close()
+            flushes = storage.flushes
+
+            through_storage = SQLiteStorage(dao, flush_interval=3600)
+            # Write-through медленный: меньше переходов, результат на один переход сопоставим
+            through_count = max(1, args.transitions // 10)
+            through = await transitions(through_storage, keys, through_count, args.seed, after=through_storage.flush)
+
+            print(f"keys={args.keys} transitions={args.transitions}")
+            print(f"  memory                       {memory:8.1f} us/transition")
+            print(f"  sqlite write-behind          {behind:8.1f} us/transition  (+{behind - memory:.1f} us, {flushes} flushes)")
+            print(f"  sqlite write-through         {through:8.1f} us/transition  ({through_count} transitions)")
+
+            # Стоимость одного flush в зависимости от размера пакета
+            for n in (1, 100, min(args.keys, 1000)):
+                for key in keys[:n]:
+                    await through_storage.set_state(key, STATES[0])
+                t0 = time.perf_counter()
+                await through_storage.flush()
+                print(f"  flush of {n:5d} keys           {(time.perf_counter() - t0) * 1000:8.2f} ms")
+
+            t0 = time.perf_counter()
+            loaded = SQLiteStorage(dao)
+            await loaded.start()
+            elapsed = (time.perf_counter() - t0) * 1000
+            await loaded.close()
+            print(f"  load at startup              {elapsed:8.2f} ms  ({loaded.stats()['states']} states)")
+        finally:
+            await dao.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,96 @@
+"""Конкурентные мелкие записи: commit на каждый вызов против единственного писателя с групповой фиксацией.
+
+--concurrency задач одновременно отмечают напоминания прочитанными (как шторм ack_dues).
+- per-call commit — прежнее поведение: соединение из пула, UPSERT и commit в каждом вызове;
+- writer, batch=1 — через DBWriter, но транзакция на каждую операцию;
+- writer, group commit — DBWriter с окном --delay-ms и пакетом до --batch операций.
+С --synchronous FULL каждый commit — fsync, и разница заметнее.
+
+Запуск: python -m bench.group_commit [--ops 5000] [--concurrency 200] [--batch 100] [--delay-ms 2] [--synchronous NORMAL]
+"""
+import argparse
+import asyncio
+import os
+import random
+import tempfile
+import time
+
+from bench.e2e import percentiles
+from bench.seed import create_seeded
+from db.dao import DAO
+from db.pool import DEFAULT_PRAGMAS
+
+UPSERT = (
+    "INSERT INTO reminders(user_id,type,acknowledged,last_sent_at) VALUES (?,?,?,?) "
+    "ON CONFLICT(user_id, type) DO UPDATE SET acknowledged=excluded.acknowledged, last_sent_at=excluded.last_sent_at"
+)
+
+
+async def per_call_commit(dao: DAO, user_id: int):
+    async with dao.pool.acquire() as db:
+        await db.execute(UPSERT, (user_id, "dues", 1, None))
+        await db.commit()
+
+
+async def via_writer(dao: DAO, user_id: int):
+    await dao.upsert_reminder(user_id=user_id, type_="dues", acknowledged=True, last_sent_at=None)
+
+
+async def run(dao: DAO, fn, ops: int, concurrency: int, users: int, seed: int) -> dict:
+    rnd = random.Random(seed)
+    queue = [rnd.randint(1, users) for _ in range(ops)]
+    samples: list[float] = []
+    errors = 0
+
+    async def worker():
+        nonlocal errors
+        while queue:
+            user_id = queue.pop()
+            t0 = time.perf_counter()
+            try:
+                await fn(dao, user_id)
+            except Exception:
+                errors += 1
+            samples.append(time.perf_counter() - t0)
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - t0
+    return {"throughput": ops / elapsed, "errors": errors, **percentiles(samples), "commits": dao.writer.commits}
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=10_000)
+    parser.add_argument("--ops", type=int, default=5000)
+    parser.add_argument("--concurrency", type=int, default=200)
+    parser.add_argument("--batch", type=int, default=100)
+    parser.add_argument("--delay-ms", type=float, default=2.0)
+    parser.add_argument("--synchronous", default="NORMAL")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    pragmas = {**DEFAULT_PRAGMAS, "synchronous": args.synchronous}
+    variants = (
+        ("per-call commit", per_call_commit, 1, 0.0),
+        ("writer, batch=1", via_writer, 1, 0.0),
+        (f"writer, group commit ({args.batch}/{args.delay_ms:g}ms)", via_writer, args.batch, args.delay_ms),
+    )
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "group.db")
+        await create_seeded(db_path, args.users)
+        print(f"ops={args.ops} concurrency={args.concurrency} synchronous={args.synchronous}")
+        for name, fn, batch, delay in variants:
+            dao = DAO(db_path, pool_size=4, pragmas=pragmas, write_batch=batch, write_delay_ms=delay)
+            await dao.open()
+            try:
+                r = await run(dao, fn, args.ops, args.concurrency, args.users, args.seed)
+            finally:
+                await dao.close()
+            print(
+                f"  {name:<36} {r['throughput']:8.0f} ops/s  p50 {r['p50_ms']:7.1f}ms  p95 {r['p95_ms']:7.1f}ms  "
+                f"p99 {r['p99_ms']:7.1f}ms  commits {r['commits'] or '-'}  errors {r['errors']}"
+            )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
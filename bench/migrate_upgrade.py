@@ -0,0 +1,133 @@
+"""Проверка обновления схемы с базы из репозитория (bzkbot.db, схема до версионирования).
+
+Копирует базу во временный каталог и прогоняет DAO.migrate(): применяются все шаги,
+schema_version = последней миграции, на месте ожидаемые таблицы, колонки и индексы,
+данные не потеряны (число строк, итоги оплат, счётчики строк), а повторный запуск
+ничего не применяет. Исходный файл не меняется. Код возврата 1 при нарушении.
+
+Запуск: python -m bench.migrate_upgrade [--db bzkbot.db]
+"""
+import argparse
+import asyncio
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+
+from db.dao import DAO
+from db.migrations import MIGRATIONS
+
+EXPECTED_COLUMNS: dict[str, set[str]] = {
+    "users": {
+        "id", "tg_id", "is_active", "allow_dues_notifications", "allow_vpn_notifications",
+        "show_status", "show_dues", "show_vpn", "show_savings", "unreachable_at",
+    },
+    "payments": {"id", "user_id", "type", "amount", "paid_at"},
+    "reminders": {"id", "user_id", "type", "last_sent_at", "acknowledged"},
+    "settings": {"key", "value"},
+    # text переехал в notification_batches (миграция 7)
+    "custom_notifications": {"id", "user_id", "sent_at", "acknowledged", "batch_id", "state", "attempts", "last_error", "message_id", "next_attempt_at"},
+    "notification_batches": {"id", "text", "author_id", "created_at"},
+    "payment_totals": {"type", "total", "count"},
+    "row_counts": {"name", "n"},
+    "fsm_states": {"key", "state", "data", "updated_at"},
+    "cache_invalidations": set(),
+    "schema_version": {"version", "name", "applied_at"},
+}
+EXPECTED_INDEXES = {
+    "ux_reminders_user_type", "ix_users_active", "ix_payments_type_amount", "ix_custom_batch_ack",
+    "ix_custom_pending", "ix_batches_created", "idx_fsm_states_updated", "ix_users_reachable", "ix_payments_user",
+}
+# Таблицы исходной схемы: строки должны пережить миграции
+DATA_TABLES = ("users", "payments", "reminders", "settings")
+
+
+def columns(c: sqlite3.Connection, table: str) -> set[str]:
+    return {r[1] for r in c.execute(f"PRAGMA table_info({table})")}
+
+
+def counts(c: sqlite3.Connection) -> dict[str, int]:
+    return {t: c.execute(f"SELECT COUNT(*) FROM {t}").fetchone()[0] for t in DATA_TABLES}
+
+
+def check_schema(db_path: str, before: dict[str, int]) -> list[str]:
+    failures = []
+    c = sqlite3.connect(db_path)
+    try:
+        version = c.execute("SELECT MAX(version) FROM schema_version").fetchone()[0]
+        if version != MIGRATIONS[-1][0]:
+            failures.append(f"schema_version {version}, ожидалась {MIGRATIONS[-1][0]}")
+        tables = {r[0] for r in c.execute("SELECT name FROM sqlite_master WHERE type='table'")}
+        for table, expected in EXPECTED_COLUMNS.items():
+            if table not in tables:
+                failures.append(f"нет таблицы {table}")
+                continue
+            actual = columns(c, table)
+            if expected - actual:
+                failures.append(f"{table}: нет колонок {sorted(expected - actual)}")
+            if table == "custom_notifications" and "text" in actual:
+                failures.append("custom_notifications.text не удалена")
+        indexes = {r[0] for r in c.execute("SELECT name FROM sqlite_master WHERE type='index'")}
+        if EXPECTED_INDEXES - indexes:
+            failures.append(f"нет индексов {sorted(EXPECTED_INDEXES - indexes)}")
+        after = counts(c)
+        if after != before:
+            failures.append(f"число строк изменилось: было {before}, стало {after}")
+        totals = dict(c.execute("SELECT type, total FROM payment_totals"))
+        sums = dict(c.execute("SELECT type, SUM(amount) FROM payments GROUP BY type"))
+        for type_, total in totals.items():
+            if total != sums.get(type_, 0):
+                failures.append(f"payment_totals[{type_}]={total}, по payments {sums.get(type_, 0)}")
+        n_users = c.execute("SELECT n FROM row_counts WHERE name='users'").fetchone()
+        if n_users is None or n_users[0] != before["users"]:
+            failures.append(f"row_counts[users]={n_users}, пользователей {before['users']}")
+        integrity = c.execute("PRAGMA integrity_check").fetchone()[0]
+        if integrity != "ok":
+            failures.append(f"integrity_check: {integrity}")
+    finally:
+        c.close()
+    return failures
+
+
+async def main() -> int:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--db", default=os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "bzkbot.db"))
+    args = parser.parse_args()
+    failures = []
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "upgrade.db")
+        shutil.copyfile(args.db, db_path)
+        c = sqlite3.connect(db_path)
+        before = counts(c)
+        c.close()
+        print(f"{os.path.basename(args.db)}: {before}")
+        applied = await DAO(db_path).migrate()
+        print(f"applied: {applied}")
+        if applied != [step for step, _, _ in MIGRATIONS]:
+            failures.append(f"применены шаги {applied}, ожидались все {[step for step, _, _ in MIGRATIONS]}")
+        failures += check_schema(db_path, before)
+        again = await DAO(db_path).migrate()
+        if again != []:
+            failures.append(f"повторный запуск применил {again}")
+        dao = DAO(db_path, pool_size=1)
+        await dao.open()
+        try:
+            # Бот поднимается на обновлённой базе и читает её
+            await dao.load_settings()
+            if await dao.total_users() != before["users"]:
+                failures.append("total_users не совпадает с числом пользователей")
+            drift = await dao.check_payment_totals()
+            if drift:
+                failures.append(f"check_payment_totals: {drift}")
+        finally:
+            await dao.close()
+    for failure in failures:
+        print(f"FAIL {failure}")
+    if not failures:
+        print("migrations ok")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
@@ -0,0 +1,104 @@
+"""Проверка: временный сбой доставки outbox повторяется с задержкой, а не в том же цикле.
+
+Outbox с ботом-заглушкой, у которого send_message падает с TelegramNetworkError, пока сбой
+не снят. Повторов внутри FanOutSender нет (max_retries=0), поэтому каждая ошибка доходит до
+record_outbox_results. Проверяется, что:
+- после неудачи строка остаётся pending с attempts=1 и в ближайшем проходе не выбирается;
+- цикл OutboxWorker не расходует на сбой оставшиеся попытки (раньше строка уходила в failed
+  за миллисекунды);
+- после OUTBOX_RETRY_DELAY уведомление доставляется со второй попытки;
+- задержка удваивается, requeue_unacked её сбрасывает.
+Код возврата 1 при нарушении.
+
+Запуск: python -m bench.outbox_retry
+"""
+import asyncio
+import os
+import sys
+import tempfile
+import time
+from types import SimpleNamespace
+
+from aiogram.exceptions import TelegramNetworkError
+
+from db.dao import DAO
+from services.delivery import FanOutSender
+from services.outbox import OutboxWorker
+
+RETRY_DELAY = 0.5
+
+
+class FlakyBot:
+    def __init__(self):
+        self.failing = True
+        self.calls = 0
+
+    async def send_message(self, chat_id, text, reply_markup=None):
+        self.calls += 1
+        if self.failing:
+            raise TelegramNetworkError(method=None, message="connection reset")
+        return SimpleNamespace(message_id=1000 + self.calls)
+
+
+async def row(dao: DAO, notif_id: int) -> dict:
+    async with dao._conn() as db:
+        cur = await db.execute("SELECT state, attempts, next_attempt_at FROM custom_notifications WHERE id=?", (notif_id,))
+        return dict(await cur.fetchone())
+
+
+async def main() -> int:
+    failures = []
+
+    def expect(ok: bool, message: str):
+        print(f"{'ok  ' if ok else 'FAIL'} {message}")
+        if not ok:
+            failures.append(message)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        dao = DAO(os.path.join(tmp, "outbox.db"), pool_size=1)
+        await dao.migrate()
+        await dao.open()
+        bot = FlakyBot()
+        worker = OutboxWorker(bot, dao, FanOutSender(rate=1000, per_chat_interval=0, max_retries=0), poll_interval=0.05, max_attempts=3, retry_delay=RETRY_DELAY)
+        try:
+            batch_id = "r" * 32
+            [(_, notif_id)] = await dao.create_custom_notifications_batch("text", [42], "2024-01-01", batch_id)
+
+            started = time.time()
+            expect(await worker.drain_once() == 1, "первая попытка выбрана")
+            state = await row(dao, notif_id)
+            expect(state["state"] == "pending" and state["attempts"] == 1, f"после сбоя pending, attempts=1: {state}")
+            expect(state["next_attempt_at"] >= started + RETRY_DELAY, "следующая попытка не раньше retry_delay")
+            expect(await worker.drain_once() == 0, "в том же цикле строка не выбирается повторно")
+
+            # Цикл воркера крутится, пока сбой не снят: попытки не должны сгореть
+            worker.start()
+            await asyncio.sleep(RETRY_DELAY / 2)
+            await worker.stop()
+            state = await row(dao, notif_id)
+            expect(state["attempts"] == 1 and bot.calls == 1, f"цикл до срока не повторял: attempts={state['attempts']}, вызовов {bot.calls}")
+
+            # Вторая неудача — задержка вдвое больше
+            await asyncio.sleep(max(0.0, state["next_attempt_at"] - time.time()))
+            second = time.time()
+            expect(await worker.drain_once() == 1, "после задержки строка выбрана снова")
+            state = await row(dao, notif_id)
+            expect(state["attempts"] == 2 and state["next_attempt_at"] >= second + 2 * RETRY_DELAY, f"задержка удвоилась: {state}")
+
+            # requeue_unacked возвращает в очередь без задержки; сбой снят — доставка
+            await dao.record_outbox_results([(notif_id, None, "still failing")], max_attempts=3, retry_delay=RETRY_DELAY)
+            expect((await row(dao, notif_id))["state"] == "failed", "после max_attempts — failed")
+            await dao.requeue_unacked(batch_id)
+            bot.failing = False
+            expect(await worker.drain_once() == 1, "requeue сбрасывает задержку")
+            state = await row(dao, notif_id)
+            expect(state["state"] == "sent", f"доставлено после снятия сбоя: {state}")
+        finally:
+            await worker.stop()
+            await dao.close()
+    print(f"{len(failures)} failure(s)" if failures else "outbox retry ok")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
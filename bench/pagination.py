@@ -0,0 +1,101 @@
+"""Перелистывание админских списков: LIMIT/OFFSET + COUNT(*) против keyset-курсора.
+
+Замеряет время одной страницы (запрос строк + счётчик) на первой, средней и
+последней странице списка пользователей и истории батчей.
+
+Запуск: python -m bench.pagination [--users 100000] [--batches 10000]
+"""
+import argparse
+import asyncio
+import os
+import sqlite3
+import tempfile
+import time
+
+from db.dao import DAO
+
+PAGE_SIZE = 10
+ROUNDS = 50
+
+
+def seed(db_path: str, users: int, batches: int):
+    c = sqlite3.connect(db_path)
+    c.executemany("INSERT INTO users(tg_id, is_active) VALUES (?, 1)", ((10_000_000 + i,) for i in range(users)))
+    c.executemany(
+        "INSERT INTO notification_batches(id,text,created_at) VALUES (?,?,?)",
+        ((f"{i:032x}", f"text {i}", f"2024-01-01T{i // 3600 % 24:02d}:{i // 60 % 60:02d}:{i % 60:02d}.{i:06d}") for i in range(batches)),
+    )
+    c.execute("ANALYZE")
+    c.commit()
+    c.close()
+
+
+async def offset_users(dao: DAO, page: int):
+    # Прежняя реализация: COUNT(*) на каждое перелистывание и OFFSET до нужной страницы
+    async with dao._conn() as db:
+        await (await db.execute("SELECT COUNT(*) FROM users")).fetchone()
+        cur = await db.execute("SELECT * FROM users ORDER BY id LIMIT ? OFFSET ?", (PAGE_SIZE, (page - 1) * PAGE_SIZE))
+        await cur.fetchall()
+
+
+async def offset_batches(dao: DAO, page: int):
+    async with dao._conn() as db:
+        await (await db.execute("SELECT COUNT(*) FROM notification_batches")).fetchone()
+        cur = await db.execute(
+            "SELECT * FROM notification_batches ORDER BY created_at DESC LIMIT ? OFFSET ?",
+            (PAGE_SIZE, (page - 1) * PAGE_SIZE)
+        )
+        await cur.fetchall()
+
+
+async def timed(fn, *args) -> float:
+    t0 = time.perf_counter()
+    for _ in range(ROUNDS):
+        await fn(*args)
+    return (time.perf_counter() - t0) / ROUNDS * 1000
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=100_000)
+    parser.add_argument("--batches", type=int, default=10_000)
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "pages.db")
+        dao = DAO(db_path, pool_size=1)
+        await dao.migrate()
+        seed(db_path, args.users, args.batches)
+        await dao.open()
+        try:
+            # Курсор страницы N — ключ последней строки страницы N-1; берём его из базы напрямую
+            async with dao._conn() as db:
+                batch_seqs = [
+                    r[0] for r in await (await db.execute(
+                        "SELECT rowid FROM notification_batches ORDER BY created_at DESC, rowid DESC"
+                    )).fetchall()
+                ]
+
+            async def keyset_users(page: int):
+                await dao.total_users()
+                await dao.users_page(PAGE_SIZE + 1, after=(page - 1) * PAGE_SIZE)
+
+            async def keyset_batches(page: int):
+                await dao.count_batches()
+                after = batch_seqs[(page - 1) * PAGE_SIZE - 1] if page > 1 else None
+                await dao.list_batches(PAGE_SIZE + 1, after=after)
+
+            for name, total, old, new in (
+                ("users", args.users, offset_users, keyset_users),
+                ("batches", args.batches, offset_batches, keyset_batches),
+            ):
+                last = max(1, total // PAGE_SIZE)
+                for label, page in (("first", 1), ("middle", last // 2), ("last", last)):
+                    o = await timed(old, dao, page)
+                    k = await timed(new, page)
+                    print(f"{name:<8} {label:<6} page={page:<6} offset={o:8.3f}ms keyset={k:7.3f}ms")
+        finally:
+            await dao.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,190 @@
+"""Регрессия планов запросов: EXPLAIN QUERY PLAN для каждого запроса DAO.
+
+Создаёт базу на --users пользователей, вызывает методы DAO, перехватывает
+выполненный SQL и проверяет, что ни один запрос не читает таблицу целиком
+(`SCAN <table>` без индекса). Код возврата 1 при нарушении.
+
+Запуск: python -m bench.query_plans [--users 100000] [-v]
+"""
+import argparse
+import asyncio
+import os
+import random
+import re
+import sqlite3
+import sys
+import tempfile
+
+from db.dao import DAO
+
+# Полный проход допустим только там, где он ограничен по смыслу запроса.
+# Ключ — метод DAO, значение — причина.
+ALLOWED_SCANS: dict[str, str] = {
+    "load_settings": "снимок всей settings (десяток строк) один раз при старте",
+}
+
+# Сценарии без SQL: отвечают из памяти. Любой другой сценарий без перехваченного SQL — ошибка
+# (значит, запрос ушёл мимо трассировки и не проверен)
+NO_SQL: dict[str, str] = {
+    "get_savings": "снимок settings в памяти",
+    "get_vpn_amount": "снимок settings в памяти",
+    "get_dues_amount": "снимок settings в памяти",
+    "get_schedule_time": "снимок settings в памяти",
+}
+
+# Таблицы фиксированного размера: полный проход дешевле индекса
+SMALL_TABLES: dict[str, str] = {
+    "payment_totals": "по строке на тип оплаты",
+}
+
+SQL = re.compile(r"\s*(SELECT|INSERT|UPDATE|DELETE|WITH)", re.I)
+FULL_SCAN = re.compile(r"\bSCAN (?!CONSTANT ROW)(\w+)\b(?! USING (?:COVERING )?INDEX| USING INTEGER PRIMARY KEY| VIRTUAL TABLE)")
+
+
+def seed(db_path: str, users: int):
+    rnd = random.Random(42)
+    c = sqlite3.connect(db_path)
+    c.executemany(
+        "INSERT INTO users(tg_id, is_active, allow_dues_notifications, allow_vpn_notifications) VALUES (?,?,?,?)",
+        ((10_000_000 + i, int(rnd.random() < 0.9), int(rnd.random() < 0.8), int(rnd.random() < 0.8)) for i in range(users)),
+    )
+    c.executemany(
+        "INSERT INTO payments(user_id,type,amount,paid_at) VALUES (?,?,?,?)",
+        ((rnd.randint(1, users), rnd.choice(("dues", "vpn")), rnd.randint(100, 1000), "2024-01-01T00:00:00") for _ in range(users)),
+    )
+    c.executemany(
+        "INSERT INTO reminders(user_id,type,acknowledged,last_sent_at) VALUES (?,?,?,?)",
+        ((uid, t, int(rnd.random() < 0.5), "2024-01-01T09:00:00") for uid in range(1, users + 1, 2) for t in ("dues", "vpn")),
+    )
+    batches = [f"{i:032x}" for i in range(max(1, users // 1000))]
+    c.executemany(
+        "INSERT INTO notification_batches(id,text,created_at) VALUES (?,?,?)",
+        ((b, f"text {b}", f"2024-01-01T10:{i % 60:02d}:00") for i, b in enumerate(batches)),
+    )
+    c.executemany(
+        "INSERT INTO custom_notifications(user_id,sent_at,acknowledged,batch_id,state) VALUES (?,?,?,?,'sent')",
+        ((rnd.randint(1, users), "2024-01-01T10:00:00", int(rnd.random() < 0.5), b) for b in batches for _ in range(100)),
+    )
+    c.execute("ANALYZE")
+    c.commit()
+    c.close()
+    return batches
+
+
+def scenarios(dao: DAO, users: int, batch_id: str):
+    tg = 10_000_000 + users // 2
+    return [
+        ("ping", lambda: dao.ping()),
+        ("get_or_create_user", lambda: dao.get_or_create_user(tg)),
+        ("activate_user", lambda: dao.activate_user(tg)),
+        ("mark_unreachable", lambda: dao.mark_unreachable([tg + 2, tg + 3], "2024-01-02")),
+        ("mark_reachable", lambda: dao.mark_reachable(tg + 2)),
+        ("set_notifications", lambda: dao.set_notifications(5, dues=True, vpn=False)),
+        ("set_show_status", lambda: dao.set_show_status(5, True)),
+        ("get_show_status", lambda: dao.get_show_status(5)),
+        ("get_component_visibility", lambda: dao.get_component_visibility(5)),
+        ("toggle_component", lambda: dao.toggle_component(5, "dues")),
+        ("get_user_row", lambda: dao.get_user_row(5)),
+        ("total_users", lambda: dao.total_users()),
+        ("users_page", lambda: dao.users_page(11, after=users // 2)),
+        ("users_page_before", lambda: dao.users_page(11, before=users // 2)),
+        ("active_user_ids", lambda: dao.active_user_ids()),
+        ("active_users_chunk", lambda: dao.active_users_chunk(users // 2, 500)),
+        ("tg_to_internal_map", lambda: dao.tg_to_internal_map([tg, tg + 1])),
+        ("create_custom_notifications", lambda: dao.create_custom_notifications("x", [tg], "2024-01-02")),
+        ("create_custom_notifications_batch", lambda: dao.create_custom_notifications_batch("x", [tg, 1], "2024-01-02", "b" * 32)),
+        ("acknowledge_custom", lambda: dao.acknowledge_custom(5, 10)),
+        ("get_custom_notif", lambda: dao.get_custom_notif(10)),
+        ("list_batches", lambda: dao.list_batches(6)),
+        ("list_batches_after", lambda: dao.list_batches(6, after=3)),
+        ("list_batches_before", lambda: dao.list_batches(6, before=3)),
+        ("get_batch", lambda: dao.get_batch(batch_id)),
+        ("count_batches", lambda: dao.count_batches()),
+        ("unacked_in_batch", lambda: dao.unacked_in_batch(batch_id)),
+        ("fetch_outbox", lambda: dao.fetch_outbox(50)),
+        ("record_outbox_results", lambda: dao.record_outbox_results([(10, 1, None), (11, None, "err")], 3)),
+        ("batch_progress", lambda: dao.batch_progress(batch_id)),
+        ("requeue_unacked", lambda: dao.requeue_unacked(batch_id)),
+        ("record_payment", lambda: dao.record_payment(5, "dues", 500, "2024-01-02")),
+        ("preview_payment_import", lambda: dao.preview_payment_import([(tg, "dues", 500, "2024-01-01T00:00:00"), (1, "vpn", 250, "2024-01-02")])),
+        ("import_payments", lambda: dao.import_payments([(tg, "dues", 500, "2024-01-03"), (2, "vpn", 250, "2024-01-03")])),
+        ("get_total_collected", lambda: dao.get_total_collected("dues")),
+        ("get_total_collected_all", lambda: dao.get_total_collected()),
+        ("check_payment_totals", lambda: dao.check_payment_totals()),
+        ("set_savings", lambda: dao.set_savings(100)),
+        ("get_savings", lambda: dao.get_savings()),
+        ("set_vpn_amount", lambda: dao.set_vpn_amount(100)),
+        ("get_vpn_amount", lambda: dao.get_vpn_amount()),
+        ("set_dues_amount", lambda: dao.set_dues_amount(500)),
+        ("get_dues_amount", lambda: dao.get_dues_amount()),
+        ("upsert_reminder", lambda: dao.upsert_reminder(5, "dues", True, None)),
+        ("record_reminders", lambda: dao.record_reminders([(5, "vpn", False, "2024-01-02"), (7, "dues", False, "2024-01-02")])),
+        ("users_for_reminder", lambda: dao.users_for_reminder("dues")),
+        ("users_for_reminder_chunk", lambda: dao.users_for_reminder_chunk("dues", users // 2, 500)),
+        ("users_for_reminder_chunk_slot", lambda: dao.users_for_reminder_chunk("dues", users // 2, 500, slot=3, slots=12)),
+        ("load_settings", lambda: dao.load_settings()),
+        ("get_schedule_time", lambda: dao.get_schedule_time()),
+        ("set_schedule_time", lambda: dao.set_schedule_time(9, 30, 60)),
+        ("export_chunk_payments", lambda: dao.export_chunk("payments", users // 2, 500, "2024-01-01", "2024-02-01", "dues")),
+        ("export_chunk_reminders", lambda: dao.export_chunk("reminders", 0, 500, type_="vpn")),
+        ("export_chunk_notifications", lambda: dao.export_chunk("notifications", 0, 500, "2024-01-01", None, "sent")),
+    ]
+
+
+def explain(db_path: str, sql: str) -> list[str]:
+    c = sqlite3.connect(db_path)
+    try:
+        return [r[3] for r in c.execute("EXPLAIN QUERY PLAN " + sql)]
+    finally:
+        c.close()
+
+
+async def main() -> int:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=100_000)
+    parser.add_argument("-v", "--verbose", action="store_true")
+    args = parser.parse_args()
+    failures = 0
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "plans.db")
+        dao = DAO(db_path, pool_size=1)
+        await dao.migrate()
+        batches = seed(db_path, args.users)
+        await dao.open()
+        captured: list[str] = []
+        try:
+            async with dao._conn() as db:
+                await db.set_trace_callback(captured.append)
+            # Изменения идут через отдельное соединение писателя
+            await dao.writer.set_trace_callback(captured.append)
+            for name, call in scenarios(dao, args.users, batches[0]):
+                captured.clear()
+                await call()
+                if not any(SQL.match(sql) for sql in captured) and name not in NO_SQL:
+                    failures += 1
+                    print(f"FAIL {name}: SQL не перехвачен")
+                seen = set()
+                for sql in captured:
+                    if sql in seen or not SQL.match(sql):
+                        continue
+                    seen.add(sql)
+                    plan = explain(db_path, sql)
+                    scans = [
+                        line for line in plan
+                        if (m := FULL_SCAN.search(line)) and m.group(1) not in SMALL_TABLES
+                    ]
+                    if scans and name not in ALLOWED_SCANS:
+                        failures += 1
+                        print(f"FAIL {name}: {sql[:160]}")
+                        for line in plan:
+                            print(f"    {line}")
+                    elif args.verbose:
+                        print(f"ok   {name}: {' | '.join(plan) or '-'}")
+        finally:
+            await dao.close()
+    print(f"{failures} failure(s)" if failures else "query plans ok")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
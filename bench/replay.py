@@ -0,0 +1,263 @@
+"""Генератор нагрузки: синтетический поток апдейтов через dp.feed_update.
+
+Поток смешивает /start и кодовую фразу от новых пользователей, нажатия «Мой статус»,
+админские FSM-сценарии (сбережения, рассылка по списку ID) и — после прогона
+send_daily_reminders — шторм нажатий «Уведомление прочитано» (ack_dues).
+Апдейты запускаются задачами по расписанию с заданной частотой (как в polling с handle_as_tasks),
+латентность считается от запланированного момента, чтобы очередь не скрывала задержки.
+Bot API — локальный bench.fake_api.
+
+Запуск: python -m bench.replay [--users 10000] [--rate 100] [--duration 10] [--storm-rate 500] [--storm-duration 10] [--json out.json]
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import logging
+import os
+import random
+import tempfile
+import time
+from collections import defaultdict
+from typing import Any, Awaitable, Callable, Dict
+
+from bench.e2e import BOT_TOKEN, percentiles
+from bench.fake_api import FakeApiConfig, FakeBotApi
+from bench.seed import create_seeded
+
+ADMIN_IDS = [1, 2, 3, 4, 5]
+ACCESS_PHRASE = "bench"
+NEW_USER_BASE = 50_000_000
+
+# Доли сценариев в обычном потоке
+MIX = (
+    ("menu_status", 0.55),
+    ("new_user", 0.15),
+    ("wrong_phrase", 0.05),
+    ("ack_dues", 0.15),
+    ("admin_flow", 0.10),
+)
+
+
+class Recorder:
+    def __init__(self):
+        self.scenarios: dict[str, list[float]] = defaultdict(list)
+        self.scenario_errors: dict[str, int] = defaultdict(int)
+        self.handlers: dict[str, list[float]] = defaultdict(list)
+        self.handler_errors: dict[str, int] = defaultdict(int)
+
+    def middleware(self, event: str):
+        # Внутренний middleware: точные латентности по имени хэндлера
+        async def record(handler: Callable[[Any, Dict[str, Any]], Awaitable[Any]], update, data: Dict[str, Any]):
+            name = f"{event}:{getattr(getattr(data.get('handler'), 'callback', None), '__name__', 'unknown')}"
+            started = time.perf_counter()
+            try:
+                return await handler(update, data)
+            except Exception:
+                self.handler_errors[name] += 1
+                raise
+            finally:
+                self.handlers[name].append(time.perf_counter() - started)
+        return record
+
+    def report(self) -> dict:
+        def table(samples: dict, errors: dict) -> dict:
+            return {
+                name: {"count": len(v), "errors": errors.get(name, 0), **percentiles(v), "max_ms": max(v) * 1000}
+                for name, v in sorted(samples.items()) if v
+            }
+        return {
+            "scenarios": table(self.scenarios, self.scenario_errors),
+            "handlers": table(self.handlers, self.handler_errors),
+        }
+
+
+class UpdateFactory:
+    def __init__(self):
+        self._ids = itertools.count(1)
+
+    def _user(self, tg_id: int) -> dict:
+        return {"id": tg_id, "is_bot": False, "first_name": "load"}
+
+    def message(self, tg_id: int, text: str):
+        from aiogram.types import Update
+        return Update.model_validate({
+            "update_id": next(self._ids),
+            "message": {
+                "message_id": next(self._ids), "date": int(time.time()), "text": text,
+                "chat": {"id": tg_id, "type": "private"}, "from": self._user(tg_id),
+            },
+        })
+
+    def callback(self, tg_id: int, data: str):
+        from aiogram.types import Update
+        return Update.model_validate({
+            "update_id": next(self._ids),
+            "callback_query": {
+                "id": str(next(self._ids)), "chat_instance": "load", "data": data, "from": self._user(tg_id),
+                "message": {
+                    "message_id": 1, "date": 0, "text": "load",
+                    "chat": {"id": tg_id, "type": "private"},
+                    "from": {"id": 123456, "is_bot": True, "first_name": "bench"},
+                },
+            },
+        })
+
+
+async def run(args) -> dict:
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "replay.db")
+        await create_seeded(db_path, args.users)
+        os.environ.update({
+            "BOT_TOKEN": BOT_TOKEN,
+            "ACCESS_PHRASE": ACCESS_PHRASE,
+            "ADMIN_IDS": ",".join(str(a) for a in ADMIN_IDS),
+            "DB_PATH": db_path,
+            "METRICS_PORT": "0",
+            "DB_SLOW_QUERY_MS": "1000000",
+        })
+        import main
+        # Отказы в доступе и прочие предупреждения хэндлеров в нагрузочном прогоне — шум
+        logging.disable(logging.WARNING)
+        from aiogram import Bot
+        from aiogram.client.session.aiohttp import AiohttpSession
+        from aiogram.client.telegram import TelegramAPIServer
+        from aiogram.methods import TelegramMethod
+        from services.delivery import FanOutSender
+        from services.fsm_storage import SQLiteStorage
+        from services.reminders import send_daily_reminders
+
+        recorder = Recorder()
+        main.dp.message.middleware(recorder.middleware("message"))
+        main.dp.callback_query.middleware(recorder.middleware("callback_query"))
+        api = await FakeBotApi(FakeApiConfig(latency=args.latency, jitter=args.latency / 2, error_rate=args.error_rate)).start()
+        bot = Bot(BOT_TOKEN, session=AiohttpSession(api=TelegramAPIServer.from_base(api.base_url)))
+        dao = main.dao
+        await dao.migrate()
+        await dao.open()
+        if isinstance(main.fsm_storage, SQLiteStorage):
+            await main.fsm_storage.start()
+        for admin in ADMIN_IDS:
+            await dao.activate_user(admin)
+        active = await dao.active_user_ids()
+        rnd = random.Random(args.seed)
+        updates = UpdateFactory()
+        new_users = itertools.count(NEW_USER_BASE)
+        idle_admins = list(ADMIN_IDS)
+
+        async def feed(update):
+            response = await main.dp.feed_update(bot, update)
+            # Метод, возвращённый хэндлером, выполняется как в polling
+            if isinstance(response, TelegramMethod):
+                await bot(response)
+
+        async def admin_flow(admin: int):
+            if rnd.random() < 0.5:
+                await feed(updates.callback(admin, "admin_savings"))
+                await asyncio.sleep(args.think_time)
+                await feed(updates.message(admin, str(rnd.randint(1000, 100000))))
+            else:
+                ids = " ".join(str(rnd.choice(active)) for _ in range(20))
+                await feed(updates.callback(admin, "admin_custom_notification"))
+                await feed(updates.callback(admin, "custom_audience_list"))
+                await asyncio.sleep(args.think_time)
+                await feed(updates.message(admin, ids))
+                await asyncio.sleep(args.think_time)
+                await feed(updates.message(admin, "load test notice"))
+
+        async def scenario(kind: str):
+            if kind == "menu_status":
+                await feed(updates.callback(rnd.choice(active), "menu_status"))
+            elif kind in ("ack_dues", "ack_storm"):
+                await feed(updates.callback(rnd.choice(active), "ack_dues"))
+            elif kind in ("new_user", "wrong_phrase"):
+                tg_id = next(new_users)
+                await feed(updates.message(tg_id, "/start"))
+                await asyncio.sleep(args.think_time)
+                await feed(updates.message(tg_id, ACCESS_PHRASE if kind == "new_user" else "wrong phrase"))
+            elif kind == "admin_flow":
+                if not idle_admins:
+                    # Все админы в сценарии — вместо FSM-потока обычное нажатие
+                    return await scenario("menu_status")
+                admin = idle_admins.pop()
+                try:
+                    await admin_flow(admin)
+                finally:
+                    idle_admins.append(admin)
+
+        async def timed(kind: str, scheduled: float):
+            try:
+                await scenario(kind)
+            except Exception:
+                recorder.scenario_errors[kind] += 1
+            recorder.scenarios[kind].append(time.perf_counter() - scheduled)
+
+        async def drive(rate: float, duration: float, pick: Callable[[], str]) -> float:
+            tasks = []
+            start = time.perf_counter()
+            for i in range(int(rate * duration)):
+                scheduled = start + i / rate
+                delay = scheduled - time.perf_counter()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                tasks.append(asyncio.create_task(timed(pick(), scheduled)))
+            await asyncio.gather(*tasks)
+            return len(tasks) / (time.perf_counter() - start)
+
+        kinds, weights = zip(*MIX)
+        result: dict = {"users": args.users}
+        try:
+            achieved = await drive(args.rate, args.duration, lambda: rnd.choices(kinds, weights)[0])
+            result["steady"] = {"target_rate": args.rate, "achieved_rate": achieved}
+            if args.storm_duration > 0:
+                sender = FanOutSender(rate=args.send_rate, concurrency=100, per_chat_interval=0)
+                summary = await send_daily_reminders(bot, dao, "Europe/Moscow", 500, 250, sender=sender)
+                result["reminders"] = {"sent": summary.sent, "wall_s": summary.wall_time}
+                achieved = await drive(args.storm_rate, args.storm_duration, lambda: "ack_storm")
+                result["storm"] = {"target_rate": args.storm_rate, "achieved_rate": achieved}
+        finally:
+            await main.fsm_storage.close()
+            await dao.close()
+            await bot.session.close()
+            await api.stop()
+        result.update(recorder.report())
+        return result
+
+
+def print_table(title: str, rows: dict):
+    print(title)
+    for name, r in rows.items():
+        print(
+            f"  {name:<48} n={r['count']:<6} err={r['errors']:<4} "
+            f"p50={r['p50_ms']:7.1f}ms p95={r['p95_ms']:7.1f}ms p99={r['p99_ms']:7.1f}ms max={r['max_ms']:7.1f}ms"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=10_000)
+    parser.add_argument("--rate", type=float, default=100, help="апдейтов/с в обычном потоке")
+    parser.add_argument("--duration", type=float, default=10)
+    parser.add_argument("--storm-rate", type=float, default=500, help="ack_dues/с после рассылки напоминаний")
+    parser.add_argument("--storm-duration", type=float, default=10)
+    parser.add_argument("--think-time", type=float, default=0.2, help="пауза между шагами сценария, с")
+    parser.add_argument("--latency", type=float, default=0.03, help="задержка фейкового Bot API, с")
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--send-rate", type=float, default=5000)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--json")
+    args = parser.parse_args()
+    result = asyncio.run(run(args))
+    print(f"users={result['users']}")
+    for phase in ("steady", "storm"):
+        if phase in result:
+            print(f"{phase}: target {result[phase]['target_rate']:.0f}/s, achieved {result[phase]['achieved_rate']:.0f}/s")
+    print_table("scenarios (от запланированного момента):", result["scenarios"])
+    print_table("handlers:", result["handlers"])
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
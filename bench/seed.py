@@ -0,0 +1,52 @@
+"""Наполнение базы для бенчмарков: пользователи и оплаты.
+
+Запуск: python -m bench.seed out.db [--users 10000]
+"""
+import argparse
+import asyncio
+import random
+import sqlite3
+
+from db.dao import DAO
+
+TG_ID_BASE = 10_000_000
+
+
+async def create_schema(db_path: str):
+    dao = DAO(db_path, pool_size=1)
+    await dao.migrate()
+
+
+def seed(db_path: str, users: int, seed_value: int = 42):
+    # 90% активных, по 80% с включёнными напоминаниями каждого типа, ~1 оплата на пользователя
+    rnd = random.Random(seed_value)
+    c = sqlite3.connect(db_path)
+    c.executemany(
+        "INSERT INTO users(tg_id, is_active, allow_dues_notifications, allow_vpn_notifications) VALUES (?,?,?,?)",
+        ((TG_ID_BASE + i, int(rnd.random() < 0.9), int(rnd.random() < 0.8), int(rnd.random() < 0.8)) for i in range(users)),
+    )
+    c.executemany(
+        "INSERT INTO payments(user_id,type,amount,paid_at) VALUES (?,?,?,?)",
+        ((rnd.randint(1, users), rnd.choice(("dues", "vpn")), rnd.randint(100, 1000), "2024-01-01T00:00:00") for _ in range(users)),
+    )
+    c.execute("ANALYZE")
+    c.commit()
+    c.close()
+
+
+async def create_seeded(db_path: str, users: int):
+    await create_schema(db_path)
+    seed(db_path, users)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("path")
+    parser.add_argument("--users", type=int, default=10_000)
+    args = parser.parse_args()
+    asyncio.run(create_seeded(args.path, args.users))
+    print(f"seeded {args.users} users into {args.path}")
+
+
+if __name__ == "__main__":
+    main()
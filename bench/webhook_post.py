@@ -0,0 +1,90 @@
+"""Локальная проверка webhook-режима: POST записанных апдейтов на сервер бота.
+
+Файл — JSON Lines, по одному объекту Update на строку (как их присылает Telegram).
+Без файла отправляются синтетические нажатия кнопки-счётчика страниц ("noop"),
+ответ на которые приходит прямо в теле webhook-ответа.
+
+Запуск бота (WEBHOOK_URL пустой — setWebhook в Telegram не вызывается): BOT_MODE=webhook WEBHOOK_SECRET=s python main.py
+Запуск: python -m bench.webhook_post [updates.jsonl] [--url http://localhost:8080/webhook] [--secret s] [--count 100] [--concurrency 10]
+"""
+import argparse
+import asyncio
+import json
+import math
+import statistics
+import time
+from collections import Counter
+
+import aiohttp
+
+
+def sample_updates(count: int, tg_id: int) -> list[dict]:
+    user = {"id": tg_id, "is_bot": False, "first_name": "bench"}
+    chat = {"id": tg_id, "type": "private"}
+    return [
+        {
+            "update_id": 900_000_000 + i,
+            "callback_query": {
+                "id": str(i),
+                "from": user,
+                "chat_instance": "bench",
+                "data": "noop",
+                "message": {"message_id": 1, "date": 0, "chat": chat, "text": "bench"},
+            },
+        }
+        for i in range(count)
+    ]
+
+
+def response_method(body: bytes) -> str:
+    # Ответ в режиме reply-in-response — multipart с полем method; в фоне — пустой JSON
+    marker = b'name="method"'
+    if marker not in body:
+        return "-"
+    tail = body.split(marker, 1)[1].lstrip(b"\r\n")
+    return tail.split(b"\r\n", 1)[0].decode(errors="replace")
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("file", nargs="?")
+    parser.add_argument("--url", default="http://localhost:8080/webhook")
+    parser.add_argument("--secret", default="")
+    parser.add_argument("--count", type=int, default=100)
+    parser.add_argument("--tg-id", type=int, default=1)
+    parser.add_argument("--concurrency", type=int, default=10)
+    args = parser.parse_args()
+    if args.file:
+        with open(args.file, encoding="utf-8") as f:
+            updates = [json.loads(line) for line in f if line.strip()]
+    else:
+        updates = sample_updates(args.count, args.tg_id)
+
+    headers = {"X-Telegram-Bot-Api-Secret-Token": args.secret} if args.secret else {}
+    statuses: Counter = Counter()
+    methods: Counter = Counter()
+    latencies: list[float] = []
+    semaphore = asyncio.Semaphore(args.concurrency)
+
+    async def post(session: aiohttp.ClientSession, update: dict):
+        async with semaphore:
+            t0 = time.perf_counter()
+            async with session.post(args.url, json=update, headers=headers) as resp:
+                body = await resp.read()
+            latencies.append((time.perf_counter() - t0) * 1000)
+            statuses[resp.status] += 1
+            methods[response_method(body)] += 1
+
+    t0 = time.perf_counter()
+    async with aiohttp.ClientSession() as session:
+        await asyncio.gather(*(post(session, u) for u in updates))
+    wall = time.perf_counter() - t0
+    latencies.sort()
+    print(f"updates={len(updates)} wall={wall:.2f}s rate={len(updates) / wall:.1f}/s")
+    print(f"latency p50={statistics.median(latencies):.1f}ms p95={latencies[min(len(latencies) - 1, math.ceil(len(latencies) * 0.95) - 1)]:.1f}ms max={latencies[-1]:.1f}ms")
+    print(f"status: {dict(statuses)}")
+    print(f"reply methods: {dict(methods)}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
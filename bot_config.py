@@ -13,14 +13,83 @@ class Config:
     vpn_amount: int = int(os.getenv("VPN_AMOUNT", "0"))
     timezone: str = os.getenv("TIMEZONE", "Europe/Moscow")
     db_path: str = os.getenv("DB_PATH", "bzkbot.db")
+    db_pool_size: int = int(os.getenv("DB_POOL_SIZE", "4"))
+    db_journal_mode: str = os.getenv("DB_JOURNAL_MODE", "WAL")
+    db_synchronous: str = os.getenv("DB_SYNCHRONOUS", "NORMAL")
+    db_cache_size: int = int(os.getenv("DB_CACHE_SIZE", "-16000"))
+    db_mmap_size: int = int(os.getenv("DB_MMAP_SIZE", "67108864"))
+    db_busy_timeout: int = int(os.getenv("DB_BUSY_TIMEOUT", "5000"))
+    send_rate: float = float(os.getenv("SEND_RATE", "30"))
+    send_concurrency: int = int(os.getenv("SEND_CONCURRENCY", "16"))
+    send_per_chat_interval: float = float(os.getenv("SEND_PER_CHAT_INTERVAL", "1.0"))
+    send_max_retries: int = int(os.getenv("SEND_MAX_RETRIES", "3"))
+    reminder_slot_minutes: int = int(os.getenv("REMINDER_SLOT_MINUTES", "5"))
+    reminder_max_rate: float = float(os.getenv("REMINDER_MAX_RATE", "0"))
+    user_cache_size: int = int(os.getenv("USER_CACHE_SIZE", "10000"))
+    user_cache_ttl: float = float(os.getenv("USER_CACHE_TTL", "300"))
+    outbox_chunk_size: int = int(os.getenv("OUTBOX_CHUNK_SIZE", "200"))
+    outbox_poll_interval: float = float(os.getenv("OUTBOX_POLL_INTERVAL", "5"))
+    outbox_max_attempts: int = int(os.getenv("OUTBOX_MAX_ATTEMPTS", "3"))
+    outbox_retry_delay: float = float(os.getenv("OUTBOX_RETRY_DELAY", "10"))
+    bot_mode: str = os.getenv("BOT_MODE", "polling").lower()
+    webhook_url: str = os.getenv("WEBHOOK_URL", "").rstrip("/")
+    webhook_path: str = os.getenv("WEBHOOK_PATH", "/webhook")
+    webhook_secret: str = os.getenv("WEBHOOK_SECRET", "")
+    webhook_host: str = os.getenv("WEBHOOK_HOST", "0.0.0.0")
+    webhook_port: int = int(os.getenv("WEBHOOK_PORT", "8080"))
+    webhook_max_connections: int = int(os.getenv("WEBHOOK_MAX_CONNECTIONS", "40"))
+    webhook_reply_in_response: bool = os.getenv("WEBHOOK_REPLY_IN_RESPONSE", "1").lower() in ("1", "true", "yes")
+    update_concurrency: int = int(os.getenv("UPDATE_CONCURRENCY", "0"))
+    metrics_host: str = os.getenv("METRICS_HOST", "0.0.0.0")
+    metrics_port: int = int(os.getenv("METRICS_PORT", "8081"))
+    db_slow_query_ms: float = float(os.getenv("DB_SLOW_QUERY_MS", "100"))
+    db_stats_window: int = int(os.getenv("DB_STATS_WINDOW", "300"))
+    db_write_batch: int = int(os.getenv("DB_WRITE_BATCH", "100"))
+    db_write_delay_ms: float = float(os.getenv("DB_WRITE_DELAY_MS", "2"))
+    payment_import_max_rows: int = int(os.getenv("PAYMENT_IMPORT_MAX_ROWS", "10000"))
+    # Выгрузка до этого размера собирается в памяти, больше — во временном файле
+    export_spool_bytes: int = int(os.getenv("EXPORT_SPOOL_BYTES", str(1 << 20)))
+    fsm_storage: str = os.getenv("FSM_STORAGE", "sqlite").lower()
+    fsm_flush_interval: float = float(os.getenv("FSM_FLUSH_INTERVAL", "1.0"))
+    fsm_state_ttl: float = float(os.getenv("FSM_STATE_TTL", "86400"))
+    telegram_api_url: str = os.getenv("TELEGRAM_API_URL", "").rstrip("/")
+    workers: int = int(os.getenv("WORKERS", "1"))
+    # Выставляет супервизор дочерним процессам; -1 — обычный процесс или сам супервизор
+    worker_index: int = int(os.getenv("WORKER_INDEX", "-1"))
+    worker_max_in_flight: int = int(os.getenv("WORKER_MAX_IN_FLIGHT", "256"))
+    cache_sync_interval: float = float(os.getenv("CACHE_SYNC_INTERVAL", "1.0"))
 
     def __post_init__(self):
         raw_admins = os.getenv("ADMIN_IDS", "")
         self.admin_ids = [int(x) for x in raw_admins.split(",") if x.strip().isdigit()]
 
+    @property
+    def is_supervisor(self) -> bool:
+        return self.workers > 1 and self.worker_index < 0
+
+    @property
+    def is_leader(self) -> bool:
+        # Планировщик, outbox и чистка журналов — только в одном процессе
+        return self.worker_index <= 0
+
+    def sqlite_pragmas(self) -> dict:
+        return {
+            "journal_mode": self.db_journal_mode,
+            "synchronous": self.db_synchronous,
+            "cache_size": self.db_cache_size,
+            "mmap_size": self.db_mmap_size,
+            "busy_timeout": self.db_busy_timeout,
+        }
+
 config = Config()
 
 if not config.bot_token:
     raise RuntimeError("BOT_TOKEN не задан в .env")
 if not config.access_phrase:
     raise RuntimeError("ACCESS_PHRASE не задан в .env")
+if config.bot_mode not in ("polling", "webhook"):
+    raise RuntimeError("BOT_MODE должен быть polling или webhook")
+if config.fsm_storage not in ("sqlite", "memory"):
+    raise RuntimeError("FSM_STORAGE должен быть sqlite или memory")
+if config.workers > 1 and config.bot_mode != "polling":
+    raise RuntimeError("WORKERS>1 поддерживается только с BOT_MODE=polling")
@@ -1,121 +1,211 @@
-import aiosqlite
-from typing import Optional, List, Tuple
+import asyncio
+import functools
+import json
+import time
+import uuid
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Awaitable, Callable, Optional, List, Tuple
 from dataclasses import dataclass
-
-@dataclass
+from db.pool import ConnectionPool
+from db.migrations import run_migrations
+from db.cache import LRUCache
+from db.instrument import QueryStats, TracedConnection, current_call, instrumented
+from db.writer import DBWriter, WriteOp
+
+PAYMENT_TYPES = ("dues", "vpn")
+AUDIENCE_CHUNK_SIZE = 500
+# Слот рассылки пользователя — мультипликативный хэш id (Кнут): соседние id расходятся по разным
+# слотам, и SQLite считает его сам, без пользовательской функции
+SLOT_HASH_SQL = "((u.id * 2654435761) % 4294967296)"
+# Выгрузки: kind -> (SELECT с id строки первой колонкой, колонка id, колонка даты, колонка типа). Порядок колонок = EXPORT_COLUMNS
+EXPORT_SOURCES = {
+    "payments": (
+        "SELECT p.id, u.tg_id, p.type, p.amount, p.paid_at FROM payments p JOIN users u ON u.id=p.user_id",
+        "p.id", "p.paid_at", "p.type",
+    ),
+    "reminders": (
+        "SELECT r.id, u.tg_id, r.type, r.last_sent_at, r.acknowledged FROM reminders r JOIN users u ON u.id=r.user_id",
+        "r.id", "r.last_sent_at", "r.type",
+    ),
+    "notifications": (
+        "SELECT c.id, u.tg_id, c.batch_id, c.sent_at, c.state, c.attempts, c.acknowledged, c.last_error, b.text "
+        "FROM custom_notifications c JOIN users u ON u.id=c.user_id LEFT JOIN notification_batches b ON b.id=c.batch_id",
+        "c.id", "c.sent_at", "c.state",
+    ),
+}
+EXPORT_COLUMNS = {
+    "payments": ("id", "tg_id", "type", "amount", "paid_at"),
+    "reminders": ("id", "tg_id", "type", "last_sent_at", "acknowledged"),
+    "notifications": ("id", "tg_id", "batch_id", "sent_at", "state", "attempts", "acknowledged", "last_error", "text"),
+}
+# Допустимые значения фильтра по типу; для уведомлений это состояние доставки
+EXPORT_TYPES = {
+    "payments": PAYMENT_TYPES,
+    "reminders": PAYMENT_TYPES,
+    "notifications": ("pending", "sent", "failed"),
+}
+
+
+def user_slot(user_id: int, slots: int) -> int:
+    return (user_id * 2654435761) % 4294967296 % slots
+
+@dataclass(frozen=True)
 class User:
     id: int
     tg_id: int
     is_active: bool
     allow_dues_notifications: bool
     allow_vpn_notifications: bool
-
-SCHEMA = """
-CREATE TABLE IF NOT EXISTS users (
-  id INTEGER PRIMARY KEY AUTOINCREMENT,
-  tg_id INTEGER UNIQUE NOT NULL,
-  is_active INTEGER NOT NULL DEFAULT 0,
-  allow_dues_notifications INTEGER NOT NULL DEFAULT 1,
-    allow_vpn_notifications INTEGER NOT NULL DEFAULT 1,
-    show_status INTEGER NOT NULL DEFAULT 1,
-    show_dues INTEGER NOT NULL DEFAULT 1,
-    show_vpn INTEGER NOT NULL DEFAULT 1,
-    show_savings INTEGER NOT NULL DEFAULT 1
-);
-
-CREATE TABLE IF NOT EXISTS payments (
-  id INTEGER PRIMARY KEY AUTOINCREMENT,
-  user_id INTEGER NOT NULL,
-  type TEXT NOT NULL CHECK(type IN ('dues','vpn')),
-  amount INTEGER NOT NULL,
-  paid_at TEXT NOT NULL,
-  FOREIGN KEY(user_id) REFERENCES users(id)
-);
-
-CREATE TABLE IF NOT EXISTS reminders (
-  id INTEGER PRIMARY KEY AUTOINCREMENT,
-  user_id INTEGER NOT NULL,
-  type TEXT NOT NULL CHECK(type IN ('dues','vpn')),
-  last_sent_at TEXT,
-  acknowledged INTEGER NOT NULL DEFAULT 1,
-  FOREIGN KEY(user_id) REFERENCES users(id)
-);
-
-CREATE TABLE IF NOT EXISTS settings (
-  key TEXT PRIMARY KEY,
-  value TEXT
-);
-
-CREATE TABLE IF NOT EXISTS custom_notifications (
-    id INTEGER PRIMARY KEY AUTOINCREMENT,
-    user_id INTEGER NOT NULL,
-    text TEXT NOT NULL,
-    sent_at TEXT NOT NULL,
-    acknowledged INTEGER NOT NULL DEFAULT 0,
-    batch_id TEXT NOT NULL DEFAULT '',
-    FOREIGN KEY(user_id) REFERENCES users(id)
-);
-"""
-
+    show_status: bool = True
+    show_dues: bool = True
+    show_vpn: bool = True
+    show_savings: bool = True
+    unreachable: bool = False
+
+    @classmethod
+    def from_row(cls, row) -> "User":
+        return cls(
+            row["id"], row["tg_id"], bool(row["is_active"]),
+            bool(row["allow_dues_notifications"]), bool(row["allow_vpn_notifications"]),
+            bool(row["show_status"]), bool(row["show_dues"]), bool(row["show_vpn"]), bool(row["show_savings"]),
+            row["unreachable_at"] is not None,
+        )
+
+    def visibility(self) -> dict:
+        return {"dues": self.show_dues, "vpn": self.show_vpn, "savings": self.show_savings}
+
+@instrumented
 class DAO:
-    def __init__(self, db_path: str):
+    def __init__(self, db_path: str, pool_size: int = 4, pragmas: Optional[dict] = None, user_cache_size: int = 10000, user_cache_ttl: float = 300.0, slow_query_ms: float = 100.0, stats_window: float = 300.0, write_batch: int = 100, write_delay_ms: float = 2.0):
         self.db_path = db_path
-
-    async def init(self):
-        async with aiosqlite.connect(self.db_path) as db:
-            await db.executescript(SCHEMA)
-            # Миграция: добавить столбец show_status если отсутствует
-            cur = await db.execute("PRAGMA table_info(users)")
-            cols = [r[1] for r in await cur.fetchall()]
-            if "show_status" not in cols:
-                await db.execute("ALTER TABLE users ADD COLUMN show_status INTEGER NOT NULL DEFAULT 1")
-            if "show_dues" not in cols:
-                await db.execute("ALTER TABLE users ADD COLUMN show_dues INTEGER NOT NULL DEFAULT 1")
-            if "show_vpn" not in cols:
-                await db.execute("ALTER TABLE users ADD COLUMN show_vpn INTEGER NOT NULL DEFAULT 1")
-            if "show_savings" not in cols:
-                await db.execute("ALTER TABLE users ADD COLUMN show_savings INTEGER NOT NULL DEFAULT 1")
-            await db.commit()
+        self.pool = ConnectionPool(db_path, size=pool_size, pragmas=pragmas)
+        # Соединения пула только читают; все изменения — через писателя с групповой фиксацией
+        self.writer = DBWriter(self.pool._connect, max_batch=write_batch, max_delay=write_delay_ms / 1000)
+        self.users = LRUCache[User](max_size=user_cache_size, ttl=user_cache_ttl)
+        # Снимок таблицы settings: читается из памяти, обновляется set_* после commit
+        self._settings: dict[str, str] = {}
+        # Время и число строк каждого публичного метода; медленные вызовы логируются с планом запроса
+        self.stats = QueryStats(slow_threshold=slow_query_ms / 1000, window=stats_window)
+        self.stats.explain_conn = self.pool.acquire
+        # Последняя прочитанная запись cache_invalidations
+        self._invalidation_seq = 0
+
+    async def open(self):
+        await self.pool.open()
+        await self.writer.open()
+        await self.load_settings()
+        async with self.pool.acquire() as db:
+            cur = await db.execute("SELECT COALESCE(MAX(seq), 0) FROM cache_invalidations")
+            self._invalidation_seq = (await cur.fetchone())[0]
+
+    async def close(self):
+        await self.writer.close()
+        await self.pool.close()
+
+    @asynccontextmanager
+    async def _conn(self):
+        async with self.pool.acquire() as db:
+            call = current_call()
+            yield TracedConnection(db, call) if call is not None else db
+
+    async def _write(self, op: WriteOp):
+        return await self.writer.submit(op, current_call())
+
+    async def migrate(self) -> list[int]:
+        # Только при старте и до open(): соединения пула кэшируют схему
+        async with self.pool.standalone() as db:
+            return await run_migrations(db)
+
+    async def ping(self):
+        async with self._conn() as db:
+            await (await db.execute("SELECT 1")).fetchone()
 
     async def get_or_create_user(self, tg_id: int) -> User:
-        async with aiosqlite.connect(self.db_path) as db:
-            db.row_factory = aiosqlite.Row
+        user = self.users.get(tg_id)
+        if user is not None:
+            return user
+        epoch = self.users.epoch
+        async with self._conn() as db:
+            # Существующий пользователь — только чтение: в WAL оно не ждёт блокировку записи,
+            # общую для всех процессов (WORKERS>1). Upsert — только для нового
             cur = await db.execute("SELECT * FROM users WHERE tg_id=?", (tg_id,))
             row = await cur.fetchone()
-            if row:
-                return User(row["id"], row["tg_id"], bool(row["is_active"]), bool(row["allow_dues_notifications"]), bool(row["allow_vpn_notifications"]))
-            await db.execute("INSERT INTO users (tg_id) VALUES (?)", (tg_id,))
-            await db.commit()
-            cur = await db.execute("SELECT * FROM users WHERE tg_id=?", (tg_id,))
-            row = await cur.fetchone()
-            return User(row["id"], row["tg_id"], bool(row["is_active"]), bool(row["allow_dues_notifications"]), bool(row["allow_vpn_notifications"]))
+        if row is None:
+            async def op(db):
+                cur = await db.execute(
+                    "INSERT INTO users (tg_id) VALUES (?) ON CONFLICT(tg_id) DO UPDATE SET tg_id=excluded.tg_id RETURNING *",
+                    (tg_id,)
+                )
+                row = await cur.fetchone()
+                await cur.close()
+                return row
+            row = await self._write(op)
+        user = User.from_row(row)
+        self.users.put(tg_id, user, epoch)
+        return user
+
+    async def _update_user(self, statements: list[tuple[str, tuple]]):
+        # UPDATE ... RETURNING tg_id: инвалидируем кэш без отдельного SELECT — после COMMIT,
+        # иначе читатель между инвалидацией и фиксацией положит в кэш старую строку
+        async def op(db):
+            tg_ids = []
+            for sql, params in statements:
+                cur = await db.execute(sql + " RETURNING tg_id", params)
+                tg_ids.extend(row[0] for row in await cur.fetchall())
+            return tg_ids
+        for tg_id in await self._write(op):
+            self.users.invalidate(tg_id)
 
     async def activate_user(self, tg_id: int):
-        async with aiosqlite.connect(self.db_path) as db:
-            await db.execute("UPDATE users SET is_active=1 WHERE tg_id=?", (tg_id,))
-            await db.commit()
+        await self._update_user([("UPDATE users SET is_active=1 WHERE tg_id=?", (tg_id,))])
+
+    async def mark_unreachable(self, tg_ids: list[int], at: str) -> list[int]:
+        # Возвращает только впервые отмеченных. Их ещё не отправленные кастомные уведомления
+        # сразу переходят в failed, без оставшихся попыток
+        if not tg_ids:
+            return []
+        ids_json = json.dumps(tg_ids)
+
+        async def op(db):
+            await db.execute(
+                "UPDATE custom_notifications SET state='failed' WHERE state='pending' AND user_id IN "
+                "(SELECT u.id FROM json_each(?) j JOIN users u ON u.tg_id=j.value)",
+                (ids_json,)
+            )
+            cur = await db.execute(
+                "UPDATE users SET unreachable_at=? WHERE tg_id IN (SELECT value FROM json_each(?)) AND unreachable_at IS NULL "
+                "RETURNING tg_id",
+                (at, ids_json)
+            )
+            return [row[0] for row in await cur.fetchall()]
+        marked = await self._write(op)
+        for tg_id in marked:
+            self.users.invalidate(tg_id)
+        return marked
+
+    async def mark_reachable(self, tg_id: int):
+        await self._update_user([("UPDATE users SET unreachable_at=NULL WHERE tg_id=?", (tg_id,))])
 
     async def set_notifications(self, user_id: int, dues: Optional[bool]=None, vpn: Optional[bool]=None):
-        async with aiosqlite.connect(self.db_path) as db:
-            if dues is not None:
-                await db.execute("UPDATE users SET allow_dues_notifications=? WHERE id=?", (1 if dues else 0, user_id))
-            if vpn is not None:
-                await db.execute("UPDATE users SET allow_vpn_notifications=? WHERE id=?", (1 if vpn else 0, user_id))
-            await db.commit()
+        statements = []
+        if dues is not None:
+            statements.append(("UPDATE users SET allow_dues_notifications=? WHERE id=?", (1 if dues else 0, user_id)))
+        if vpn is not None:
+            statements.append(("UPDATE users SET allow_vpn_notifications=? WHERE id=?", (1 if vpn else 0, user_id)))
+        if statements:
+            await self._update_user(statements)
 
     async def set_show_status(self, user_id: int, show: bool):
-        async with aiosqlite.connect(self.db_path) as db:
-            await db.execute("UPDATE users SET show_status=? WHERE id=?", (1 if show else 0, user_id))
-            await db.commit()
+        await self._update_user([("UPDATE users SET show_status=? WHERE id=?", (1 if show else 0, user_id))])
 
     async def get_show_status(self, user_id: int) -> bool:
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._conn() as db:
             cur = await db.execute("SELECT show_status FROM users WHERE id=?", (user_id,))
             row = await cur.fetchone()
             return bool(row[0]) if row else True
 
     async def get_component_visibility(self, user_id: int) -> dict:
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._conn() as db:
             cur = await db.execute("SELECT show_dues, show_vpn, show_savings FROM users WHERE id=?", (user_id,))
             row = await cur.fetchone()
             if not row:
@@ -127,28 +217,36 @@ class DAO:
         if component not in col_map:
             return
         col = col_map[component]
-        async with aiosqlite.connect(self.db_path) as db:
-            cur = await db.execute(f"SELECT {col} FROM users WHERE id=?", (user_id,))
+        await self._update_user([(f"UPDATE users SET {col}=1-{col} WHERE id=?", (user_id,))])
+
+    async def get_user_row(self, user_id: int) -> dict | None:
+        async with self._conn() as db:
+            cur = await db.execute("SELECT id, tg_id, show_status FROM users WHERE id=?", (user_id,))
             row = await cur.fetchone()
-            current = bool(row[0]) if row else True
-            await db.execute(f"UPDATE users SET {col}=? WHERE id=?", (0 if current else 1, user_id))
-            await db.commit()
+            if not row:
+                return None
+            return {"id": row["id"], "tg_id": row["tg_id"], "show_status": bool(row["show_status"])}
 
-    async def total_users(self) -> int:
-        async with aiosqlite.connect(self.db_path) as db:
-            cur = await db.execute("SELECT COUNT(*) FROM users")
+    async def _row_count(self, name: str) -> int:
+        # row_counts ведут триггеры (миграция 8)
+        async with self._conn() as db:
+            cur = await db.execute("SELECT n FROM row_counts WHERE name=?", (name,))
             row = await cur.fetchone()
             return int(row[0]) if row else 0
 
-    async def users_page(self, page: int, page_size: int):
-        offset = (page - 1) * page_size
-        async with aiosqlite.connect(self.db_path) as db:
-            db.row_factory = aiosqlite.Row
-            cur = await db.execute(
-                "SELECT id, tg_id, is_active, show_status, allow_dues_notifications, allow_vpn_notifications, show_dues, show_vpn, show_savings FROM users ORDER BY id LIMIT ? OFFSET ?",
-                (page_size, offset)
-            )
-            rows = await cur.fetchall()
+    async def total_users(self) -> int:
+        return await self._row_count("users")
+
+    async def users_page(self, page_size: int, after: int = 0, before: Optional[int] = None):
+        # Keyset-пагинация по id: страница после курсора after или перед курсором before
+        cols = "id, tg_id, is_active, show_status, allow_dues_notifications, allow_vpn_notifications, show_dues, show_vpn, show_savings, unreachable_at"
+        async with self._conn() as db:
+            if before is not None:
+                cur = await db.execute(f"SELECT {cols} FROM users WHERE id<? ORDER BY id DESC LIMIT ?", (before, page_size))
+                rows = list(reversed(await cur.fetchall()))
+            else:
+                cur = await db.execute(f"SELECT {cols} FROM users WHERE id>? ORDER BY id LIMIT ?", (after, page_size))
+                rows = await cur.fetchall()
             return [
                 {
                     "id": r["id"],
@@ -160,113 +258,158 @@ class DAO:
                     "show_dues": bool(r["show_dues"]),
                     "show_vpn": bool(r["show_vpn"]),
                     "show_savings": bool(r["show_savings"]),
+                    "unreachable": r["unreachable_at"] is not None,
                 }
                 for r in rows
             ]
 
     async def active_user_ids(self) -> list[int]:
-        async with aiosqlite.connect(self.db_path) as db:
-            cur = await db.execute("SELECT tg_id FROM users WHERE is_active=1")
+        async with self._conn() as db:
+            cur = await db.execute("SELECT tg_id FROM users WHERE is_active=1 AND unreachable_at IS NULL")
             return [r[0] for r in await cur.fetchall()]
 
+    async def active_users_chunk(self, after: int, limit: int) -> list[tuple[int, int]]:
+        # (id, tg_id) активных с id > after: проход по первичному ключу, без сортировки
+        async with self._conn() as db:
+            cur = await db.execute(
+                "SELECT id, tg_id FROM users WHERE id>? AND is_active=1 AND unreachable_at IS NULL ORDER BY id LIMIT ?",
+                (after, limit)
+            )
+            return [(row[0], row[1]) for row in await cur.fetchall()]
+
+    async def iter_active_user_ids(self, chunk_size: int = AUDIENCE_CHUNK_SIZE) -> AsyncIterator[list[int]]:
+        async for chunk in _iter_chunks(self.active_users_chunk, chunk_size):
+            yield [tg_id for _, tg_id in chunk]
+
     async def tg_to_internal_map(self, tg_ids: list[int]) -> dict[int,int]:
         if not tg_ids:
             return {}
         placeholders = ",".join("?" for _ in tg_ids)
-        async with aiosqlite.connect(self.db_path) as db:
-            db.row_factory = aiosqlite.Row
+        async with self._conn() as db:
             cur = await db.execute(f"SELECT id, tg_id FROM users WHERE tg_id IN ({placeholders})", tuple(tg_ids))
             return {row["tg_id"]: row["id"] for row in await cur.fetchall()}
 
+    async def _insert_custom_notifications(self, db, text: str, tg_ids: list[int], sent_at: str, batch_id: str, author_id: Optional[int] = None) -> list[tuple[int, int]]:
+        # Постоянное число запросов на любой размер аудитории: список tg_id передаётся одним JSON-параметром
+        ids_json = json.dumps(tg_ids)
+        # Текст хранится один раз; total/acked батча ведут триггеры на custom_notifications.
+        # Повторный вызов с тем же batch_id дописывает получателей в существующий батч
+        await db.execute(
+            "INSERT OR IGNORE INTO notification_batches(id,text,author_id,created_at) VALUES (?,?,?,?)",
+            (batch_id, text, author_id, sent_at)
+        )
+        await db.execute("INSERT OR IGNORE INTO users(tg_id) SELECT value FROM json_each(?)", (ids_json,))
+        cur = await db.execute(
+            "SELECT u.id, u.tg_id FROM json_each(?) j JOIN users u ON u.tg_id=j.value",
+            (ids_json,)
+        )
+        tg_by_user = {row[0]: row[1] for row in await cur.fetchall()}
+        # Недоступные (users.unreachable_at) попадают в батч сразу как failed и в очередь не встают
+        cur = await db.execute(
+            "INSERT INTO custom_notifications(user_id,sent_at,batch_id,state,last_error) "
+            "SELECT u.id, ?, ?, CASE WHEN u.unreachable_at IS NULL THEN 'pending' ELSE 'failed' END, "
+            "CASE WHEN u.unreachable_at IS NULL THEN NULL ELSE 'unreachable' END "
+            "FROM json_each(?) j JOIN users u ON u.tg_id=j.value ORDER BY j.key "
+            "RETURNING id, user_id, state",
+            (sent_at, batch_id, ids_json)
+        )
+        created = [(tg_by_user[row[1]], row[0]) for row in await cur.fetchall() if row[2] == "pending"]
+        await cur.close()
+        return created
+
     async def create_custom_notifications(self, text: str, tg_ids: list[int], sent_at: str) -> int:
         # returns count sent
         if not tg_ids:
             return 0
-        mapping = await self.tg_to_internal_map(tg_ids)
-        async with aiosqlite.connect(self.db_path) as db:
-            for tg_id in tg_ids:
-                internal_id = mapping.get(tg_id)
-                if internal_id is None:
-                    # ensure user exists
-                    await db.execute("INSERT OR IGNORE INTO users(tg_id) VALUES(?)", (tg_id,))
-                    cur = await db.execute("SELECT id FROM users WHERE tg_id=?", (tg_id,))
-                    row = await cur.fetchone()
-                    internal_id = row[0]
-                await db.execute(
-                    "INSERT INTO custom_notifications(user_id,text,sent_at) VALUES (?,?,?)",
-                    (internal_id, text, sent_at)
-                )
-            await db.commit()
-        return len(tg_ids)
-
-    async def create_custom_notifications_batch(self, text: str, tg_ids: list[int], sent_at: str, batch_id: str):
-        mapping = await self.tg_to_internal_map(tg_ids)
-        created = []  # list of tuples (tg_id, notif_id)
-        async with aiosqlite.connect(self.db_path) as db:
-            for tg_id in tg_ids:
-                internal_id = mapping.get(tg_id)
-                if internal_id is None:
-                    await db.execute("INSERT OR IGNORE INTO users(tg_id) VALUES(?)", (tg_id,))
-                    cur = await db.execute("SELECT id FROM users WHERE tg_id=?", (tg_id,))
-                    row = await cur.fetchone()
-                    internal_id = row[0]
-                await db.execute(
-                    "INSERT INTO custom_notifications(user_id,text,sent_at,batch_id) VALUES (?,?,?,?)",
-                    (internal_id, text, sent_at, batch_id)
-                )
-                cur = await db.execute("SELECT last_insert_rowid()")
-                row = await cur.fetchone()
-                created.append((tg_id, row[0]))
-            await db.commit()
+        created = await self._write(lambda db: self._insert_custom_notifications(db, text, tg_ids, sent_at, uuid.uuid4().hex))
+        return len(created)
+
+    async def create_custom_notifications_batch(self, text: str, tg_ids: list[int], sent_at: str, batch_id: str, author_id: Optional[int] = None):
+        if not tg_ids:
+            return []
+        created = await self._write(lambda db: self._insert_custom_notifications(db, text, tg_ids, sent_at, batch_id, author_id))
         return created  # list of (tg_id, notif_id)
 
     async def acknowledge_custom(self, user_id: int, notif_id: int):
-        async with aiosqlite.connect(self.db_path) as db:
+        async def op(db):
             await db.execute(
                 "UPDATE custom_notifications SET acknowledged=1 WHERE id=? AND user_id=?",
                 (notif_id, user_id)
             )
-            await db.commit()
+        await self._write(op)
 
     async def get_custom_notif(self, notif_id: int) -> dict | None:
-        async with aiosqlite.connect(self.db_path) as db:
-            db.row_factory = aiosqlite.Row
-            cur = await db.execute("SELECT * FROM custom_notifications WHERE id=?", (notif_id,))
+        async with self._conn() as db:
+            cur = await db.execute(
+                "SELECT cn.*, b.text FROM custom_notifications cn JOIN notification_batches b ON b.id=cn.batch_id WHERE cn.id=?",
+                (notif_id,)
+            )
             row = await cur.fetchone()
             if not row:
                 return None
             return {"id": row["id"], "user_id": row["user_id"], "text": row["text"], "sent_at": row["sent_at"], "acknowledged": bool(row["acknowledged"]), "batch_id": row["batch_id"]}
 
-    async def list_batches(self, page: int, page_size: int):
-        offset = (page - 1) * page_size
-        async with aiosqlite.connect(self.db_path) as db:
-            db.row_factory = aiosqlite.Row
-            cur = await db.execute(
-                "SELECT batch_id, text, sent_at, COUNT(*) AS total, SUM(acknowledged) AS acked "
-                "FROM custom_notifications GROUP BY batch_id, text, sent_at ORDER BY sent_at DESC LIMIT ? OFFSET ?",
-                (page_size, offset)
-            )
-            rows = await cur.fetchall()
+    async def list_batches(self, page_size: int, after: Optional[int] = None, before: Optional[int] = None):
+        # Новые сверху; курсор — rowid батча, порядок (created_at, rowid) идёт по ix_batches_created.
+        # after — страница старше курсора, before — новее.
+        cols = "rowid AS seq, id, text, created_at, total, acked"
+        cursor_row = "(SELECT created_at, rowid FROM notification_batches WHERE rowid=?)"
+        async with self._conn() as db:
+            if before is not None:
+                cur = await db.execute(
+                    f"SELECT {cols} FROM notification_batches WHERE (created_at, rowid) > {cursor_row} "
+                    "ORDER BY created_at, rowid LIMIT ?",
+                    (before, page_size)
+                )
+                rows = list(reversed(await cur.fetchall()))
+            elif after is not None:
+                cur = await db.execute(
+                    f"SELECT {cols} FROM notification_batches WHERE (created_at, rowid) < {cursor_row} "
+                    "ORDER BY created_at DESC, rowid DESC LIMIT ?",
+                    (after, page_size)
+                )
+                rows = await cur.fetchall()
+            else:
+                cur = await db.execute(
+                    f"SELECT {cols} FROM notification_batches ORDER BY created_at DESC, rowid DESC LIMIT ?",
+                    (page_size,)
+                )
+                rows = await cur.fetchall()
             return [
                 {
-                    "batch_id": r["batch_id"],
+                    "seq": r["seq"],
+                    "batch_id": r["id"],
                     "text": r["text"],
-                    "sent_at": r["sent_at"],
+                    "sent_at": r["created_at"],
                     "total": r["total"],
-                    "acked": r["acked"] if r["acked"] is not None else 0,
+                    "acked": r["acked"],
                 }
-                for r in rows if r["batch_id"]
+                for r in rows
             ]
 
-    async def count_batches(self) -> int:
-        async with aiosqlite.connect(self.db_path) as db:
-            cur = await db.execute("SELECT COUNT(DISTINCT batch_id) FROM custom_notifications WHERE batch_id <> ''")
+    async def get_batch(self, batch_id: str) -> dict | None:
+        async with self._conn() as db:
+            cur = await db.execute(
+                "SELECT id, text, author_id, created_at, total, acked FROM notification_batches WHERE id=?",
+                (batch_id,)
+            )
             row = await cur.fetchone()
-            return int(row[0]) if row else 0
+            if not row:
+                return None
+            return {
+                "batch_id": row["id"],
+                "text": row["text"],
+                "author_id": row["author_id"],
+                "sent_at": row["created_at"],
+                "total": row["total"],
+                "acked": row["acked"],
+            }
+
+    async def count_batches(self) -> int:
+        return await self._row_count("notification_batches")
 
     async def unacked_in_batch(self, batch_id: str):
-        async with aiosqlite.connect(self.db_path) as db:
-            db.row_factory = aiosqlite.Row
+        async with self._conn() as db:
             cur = await db.execute(
                 "SELECT cn.id, u.tg_id, cn.user_id FROM custom_notifications cn JOIN users u ON u.id=cn.user_id "
                 "WHERE cn.batch_id=? AND cn.acknowledged=0",
@@ -277,88 +420,343 @@ class DAO:
                 for r in await cur.fetchall()
             ]
 
+    async def fetch_outbox(self, limit: int, now: Optional[float] = None) -> list[dict]:
+        # Только те, чья следующая попытка уже наступила (см. record_outbox_results)
+        async with self._conn() as db:
+            cur = await db.execute(
+                "SELECT cn.id, u.tg_id, cn.batch_id, cn.attempts FROM custom_notifications cn JOIN users u ON u.id=cn.user_id "
+                "WHERE cn.state='pending' AND cn.next_attempt_at<=? AND u.unreachable_at IS NULL ORDER BY cn.id LIMIT ?",
+                (time.time() if now is None else now, limit)
+            )
+            return [
+                {"notif_id": r["id"], "tg_id": r["tg_id"], "batch_id": r["batch_id"], "attempts": r["attempts"]}
+                for r in await cur.fetchall()
+            ]
+
+    async def record_outbox_results(self, results: list[tuple[int, Optional[int], Optional[str]]], max_attempts: int, retry_delay: float = 0.0, now: Optional[float] = None):
+        # results: (notif_id, message_id, error); error=None — доставлено.
+        # Неудачная попытка откладывает следующую на retry_delay * 2^(попыток до неё)
+        sent = [(message_id, notif_id) for notif_id, message_id, error in results if error is None]
+        now = time.time() if now is None else now
+        failed = [(error[:500], max_attempts, now, retry_delay, notif_id) for notif_id, message_id, error in results if error is not None]
+
+        async def op(db):
+            if sent:
+                await db.executemany(
+                    "UPDATE custom_notifications SET state='sent', attempts=attempts+1, message_id=?, last_error=NULL WHERE id=?",
+                    sent
+                )
+            if failed:
+                await db.executemany(
+                    "UPDATE custom_notifications SET attempts=attempts+1, last_error=?, "
+                    "state=CASE WHEN attempts+1>=? THEN 'failed' ELSE 'pending' END, "
+                    "next_attempt_at=? + ? * (1 << MIN(attempts, 10)) WHERE id=?",
+                    failed
+                )
+        await self._write(op)
+
+    async def batch_progress(self, batch_id: str) -> dict:
+        async with self._conn() as db:
+            cur = await db.execute(
+                "SELECT state, COUNT(*), COALESCE(SUM(acknowledged),0) FROM custom_notifications WHERE batch_id=? GROUP BY state",
+                (batch_id,)
+            )
+            progress = {"pending": 0, "sent": 0, "failed": 0, "acked": 0}
+            for state, count, acked in await cur.fetchall():
+                progress[state] = count
+                progress["acked"] += acked
+            progress["total"] = progress["pending"] + progress["sent"] + progress["failed"]
+            return progress
+
+    async def requeue_unacked(self, batch_id: str) -> int:
+        # Недоступным получателям повтор не ставится
+        async def op(db):
+            cur = await db.execute(
+                "UPDATE custom_notifications SET state='pending', attempts=0, last_error=NULL, next_attempt_at=0 "
+                "WHERE batch_id=? AND acknowledged=0 AND state<>'pending' "
+                "AND NOT EXISTS (SELECT 1 FROM users u WHERE u.id=custom_notifications.user_id AND u.unreachable_at IS NOT NULL)",
+                (batch_id,)
+            )
+            return cur.rowcount
+        return await self._write(op)
+
     async def record_payment(self, user_id: int, type_: str, amount: int, paid_at: str):
-        async with aiosqlite.connect(self.db_path) as db:
+        async def op(db):
             await db.execute(
                 "INSERT INTO payments (user_id,type,amount,paid_at) VALUES (?,?,?,?)",
                 (user_id, type_, amount, paid_at)
             )
-            await db.commit()
+        await self._write(op)
+
+    async def preview_payment_import(self, rows: list[tuple[int, str, int, str]]) -> dict:
+        # rows: (tg_id, type, amount, paid_at). Только чтение: сколько пользователей будет создано
+        # и какие строки (индексы в rows) совпадают с уже записанными оплатами
+        rows_json = json.dumps(rows)
+        async with self._conn() as db:
+            cur = await db.execute(
+                "SELECT COUNT(DISTINCT j.value ->> '$[0]') FROM json_each(?) j "
+                "WHERE NOT EXISTS (SELECT 1 FROM users u WHERE u.tg_id = j.value ->> '$[0]')",
+                (rows_json,)
+            )
+            new_users = (await cur.fetchone())[0]
+            cur = await db.execute(
+                "SELECT j.key FROM json_each(?) j JOIN users u ON u.tg_id = j.value ->> '$[0]' "
+                "WHERE EXISTS (SELECT 1 FROM payments p WHERE p.user_id=u.id AND p.type = j.value ->> '$[1]' "
+                "AND p.paid_at = j.value ->> '$[3]' AND p.amount = j.value ->> '$[2]')",
+                (rows_json,)
+            )
+            duplicates = [row[0] for row in await cur.fetchall()]
+        return {"new_users": new_users, "duplicates": duplicates}
+
+    async def import_payments(self, rows: list[tuple[int, str, int, str]]) -> dict:
+        # rows: (tg_id, type, amount, paid_at) — одной транзакцией писателя: недостающие пользователи
+        # создаются одним запросом, оплаты — одним executemany. Ошибка любой строки откатывает весь импорт
+        if not rows:
+            return {"payments": 0, "new_users": 0}
+        ids_json = json.dumps(sorted({tg_id for tg_id, _, _, _ in rows}))
+
+        async def op(db):
+            cur = await db.execute(
+                "INSERT OR IGNORE INTO users(tg_id) SELECT value FROM json_each(?) RETURNING id",
+                (ids_json,)
+            )
+            new_users = len(await cur.fetchall())
+            cur = await db.execute(
+                "SELECT u.id, u.tg_id FROM json_each(?) j JOIN users u ON u.tg_id=j.value",
+                (ids_json,)
+            )
+            user_by_tg = {row[1]: row[0] for row in await cur.fetchall()}
+            await db.executemany(
+                "INSERT INTO payments (user_id,type,amount,paid_at) VALUES (?,?,?,?)",
+                [(user_by_tg[tg_id], type_, amount, paid_at) for tg_id, type_, amount, paid_at in rows]
+            )
+            return {"payments": len(rows), "new_users": new_users}
+        return await self._write(op)
 
     async def get_total_collected(self, type_: Optional[str]=None) -> int:
-        async with aiosqlite.connect(self.db_path) as db:
-            if type_:
-                cur = await db.execute("SELECT COALESCE(SUM(amount),0) FROM payments WHERE type=?", (type_,))
-            else:
-                cur = await db.execute("SELECT COALESCE(SUM(amount),0) FROM payments")
+        # payment_totals поддерживается триггерами на payments (миграция 5)
+        types = (type_,) if type_ else PAYMENT_TYPES
+        placeholders = ",".join("?" for _ in types)
+        async with self._conn() as db:
+            cur = await db.execute(f"SELECT COALESCE(SUM(total),0) FROM payment_totals WHERE type IN ({placeholders})", types)
             row = await cur.fetchone()
             return int(row[0] or 0)
 
+    async def check_payment_totals(self, fix: bool = False) -> list[dict]:
+        # Пересчёт с нуля; возвращает только типы с расхождением
+        async def op(db):
+            cur = await db.execute("SELECT type, COALESCE(SUM(amount),0), COUNT(*) FROM payments GROUP BY type")
+            actual = {r[0]: (int(r[1]), int(r[2])) for r in await cur.fetchall()}
+            cur = await db.execute(
+                f"SELECT type, total, count FROM payment_totals WHERE type IN ({','.join('?' for _ in PAYMENT_TYPES)})",
+                PAYMENT_TYPES
+            )
+            stored = {r[0]: (int(r[1]), int(r[2])) for r in await cur.fetchall()}
+            drift = []
+            for type_ in PAYMENT_TYPES:
+                real_total, real_count = actual.get(type_, (0, 0))
+                total, count = stored.get(type_, (0, 0))
+                if (total, count) != (real_total, real_count):
+                    drift.append({"type": type_, "stored": total, "actual": real_total, "stored_count": count, "actual_count": real_count})
+            if fix and drift:
+                await db.executemany(
+                    "INSERT INTO payment_totals(type,total,count) VALUES (?,?,?) "
+                    "ON CONFLICT(type) DO UPDATE SET total=excluded.total, count=excluded.count",
+                    [(d["type"], d["actual"], d["actual_count"]) for d in drift]
+                )
+            return drift
+        if fix:
+            # Чтение и исправление в транзакции писателя: между ними никто не пишет
+            return await self._write(op)
+        async with self._conn() as db:
+            # Оба чтения в одной транзакции — один снимок WAL
+            await db.execute("BEGIN")
+            try:
+                return await op(db)
+            finally:
+                await db.rollback()
+
+    async def load_settings(self):
+        async with self._conn() as db:
+            cur = await db.execute("SELECT key, value FROM settings")
+            self._settings = {row[0]: row[1] for row in await cur.fetchall()}
+
+    async def _set_settings(self, values: dict[str, str]):
+        async def op(db):
+            await db.executemany(
+                "INSERT INTO settings(key,value) VALUES(?,?) ON CONFLICT(key) DO UPDATE SET value=excluded.value",
+                list(values.items())
+            )
+        await self._write(op)
+        # Новый снимок целиком: читатели видят либо старые, либо новые значения
+        self._settings = {**self._settings, **values}
+
+    async def sync_invalidations(self) -> int:
+        # Изменения пользователей и настроек, сделанные другими процессами (и этим — повторно, без вреда)
+        async with self._conn() as db:
+            cur = await db.execute("SELECT seq, tg_id FROM cache_invalidations WHERE seq>? ORDER BY seq", (self._invalidation_seq,))
+            rows = await cur.fetchall()
+        if not rows:
+            return 0
+        reload_settings = False
+        for seq, tg_id in rows:
+            if tg_id is None:
+                reload_settings = True
+            else:
+                self.users.invalidate(tg_id)
+        self._invalidation_seq = rows[-1][0]
+        if reload_settings:
+            await self.load_settings()
+        return len(rows)
+
+    async def prune_invalidations(self, older_than: float) -> int:
+        async def op(db):
+            cur = await db.execute("DELETE FROM cache_invalidations WHERE created_at<julianday('now')-?", (older_than / 86400,))
+            return cur.rowcount
+        return await self._write(op)
+
+    def _setting_int(self, key: str, default: int) -> int:
+        value = self._settings.get(key)
+        return int(value) if value is not None else default
+
     async def set_savings(self, amount: int):
-        async with aiosqlite.connect(self.db_path) as db:
-            await db.execute("INSERT INTO settings(key,value) VALUES('savings',?) ON CONFLICT(key) DO UPDATE SET value=excluded.value", (str(amount),))
-            await db.commit()
+        await self._set_settings({"savings": str(amount)})
 
     async def get_savings(self) -> int:
-        async with aiosqlite.connect(self.db_path) as db:
-            cur = await db.execute("SELECT value FROM settings WHERE key='savings'")
-            row = await cur.fetchone()
-            return int(row[0]) if row and row[0] is not None else 0
+        return self._setting_int("savings", 0)
 
     async def set_vpn_amount(self, amount: int):
-        async with aiosqlite.connect(self.db_path) as db:
-            await db.execute("INSERT INTO settings(key,value) VALUES('vpn_amount',?) ON CONFLICT(key) DO UPDATE SET value=excluded.value", (str(amount),))
-            await db.commit()
+        await self._set_settings({"vpn_amount": str(amount)})
 
     async def get_vpn_amount(self) -> int:
-        async with aiosqlite.connect(self.db_path) as db:
-            cur = await db.execute("SELECT value FROM settings WHERE key='vpn_amount'")
-            row = await cur.fetchone()
-            return int(row[0]) if row and row[0] is not None else 0
+        return self._setting_int("vpn_amount", 0)
 
     async def set_dues_amount(self, amount: int):
-        async with aiosqlite.connect(self.db_path) as db:
-            await db.execute("INSERT INTO settings(key,value) VALUES('dues_amount',?) ON CONFLICT(key) DO UPDATE SET value=excluded.value", (str(amount),))
-            await db.commit()
+        await self._set_settings({"dues_amount": str(amount)})
 
     async def get_dues_amount(self) -> int:
-        async with aiosqlite.connect(self.db_path) as db:
-            cur = await db.execute("SELECT value FROM settings WHERE key='dues_amount'")
-            row = await cur.fetchone()
-            return int(row[0]) if row and row[0] is not None else 0
+        return self._setting_int("dues_amount", 0)
 
     async def upsert_reminder(self, user_id: int, type_: str, acknowledged: bool, last_sent_at: Optional[str]):
-        async with aiosqlite.connect(self.db_path) as db:
-            cur = await db.execute("SELECT id FROM reminders WHERE user_id=? AND type=?", (user_id, type_))
-            row = await cur.fetchone()
-            if row:
-                await db.execute("UPDATE reminders SET acknowledged=?, last_sent_at=? WHERE id=?", (1 if acknowledged else 0, last_sent_at, row[0]))
-            else:
-                await db.execute("INSERT INTO reminders(user_id,type,acknowledged,last_sent_at) VALUES (?,?,?,?)", (user_id, type_, 1 if acknowledged else 0, last_sent_at))
-            await db.commit()
+        await self.record_reminders([(user_id, type_, acknowledged, last_sent_at)])
+
+    async def record_reminders(self, rows: list[tuple[int, str, bool, Optional[str]]]):
+        # rows: (user_id, type, acknowledged, last_sent_at) — одной транзакцией.
+        # last_sent_at=None (подтверждение) сохраняет время последней отправки
+        if not rows:
+            return
+
+        async def op(db):
+            await db.executemany(
+                "INSERT INTO reminders(user_id,type,acknowledged,last_sent_at) VALUES (?,?,?,?) "
+                "ON CONFLICT(user_id, type) DO UPDATE SET acknowledged=excluded.acknowledged, "
+                "last_sent_at=COALESCE(excluded.last_sent_at, reminders.last_sent_at)",
+                [(user_id, type_, 1 if acknowledged else 0, last_sent_at) for user_id, type_, acknowledged, last_sent_at in rows]
+            )
+        await self._write(op)
+
+    async def users_for_reminder_chunk(self, type_: str, after: int, limit: int, slot: int = 0, slots: int = 1) -> List[Tuple[int,int]]:
+        # slots > 1: только пользователи слота slot (см. user_slot)
+        async with self._conn() as db:
+            notif_col = "allow_dues_notifications" if type_ == "dues" else "allow_vpn_notifications"
+            slot_filter = f"AND {SLOT_HASH_SQL} % ? = ? " if slots > 1 else ""
+            params = (type_, after, slots, slot, limit) if slots > 1 else (type_, after, limit)
+            cur = await db.execute(
+                f"SELECT u.id, u.tg_id FROM users u LEFT JOIN reminders r ON r.user_id=u.id AND r.type=? "
+                f"WHERE u.id>? AND u.is_active=1 AND u.unreachable_at IS NULL AND u.{notif_col}=1 {slot_filter}"
+                f"AND (r.acknowledged=0 OR r.id IS NULL) "
+                f"ORDER BY u.id LIMIT ?",
+                params
+            )
+            return [(row[0], row[1]) for row in await cur.fetchall()]
+
+    async def iter_users_for_reminder(self, type_: str, chunk_size: int = AUDIENCE_CHUNK_SIZE, slot: int = 0, slots: int = 1) -> AsyncIterator[List[Tuple[int,int]]]:
+        fetch = functools.partial(self.users_for_reminder_chunk, type_, slot=slot, slots=slots)
+        async for chunk in _iter_chunks(fetch, chunk_size):
+            yield chunk
 
     async def users_for_reminder(self, type_: str) -> List[Tuple[int,int]]:
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._conn() as db:
             notif_col = "allow_dues_notifications" if type_ == "dues" else "allow_vpn_notifications"
             cur = await db.execute(
                 f"SELECT u.id, u.tg_id FROM users u LEFT JOIN reminders r ON r.user_id=u.id AND r.type=? "
-                f"WHERE u.is_active=1 AND u.{notif_col}=1 AND (r.acknowledged=0 OR r.id IS NULL)",
+                f"WHERE u.is_active=1 AND u.unreachable_at IS NULL AND u.{notif_col}=1 AND (r.acknowledged=0 OR r.id IS NULL)",
                 (type_,)
             )
             return [(row[0], row[1]) for row in await cur.fetchall()]
 
+    async def load_fsm_states(self, since: float) -> list[tuple[str, Optional[str], str, float]]:
+        async with self._conn() as db:
+            cur = await db.execute("SELECT key, state, data, updated_at FROM fsm_states WHERE updated_at>=?", (since,))
+            return [tuple(r) for r in await cur.fetchall()]
+
+    async def save_fsm_states(self, upserts: list[tuple[str, Optional[str], str, float]], deletes: list[str], expired_before: Optional[float] = None):
+        # Одна операция на весь накопленный пакет изменений
+        async def op(db):
+            if upserts:
+                await db.executemany(
+                    "INSERT INTO fsm_states(key, state, data, updated_at) VALUES (?,?,?,?) "
+                    "ON CONFLICT(key) DO UPDATE SET state=excluded.state, data=excluded.data, updated_at=excluded.updated_at",
+                    upserts
+                )
+            if deletes:
+                await db.executemany("DELETE FROM fsm_states WHERE key=?", [(k,) for k in deletes])
+            if expired_before is not None:
+                await db.execute("DELETE FROM fsm_states WHERE updated_at<?", (expired_before,))
+        await self._write(op)
+
     async def get_schedule_time(self) -> Tuple[int, int]:
-        async with aiosqlite.connect(self.db_path) as db:
-            cur = await db.execute("SELECT value FROM settings WHERE key='reminder_hour'")
-            row_h = await cur.fetchone()
-            cur = await db.execute("SELECT value FROM settings WHERE key='reminder_minute'")
-            row_m = await cur.fetchone()
-            hour = int(row_h[0]) if row_h and row_h[0] is not None else 9
-            minute = int(row_m[0]) if row_m and row_m[0] is not None else 0
-            return hour, minute
-
-    async def set_schedule_time(self, hour: int, minute: int):
-        async with aiosqlite.connect(self.db_path) as db:
-            await db.execute("INSERT INTO settings(key,value) VALUES('reminder_hour',?) ON CONFLICT(key) DO UPDATE SET value=excluded.value", (str(hour),))
-            await db.execute("INSERT INTO settings(key,value) VALUES('reminder_minute',?) ON CONFLICT(key) DO UPDATE SET value=excluded.value", (str(minute),))
-            await db.commit()
+        return self._setting_int("reminder_hour", 9), self._setting_int("reminder_minute", 0)
+
+    async def set_schedule_time(self, hour: int, minute: int, window_minutes: int = 0):
+        await self._set_settings({
+            "reminder_hour": str(hour),
+            "reminder_minute": str(minute),
+            "reminder_window_minutes": str(window_minutes),
+        })
+
+    async def get_reminder_window(self) -> int:
+        # Длительность окна рассылки в минутах от времени начала; 0 — все напоминания разом
+        return self._setting_int("reminder_window_minutes", 0)
+
+    async def export_chunk(self, kind: str, after: int, limit: int, since: Optional[str] = None, until: Optional[str] = None, type_: Optional[str] = None) -> list[tuple]:
+        # Порция выгрузки kind с id > after; since/until — границы даты [since, until) в ISO-строках
+        select, id_col, date_col, type_col = EXPORT_SOURCES[kind]
+        where, params = [f"{id_col}>?"], [after]
+        if since is not None:
+            where.append(f"{date_col}>=?")
+            params.append(since)
+        if until is not None:
+            where.append(f"{date_col}<?")
+            params.append(until)
+        if type_ is not None:
+            where.append(f"{type_col}=?")
+            params.append(type_)
+        async with self._conn() as db:
+            cur = await db.execute(f"{select} WHERE {' AND '.join(where)} ORDER BY {id_col} LIMIT ?", (*params, limit))
+            return [tuple(row) for row in await cur.fetchall()]
+
+    async def iter_export(self, kind: str, since: Optional[str] = None, until: Optional[str] = None, type_: Optional[str] = None, chunk_size: int = AUDIENCE_CHUNK_SIZE) -> AsyncIterator[list[tuple]]:
+        async def fetch(after: int, limit: int):
+            return await self.export_chunk(kind, after, limit, since, until, type_)
+        async for chunk in _iter_chunks(fetch, chunk_size):
+            yield chunk
+
+
+async def _iter_chunks(fetch: Callable[[int, int], Awaitable[list[tuple]]], chunk_size: int) -> AsyncIterator[list[tuple]]:
+    # Keyset-курсор по id (первый элемент строки): соединение пула занято только на время одной порции,
+    # а не на весь проход. Следующая порция читается, пока потребитель обрабатывает текущую
+    pending = asyncio.ensure_future(fetch(0, chunk_size))
+    try:
+        while True:
+            chunk = await pending
+            if not chunk:
+                return
+            if len(chunk) < chunk_size:
+                yield chunk
+                return
+            pending = asyncio.ensure_future(fetch(chunk[-1][0], chunk_size))
+            yield chunk
+    finally:
+        if not pending.done():
+            pending.cancel()
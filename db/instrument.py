@@ -0,0 +1,185 @@
+import functools
+import inspect
+import logging
+import re
+import time
+from collections import deque
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Any, Callable, Optional
+import aiosqlite
+
+
+@dataclass
+class CallRecord:
+    method: str
+    rows: int = 0
+    # (sql, форма параметров) каждого выполненного запроса
+    statements: list[tuple[str, str]] = field(default_factory=list)
+
+
+_EXPLAINABLE = re.compile(r"\s*(SELECT|INSERT|UPDATE|DELETE|WITH)\b", re.I)
+
+_current: ContextVar[Optional[CallRecord]] = ContextVar("dao_call", default=None)
+
+
+def current_call() -> Optional[CallRecord]:
+    return _current.get()
+
+
+def params_shape(params: Any) -> str:
+    # В лог попадают только типы параметров, не значения
+    if params is None:
+        return "()"
+    if isinstance(params, dict):
+        return "{" + ", ".join(f"{k}: {type(v).__name__}" for k, v in params.items()) + "}"
+    return "(" + ", ".join(type(v).__name__ for v in params) + ")"
+
+
+class TracedCursor:
+    def __init__(self, cursor: aiosqlite.Cursor, call: CallRecord):
+        self._cursor = cursor
+        self._call = call
+
+    async def fetchone(self):
+        row = await self._cursor.fetchone()
+        if row is not None:
+            self._call.rows += 1
+        return row
+
+    async def fetchall(self):
+        rows = await self._cursor.fetchall()
+        self._call.rows += len(rows)
+        return rows
+
+    def __getattr__(self, name: str):
+        return getattr(self._cursor, name)
+
+
+class TracedConnection:
+    # Обёртка соединения пула на время вызова DAO: учитывает запросы и число строк
+    def __init__(self, db: aiosqlite.Connection, call: CallRecord):
+        self._db = db
+        self._call = call
+
+    async def execute(self, sql: str, parameters: Any = None):
+        cursor = await self._db.execute(sql, parameters)
+        self._call.statements.append((sql, params_shape(parameters)))
+        # Для DML rowcount — число изменённых строк, для SELECT он -1
+        if cursor.rowcount > 0:
+            self._call.rows += cursor.rowcount
+        return TracedCursor(cursor, self._call)
+
+    async def executemany(self, sql: str, parameters):
+        parameters = list(parameters)
+        cursor = await self._db.executemany(sql, parameters)
+        shape = params_shape(parameters[0]) if parameters else "()"
+        self._call.statements.append((sql, f"{len(parameters)} x {shape}"))
+        if cursor.rowcount > 0:
+            self._call.rows += cursor.rowcount
+        return TracedCursor(cursor, self._call)
+
+    def __getattr__(self, name: str):
+        return getattr(self._db, name)
+
+
+class QueryStats:
+    # Скользящее окно длительностей по методам DAO + журнал медленных вызовов с планом запроса
+    def __init__(self, slow_threshold: float = 0.1, window: float = 300.0, max_samples: int = 10000):
+        self.slow_threshold = slow_threshold
+        self.window = window
+        self.max_samples = max_samples
+        self.started_at = time.monotonic()
+        self._samples: dict[str, deque[tuple[float, float, int]]] = {}
+        self._plans: dict[str, list[str]] = {}
+        # (method, seconds) — например гистограмма в /metrics
+        self.observer: Optional[Callable[[str, float], None]] = None
+        # Соединение для EXPLAIN QUERY PLAN медленных запросов
+        self.explain_conn: Optional[Callable[[], Any]] = None
+
+    def record(self, call: CallRecord, elapsed: float):
+        samples = self._samples.get(call.method)
+        if samples is None:
+            samples = self._samples[call.method] = deque(maxlen=self.max_samples)
+        samples.append((time.monotonic(), elapsed, call.rows))
+        if self.observer is not None:
+            self.observer(call.method, elapsed)
+
+    async def log_slow(self, call: CallRecord, elapsed: float):
+        lines = [f"slow DAO call {call.method}: {elapsed * 1000:.1f}ms rows={call.rows} statements={len(call.statements)}"]
+        for sql, shape in call.statements:
+            lines.append(f"  SQL: {' '.join(sql.split())}  params={shape}")
+            for step in await self._explain(sql):
+                lines.append(f"    plan: {step}")
+        logging.warning("\n".join(lines))
+
+    async def _explain(self, sql: str) -> list[str]:
+        if sql in self._plans:
+            return self._plans[sql]
+        plan: list[str] = []
+        if self.explain_conn is not None and _EXPLAINABLE.match(sql):
+            try:
+                async with self.explain_conn() as db:
+                    # Значения не сохраняются, план строится на NULL-параметрах
+                    count = sql.count("?")
+                    cur = await db.execute("EXPLAIN QUERY PLAN " + sql, (None,) * count)
+                    plan = [r[3] for r in await cur.fetchall()]
+            except Exception as e:
+                plan = [f"unavailable: {type(e).__name__}: {e}"]
+        self._plans[sql] = plan
+        return plan
+
+    def summary(self) -> list[dict]:
+        now = time.monotonic()
+        since = now - self.window
+        span = max(1e-9, min(self.window, now - self.started_at))
+        result = []
+        for method, samples in self._samples.items():
+            recent = sorted(d for t, d, _ in samples if t >= since)
+            if not recent:
+                continue
+            rows = [r for t, _, r in samples if t >= since]
+            n = len(recent)
+            result.append({
+                "method": method,
+                "calls": n,
+                "rate": n / span,
+                "p50": recent[int(0.50 * (n - 1))],
+                "p95": recent[int(0.95 * (n - 1))],
+                "p99": recent[int(0.99 * (n - 1))],
+                "total": sum(recent),
+                "rows": sum(rows) / n,
+            })
+        result.sort(key=lambda r: r["total"], reverse=True)
+        return result
+
+
+# Жизненный цикл и служебные методы не замеряются
+NOT_INSTRUMENTED = {"open", "close", "migrate"}
+
+
+def instrumented(cls):
+    # Оборачивает все публичные async-методы класса: время, число строк, медленные вызовы
+    for name, fn in list(vars(cls).items()):
+        if name.startswith("_") or name in NOT_INSTRUMENTED or not inspect.iscoroutinefunction(fn):
+            continue
+        setattr(cls, name, _timed(name, fn))
+    return cls
+
+
+def _timed(name: str, fn):
+    @functools.wraps(fn)
+    async def wrapper(self, *args, **kwargs):
+        call = CallRecord(name)
+        token = _current.set(call)
+        started = time.perf_counter()
+        try:
+            return await fn(self, *args, **kwargs)
+        finally:
+            elapsed = time.perf_counter() - started
+            _current.reset(token)
+            stats: QueryStats = self.stats
+            stats.record(call, elapsed)
+            if elapsed >= stats.slow_threshold:
+                await stats.log_slow(call, elapsed)
+    return wrapper
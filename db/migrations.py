@@ -0,0 +1,302 @@
+import logging
+import uuid
+from datetime import datetime
+from typing import Awaitable, Callable
+import aiosqlite
+
+# Схема на момент введения версионирования; CREATE ... IF NOT EXISTS,
+# чтобы шаг 1 был безопасен и для баз, созданных прежним DAO.init()
+BASELINE_SCHEMA = [
+    """
+    CREATE TABLE IF NOT EXISTS users (
+      id INTEGER PRIMARY KEY AUTOINCREMENT,
+      tg_id INTEGER UNIQUE NOT NULL,
+      is_active INTEGER NOT NULL DEFAULT 0,
+      allow_dues_notifications INTEGER NOT NULL DEFAULT 1,
+      allow_vpn_notifications INTEGER NOT NULL DEFAULT 1,
+      show_status INTEGER NOT NULL DEFAULT 1,
+      show_dues INTEGER NOT NULL DEFAULT 1,
+      show_vpn INTEGER NOT NULL DEFAULT 1,
+      show_savings INTEGER NOT NULL DEFAULT 1
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS payments (
+      id INTEGER PRIMARY KEY AUTOINCREMENT,
+      user_id INTEGER NOT NULL,
+      type TEXT NOT NULL CHECK(type IN ('dues','vpn')),
+      amount INTEGER NOT NULL,
+      paid_at TEXT NOT NULL,
+      FOREIGN KEY(user_id) REFERENCES users(id)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS reminders (
+      id INTEGER PRIMARY KEY AUTOINCREMENT,
+      user_id INTEGER NOT NULL,
+      type TEXT NOT NULL CHECK(type IN ('dues','vpn')),
+      last_sent_at TEXT,
+      acknowledged INTEGER NOT NULL DEFAULT 1,
+      FOREIGN KEY(user_id) REFERENCES users(id)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS settings (
+      key TEXT PRIMARY KEY,
+      value TEXT
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS custom_notifications (
+      id INTEGER PRIMARY KEY AUTOINCREMENT,
+      user_id INTEGER NOT NULL,
+      text TEXT NOT NULL,
+      sent_at TEXT NOT NULL,
+      acknowledged INTEGER NOT NULL DEFAULT 0,
+      batch_id TEXT NOT NULL DEFAULT '',
+      FOREIGN KEY(user_id) REFERENCES users(id)
+    )
+    """,
+]
+
+
+async def _columns(db: aiosqlite.Connection, table: str) -> set[str]:
+    cur = await db.execute(f"PRAGMA table_info({table})")
+    return {r[1] for r in await cur.fetchall()}
+
+
+async def m001_baseline(db: aiosqlite.Connection):
+    for stmt in BASELINE_SCHEMA:
+        await db.execute(stmt)
+
+
+async def m002_user_visibility_columns(db: aiosqlite.Connection):
+    # Базы до появления настроек видимости (в т.ч. bzkbot.db из репозитория)
+    cols = await _columns(db, "users")
+    for col in ("show_status", "show_dues", "show_vpn", "show_savings"):
+        if col not in cols:
+            await db.execute(f"ALTER TABLE users ADD COLUMN {col} INTEGER NOT NULL DEFAULT 1")
+
+
+async def m003_reminders_unique(db: aiosqlite.Connection):
+    # Дубликаты (user_id, type) схлопываем до последней записи
+    await db.execute("DELETE FROM reminders WHERE id NOT IN (SELECT MAX(id) FROM reminders GROUP BY user_id, type)")
+    await db.execute("CREATE UNIQUE INDEX IF NOT EXISTS ux_reminders_user_type ON reminders(user_id, type)")
+
+
+async def m004_hot_query_indexes(db: aiosqlite.Connection):
+    # users_for_reminder / active_user_ids: фильтр по is_active, tg_id — чтобы обойтись индексом
+    await db.execute("CREATE INDEX IF NOT EXISTS ix_users_active ON users(is_active, tg_id)")
+    # get_total_collected: SUM(amount) по type без чтения таблицы
+    await db.execute("CREATE INDEX IF NOT EXISTS ix_payments_type_amount ON payments(type, amount)")
+    # unacked_in_batch / count_batches
+    await db.execute("CREATE INDEX IF NOT EXISTS ix_custom_batch_ack ON custom_notifications(batch_id, acknowledged)")
+    # users_for_reminder: соединение reminders по (user_id, type) покрыто ux_reminders_user_type
+
+
+async def m005_payment_totals(db: aiosqlite.Connection):
+    # Агрегат по типу оплаты; триггеры держат его в той же транзакции, что и payments
+    await db.execute(
+        "CREATE TABLE IF NOT EXISTS payment_totals ("
+        "type TEXT PRIMARY KEY, total INTEGER NOT NULL DEFAULT 0, count INTEGER NOT NULL DEFAULT 0)"
+    )
+    await db.execute("INSERT OR IGNORE INTO payment_totals(type) VALUES ('dues'), ('vpn')")
+    await db.execute(
+        "UPDATE payment_totals SET "
+        "total=(SELECT COALESCE(SUM(amount),0) FROM payments p WHERE p.type=payment_totals.type), "
+        "count=(SELECT COUNT(*) FROM payments p WHERE p.type=payment_totals.type)"
+    )
+    await db.execute(
+        "CREATE TRIGGER IF NOT EXISTS trg_payments_ai AFTER INSERT ON payments BEGIN "
+        "UPDATE payment_totals SET total=total+NEW.amount, count=count+1 WHERE type=NEW.type; END"
+    )
+    await db.execute(
+        "CREATE TRIGGER IF NOT EXISTS trg_payments_ad AFTER DELETE ON payments BEGIN "
+        "UPDATE payment_totals SET total=total-OLD.amount, count=count-1 WHERE type=OLD.type; END"
+    )
+    await db.execute(
+        "CREATE TRIGGER IF NOT EXISTS trg_payments_au AFTER UPDATE OF amount, type ON payments BEGIN "
+        "UPDATE payment_totals SET total=total-OLD.amount, count=count-1 WHERE type=OLD.type; "
+        "UPDATE payment_totals SET total=total+NEW.amount, count=count+1 WHERE type=NEW.type; END"
+    )
+
+
+async def m006_custom_outbox(db: aiosqlite.Connection):
+    # Состояние доставки кастомных уведомлений: pending -> sent | failed
+    cols = await _columns(db, "custom_notifications")
+    if "state" not in cols:
+        await db.execute("ALTER TABLE custom_notifications ADD COLUMN state TEXT NOT NULL DEFAULT 'pending'")
+        # Всё, что было до outbox, уже отправлено inline
+        await db.execute("UPDATE custom_notifications SET state='sent'")
+    if "attempts" not in cols:
+        await db.execute("ALTER TABLE custom_notifications ADD COLUMN attempts INTEGER NOT NULL DEFAULT 0")
+    if "last_error" not in cols:
+        await db.execute("ALTER TABLE custom_notifications ADD COLUMN last_error TEXT")
+    if "message_id" not in cols:
+        await db.execute("ALTER TABLE custom_notifications ADD COLUMN message_id INTEGER")
+    await db.execute("CREATE INDEX IF NOT EXISTS ix_custom_pending ON custom_notifications(id) WHERE state='pending'")
+
+
+async def m007_notification_batches(db: aiosqlite.Connection):
+    # Текст рассылки хранится один раз в батче, получатели ссылаются на него по batch_id
+    await db.execute(
+        "CREATE TABLE IF NOT EXISTS notification_batches ("
+        "id TEXT PRIMARY KEY, text TEXT NOT NULL, author_id INTEGER, created_at TEXT NOT NULL, "
+        "total INTEGER NOT NULL DEFAULT 0, acked INTEGER NOT NULL DEFAULT 0)"
+    )
+    await db.execute("CREATE INDEX IF NOT EXISTS ix_batches_created ON notification_batches(created_at)")
+    if "text" in await _columns(db, "custom_notifications"):
+        # Строки без batch_id (create_custom_notifications) группируем в батчи по (text, sent_at)
+        cur = await db.execute("SELECT DISTINCT text, sent_at FROM custom_notifications WHERE batch_id=''")
+        for text, sent_at in await cur.fetchall():
+            await db.execute(
+                "UPDATE custom_notifications SET batch_id=? WHERE batch_id='' AND text=? AND sent_at=?",
+                (uuid.uuid4().hex, text, sent_at)
+            )
+        await db.execute(
+            "INSERT OR IGNORE INTO notification_batches(id, text, created_at, total, acked) "
+            "SELECT batch_id, MIN(text), MIN(sent_at), COUNT(*), SUM(acknowledged) FROM custom_notifications GROUP BY batch_id"
+        )
+        await db.execute("ALTER TABLE custom_notifications DROP COLUMN text")
+    await db.execute(
+        "CREATE TRIGGER IF NOT EXISTS trg_custom_ai AFTER INSERT ON custom_notifications BEGIN "
+        "UPDATE notification_batches SET total=total+1, acked=acked+NEW.acknowledged WHERE id=NEW.batch_id; END"
+    )
+    await db.execute(
+        "CREATE TRIGGER IF NOT EXISTS trg_custom_au AFTER UPDATE OF acknowledged ON custom_notifications "
+        "WHEN NEW.acknowledged<>OLD.acknowledged BEGIN "
+        "UPDATE notification_batches SET acked=acked+NEW.acknowledged-OLD.acknowledged WHERE id=NEW.batch_id; END"
+    )
+    await db.execute(
+        "CREATE TRIGGER IF NOT EXISTS trg_custom_ad AFTER DELETE ON custom_notifications BEGIN "
+        "UPDATE notification_batches SET total=total-1, acked=acked-OLD.acknowledged WHERE id=OLD.batch_id; END"
+    )
+
+
+async def m008_row_counts(db: aiosqlite.Connection):
+    # Счётчики строк для пагинации: COUNT(*) по большой таблице на каждое перелистывание слишком дорог
+    await db.execute("CREATE TABLE IF NOT EXISTS row_counts (name TEXT PRIMARY KEY, n INTEGER NOT NULL DEFAULT 0)")
+    await db.execute(
+        "INSERT OR REPLACE INTO row_counts(name, n) VALUES "
+        "('users', (SELECT COUNT(*) FROM users)), "
+        "('notification_batches', (SELECT COUNT(*) FROM notification_batches))"
+    )
+    for table in ("users", "notification_batches"):
+        await db.execute(
+            f"CREATE TRIGGER IF NOT EXISTS trg_{table}_count_ai AFTER INSERT ON {table} BEGIN "
+            f"UPDATE row_counts SET n=n+1 WHERE name='{table}'; END"
+        )
+        await db.execute(
+            f"CREATE TRIGGER IF NOT EXISTS trg_{table}_count_ad AFTER DELETE ON {table} BEGIN "
+            f"UPDATE row_counts SET n=n-1 WHERE name='{table}'; END"
+        )
+
+
+async def m009_fsm_states(db: aiosqlite.Connection):
+    # Состояния FSM (services/fsm_storage.py); updated_at — unix-время последней записи, по нему TTL
+    await db.execute(
+        "CREATE TABLE IF NOT EXISTS fsm_states ("
+        "key TEXT PRIMARY KEY, state TEXT, data TEXT NOT NULL DEFAULT '{}', updated_at REAL NOT NULL)"
+    )
+    await db.execute("CREATE INDEX IF NOT EXISTS idx_fsm_states_updated ON fsm_states(updated_at)")
+
+
+async def m010_cache_invalidations(db: aiosqlite.Connection):
+    # Журнал изменений пользователей и настроек: процессы-воркеры по нему сбрасывают свои кэши.
+    # UPDATE OF без tg_id: upsert в get_or_create_user не должен попадать в журнал
+    await db.execute(
+        "CREATE TABLE IF NOT EXISTS cache_invalidations ("
+        "seq INTEGER PRIMARY KEY AUTOINCREMENT, tg_id INTEGER, created_at REAL NOT NULL DEFAULT (julianday('now')))"
+    )
+    await db.execute(
+        "CREATE TRIGGER IF NOT EXISTS trg_users_invalidate AFTER UPDATE OF "
+        "is_active, allow_dues_notifications, allow_vpn_notifications, show_status, show_dues, show_vpn, show_savings ON users BEGIN "
+        "INSERT INTO cache_invalidations(tg_id) VALUES (NEW.tg_id); END"
+    )
+    # tg_id NULL — перечитать settings
+    await db.execute(
+        "CREATE TRIGGER IF NOT EXISTS trg_settings_invalidate_ai AFTER INSERT ON settings BEGIN "
+        "INSERT INTO cache_invalidations(tg_id) VALUES (NULL); END"
+    )
+    await db.execute(
+        "CREATE TRIGGER IF NOT EXISTS trg_settings_invalidate_au AFTER UPDATE ON settings BEGIN "
+        "INSERT INTO cache_invalidations(tg_id) VALUES (NULL); END"
+    )
+
+
+async def m011_users_unreachable(db: aiosqlite.Connection):
+    # Когда доставка пользователю стала невозможной (заблокировал бота, удалил аккаунт, chat not found); NULL — доступен
+    if "unreachable_at" not in await _columns(db, "users"):
+        await db.execute("ALTER TABLE users ADD COLUMN unreachable_at TEXT")
+    # В кэше пользователей есть флаг доступности: воркеры сбрасывают его так же, как остальные поля
+    await db.execute(
+        "CREATE TRIGGER IF NOT EXISTS trg_users_unreachable_invalidate AFTER UPDATE OF unreachable_at ON users BEGIN "
+        "INSERT INTO cache_invalidations(tg_id) VALUES (NEW.tg_id); END"
+    )
+    # active_user_ids: аудитория «все активные» — покрывающий частичный индекс
+    await db.execute("CREATE INDEX IF NOT EXISTS ix_users_reachable ON users(tg_id) WHERE is_active=1 AND unreachable_at IS NULL")
+
+
+async def m012_payments_user_index(db: aiosqlite.Connection):
+    # Импорт оплат из CSV: поиск уже записанных оплат по (пользователь, тип, дата)
+    await db.execute("CREATE INDEX IF NOT EXISTS ix_payments_user ON payments(user_id, type, paid_at)")
+
+
+async def m013_outbox_retry_at(db: aiosqlite.Connection):
+    # Время (unix) следующей попытки доставки: неудачная отправка повторяется с задержкой, а не сразу
+    if "next_attempt_at" not in await _columns(db, "custom_notifications"):
+        await db.execute("ALTER TABLE custom_notifications ADD COLUMN next_attempt_at REAL NOT NULL DEFAULT 0")
+
+
+Migration = tuple[int, str, Callable[[aiosqlite.Connection], Awaitable[None]]]
+
+# Только дописывать в конец; применённые шаги не менять
+MIGRATIONS: list[Migration] = [
+    (1, "baseline", m001_baseline),
+    (2, "user_visibility_columns", m002_user_visibility_columns),
+    (3, "reminders_unique", m003_reminders_unique),
+    (4, "hot_query_indexes", m004_hot_query_indexes),
+    (5, "payment_totals", m005_payment_totals),
+    (6, "custom_outbox", m006_custom_outbox),
+    (7, "notification_batches", m007_notification_batches),
+    (8, "row_counts", m008_row_counts),
+    (9, "fsm_states", m009_fsm_states),
+    (10, "cache_invalidations", m010_cache_invalidations),
+    (11, "users_unreachable", m011_users_unreachable),
+    (12, "payments_user_index", m012_payments_user_index),
+    (13, "outbox_retry_at", m013_outbox_retry_at),
+]
+
+
+async def current_version(db: aiosqlite.Connection) -> int:
+    cur = await db.execute("SELECT COALESCE(MAX(version), 0) FROM schema_version")
+    row = await cur.fetchone()
+    return int(row[0])
+
+
+async def run_migrations(db: aiosqlite.Connection) -> list[int]:
+    await db.execute(
+        "CREATE TABLE IF NOT EXISTS schema_version ("
+        "version INTEGER PRIMARY KEY, name TEXT NOT NULL, applied_at TEXT NOT NULL)"
+    )
+    await db.commit()
+    version = await current_version(db)
+    applied = []
+    for step, name, fn in MIGRATIONS:
+        if step <= version:
+            continue
+        # Каждый шаг — отдельная транзакция вместе с записью в schema_version
+        await db.execute("BEGIN")
+        try:
+            await fn(db)
+            await db.execute(
+                "INSERT INTO schema_version(version, name, applied_at) VALUES (?,?,?)",
+                (step, name, datetime.now().isoformat())
+            )
+            await db.commit()
+        except Exception as e:
+            await db.rollback()
+            raise RuntimeError(f"Migration {step} ({name}) failed: {e}") from e
+        logging.info(f"DB migration applied: {step} {name}")
+        applied.append(step)
+    return applied
@@ -0,0 +1,83 @@
+import asyncio
+import time
+from contextlib import asynccontextmanager
+from typing import Callable, Optional
+import aiosqlite
+
+# Профиль PRAGMA по умолчанию: WAL + умеренный кэш + mmap
+DEFAULT_PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "cache_size": -16000,
+    "mmap_size": 67108864,
+    "busy_timeout": 5000,
+}
+
+
+class ConnectionPool:
+    def __init__(self, db_path: str, size: int = 4, pragmas: Optional[dict] = None):
+        self.db_path = db_path
+        self.size = max(1, size)
+        self.pragmas = dict(DEFAULT_PRAGMAS if pragmas is None else pragmas)
+        self._idle: asyncio.Queue[aiosqlite.Connection] = asyncio.Queue()
+        self._all: list[aiosqlite.Connection] = []
+        self._closed = True
+        # Вызывается с временем удержания соединения (с) при каждом возврате в пул
+        self.on_release: Optional[Callable[[float], None]] = None
+
+    async def _connect(self) -> aiosqlite.Connection:
+        db = await aiosqlite.connect(self.db_path)
+        db.row_factory = aiosqlite.Row
+        # journal_mode первым: остальные pragma применяются уже к WAL-соединению
+        for key in sorted(self.pragmas, key=lambda k: k != "journal_mode"):
+            value = self.pragmas[key]
+            if value is None or value == "":
+                continue
+            await db.execute(f"PRAGMA {key}={value}")
+        return db
+
+    async def open(self):
+        if not self._closed:
+            return
+        for _ in range(self.size):
+            db = await self._connect()
+            self._all.append(db)
+            self._idle.put_nowait(db)
+        self._closed = False
+
+    async def close(self):
+        self._closed = True
+        while not self._idle.empty():
+            self._idle.get_nowait()
+        for db in self._all:
+            await db.close()
+        self._all.clear()
+
+    @asynccontextmanager
+    async def standalone(self):
+        # Отдельное соединение вне пула — для DDL до открытия пула
+        db = await self._connect()
+        try:
+            yield db
+        finally:
+            await db.close()
+
+    @property
+    def is_open(self) -> bool:
+        return not self._closed
+
+    @asynccontextmanager
+    async def acquire(self):
+        if self._closed:
+            raise RuntimeError("Connection pool is not open")
+        db = await self._idle.get()
+        started = time.perf_counter()
+        try:
+            yield db
+        finally:
+            # Незавершённая транзакция не должна утечь к следующему пользователю соединения
+            if db.in_transaction:
+                await db.rollback()
+            self._idle.put_nowait(db)
+            if self.on_release is not None:
+                self.on_release(time.perf_counter() - started)
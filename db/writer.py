@@ -0,0 +1,166 @@
+import asyncio
+import time
+from typing import Any, Awaitable, Callable, Optional
+import aiosqlite
+from db.instrument import CallRecord, TracedConnection
+
+# Операция записи: получает соединение писателя внутри открытой транзакции, commit не делает;
+# может выполниться повторно, если пакет откатился из-за чужой ошибки
+WriteOp = Callable[[Any], Awaitable[Any]]
+
+
+class DBWriter:
+    # Единственный писатель: все изменения идут через очередь в одну задачу с собственным соединением.
+    # Накопленные за max_delay (или max_batch штук) операции фиксируются одной транзакцией — один fsync
+    # на пакет вместо commit на каждый вызов. Ошибка одной операции откатывает пакет, и он повторяется
+    # без неё, поэтому операция — только SQL без побочных эффектов снаружи. Результат — после COMMIT.
+    def __init__(self, connect: Callable[[], Awaitable[aiosqlite.Connection]], max_batch: int = 100, max_delay: float = 0.002):
+        self._connect = connect
+        self.max_batch = max(1, max_batch)
+        self.max_delay = max_delay
+        self._queue: asyncio.Queue = asyncio.Queue()
+        self._full = asyncio.Event()
+        self._db: Optional[aiosqlite.Connection] = None
+        self._task: Optional[asyncio.Task] = None
+        # (секунды на транзакцию, операций в ней) — например гистограммы в /metrics
+        self.on_commit: Optional[Callable[[float, int], None]] = None
+        self.on_error: Optional[Callable[[Exception], None]] = None
+        self.commits = 0
+        self.ops = 0
+        self.failed_commits = 0
+
+    @property
+    def depth(self) -> int:
+        return self._queue.qsize()
+
+    @property
+    def is_open(self) -> bool:
+        return self._task is not None
+
+    async def open(self):
+        if self._task is not None:
+            return
+        self._db = await self._connect()
+        self._task = asyncio.create_task(self._run(), name="db-writer")
+
+    async def close(self):
+        # Уже поставленные операции дописываются
+        if self._task is None:
+            return
+        self._queue.put_nowait(None)
+        self._full.set()
+        await self._task
+        self._task = None
+        await self._db.close()
+        self._db = None
+
+    async def set_trace_callback(self, callback: Optional[Callable[[str], None]]):
+        # SQL соединения писателя (например для проверки планов в bench/query_plans.py)
+        if self._db is None:
+            raise RuntimeError("DB writer is not open")
+        await self._db.set_trace_callback(callback)
+
+    async def submit(self, op: WriteOp, call: Optional[CallRecord] = None) -> Any:
+        if self._task is None:
+            raise RuntimeError("DB writer is not open")
+        future = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait((op, call, future))
+        # С уже взятой писателем операцией набирается полный пакет
+        if self._queue.qsize() >= self.max_batch - 1:
+            self._full.set()
+        return await future
+
+    async def _run(self):
+        while True:
+            item = await self._queue.get()
+            if item is None:
+                return
+            if self.max_delay > 0 and self._queue.qsize() < self.max_batch - 1:
+                # Окно группировки: ждём попутчиков, но не дольше max_delay
+                self._full.clear()
+                try:
+                    await asyncio.wait_for(self._full.wait(), self.max_delay)
+                except asyncio.TimeoutError:
+                    pass
+            batch = [item]
+            stop = False
+            while len(batch) < self.max_batch and not self._queue.empty():
+                item = self._queue.get_nowait()
+                if item is None:
+                    stop = True
+                    break
+                batch.append(item)
+            await self._commit(batch)
+            if stop:
+                # Стоп-маркер мог прийти посреди очереди: дописать хвост
+                while not self._queue.empty():
+                    item = self._queue.get_nowait()
+                    if item is not None:
+                        await self._commit([item])
+                return
+
+    async def _commit(self, batch: list):
+        started = time.perf_counter()
+        pending = list(batch)
+        failed: list[tuple[asyncio.Future, Exception]] = []
+        while True:
+            try:
+                results = await self._transaction(pending)
+                break
+            except _OpFailed as e:
+                # Откат всего пакета и повтор без упавшей операции: SAVEPOINT на каждую операцию
+                # стоил бы ещё двух обращений к потоку SQLite на каждую
+                failed.append((e.future, e.error))
+                pending = [item for item in pending if item[2] is not e.future]
+            except Exception as e:
+                # BEGIN/COMMIT не прошли (например database is locked другим процессом) — падает весь пакет,
+                # а уже отсеянные операции получают свою ошибку, а не эту
+                self.failed_commits += 1
+                if self.on_error is not None:
+                    self.on_error(e)
+                for future, error in failed:
+                    if not future.done():
+                        future.set_exception(error)
+                for _, _, future in pending:
+                    if not future.done():
+                        future.set_exception(e)
+                return
+        elapsed = time.perf_counter() - started
+        if pending:
+            self.commits += 1
+            self.ops += len(pending)
+            if self.on_commit is not None:
+                self.on_commit(elapsed, len(pending))
+        for future, result in results:
+            if not future.done():
+                future.set_result(result)
+        for future, error in failed:
+            if not future.done():
+                future.set_exception(error)
+
+    async def _transaction(self, batch: list) -> list:
+        if not batch:
+            return []
+        db = self._db
+        results = []
+        await db.execute("BEGIN IMMEDIATE")
+        try:
+            for op, call, future in batch:
+                conn = TracedConnection(db, call) if call is not None else db
+                try:
+                    results.append((future, await op(conn)))
+                except Exception as e:
+                    raise _OpFailed(future, e) from e
+            await db.commit()
+        except BaseException:
+            if db.in_transaction:
+                await db.rollback()
+            raise
+        return results
+
+
+class _OpFailed(Exception):
+    def __init__(self, future: asyncio.Future, error: Exception):
+        super().__init__(str(error))
+        self.future = future
+        self.error = error
@@ -2,29 +2,112 @@ import asyncio
 import logging
 from datetime import time
 import re
-import aiosqlite
+import tempfile
 from aiogram import Bot, Dispatcher, F
-from aiogram.types import Message, CallbackQuery
+from aiogram.types import Message, CallbackQuery, BufferedInputFile
 from aiogram.fsm.state import State, StatesGroup
 from aiogram.fsm.context import FSMContext
-from aiogram.filters import Command
+from aiogram.filters import Command, StateFilter
+from aiogram.fsm.storage.memory import MemoryStorage
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from apscheduler.triggers.cron import CronTrigger
 
 from bot_config import config
-from db.dao import DAO
-from services.reminders import send_daily_reminders, ack_callback_data
-from ui.keyboards import main_menu, notifications_menu, admin_menu, reply_menu_button, status_toggle_menu, admin_users_page_keyboard, admin_user_actions_keyboard, custom_notify_audience_keyboard, custom_history_page_keyboard, batch_actions_keyboard, ack_custom_keyboard
-from ui.messages import welcome_message, access_granted_message, access_denied_message, status_message, admin_prompt_paid, admin_prompt_savings, saved_message, marked_message, admin_prompt_schedule, schedule_updated, status_hidden_message, admin_prompt_status_visibility, status_visibility_changed, admin_users_list, admin_user_status_toggled, component_toggled, custom_notify_intro, custom_notify_enter_ids, custom_notify_enter_text, custom_notify_sent, custom_notify_invalid_ids, custom_history_list, batch_resend_result, custom_acknowledged, admin_prompt_vpn_amount, admin_vpn_amount_updated, admin_prompt_dues_amount, admin_dues_amount_updated
+from db.dao import DAO, User
+from services.reminders import ACK_PREFIX, send_daily_reminders, ack_callback_data, reminder_slot_times
+from services.delivery import FanOutSender, TokenBucket
+from services.middlewares import UserMiddleware, ConcurrencyLimitMiddleware, HandlerMetricsMiddleware, ApiMetricsMiddleware
+from services.metrics import REGISTRY, DB_SECONDS, DAO_SECONDS, DB_WRITE_QUEUE, DB_COMMIT_SECONDS, DB_COMMIT_OPS, DB_COMMIT_ERRORS, SCHEDULER_NEXT_RUN, Liveness, start_metrics_server, check_with_timeout
+from services.outbox import OutboxWorker
+from services.fsm_storage import SQLiteStorage
+from services.cluster import Supervisor, CacheSync, run_supervised, run_worker
+from services.webhook import run_webhook
+from services.payment_import import check_payments_csv
+from services.export import parse_export_args, send_export, ExportRequest
+from ui.keyboards import main_menu, notifications_menu, admin_menu, reply_menu_button, status_toggle_menu, admin_users_page_keyboard, admin_user_actions_keyboard, custom_notify_audience_keyboard, custom_history_page_keyboard, batch_progress_keyboard, payment_import_keyboard, export_keyboard, parse_page_cursor
+from ui.messages import welcome_message, access_granted_message, access_denied_message, status_message, admin_prompt_paid, admin_prompt_savings, saved_message, marked_message, admin_prompt_schedule, schedule_updated, status_hidden_message, admin_prompt_status_visibility, status_visibility_changed, admin_users_list, admin_user_status_toggled, component_toggled, custom_notify_intro, custom_notify_enter_ids, custom_notify_enter_text, custom_notify_invalid_ids, custom_history_list, custom_acknowledged, admin_prompt_vpn_amount, admin_vpn_amount_updated, admin_prompt_dues_amount, admin_dues_amount_updated, cache_stats_message, payment_totals_report, custom_notify_queued, batch_progress_message, batch_requeued, dao_stats_message, payment_import_prompt, payment_import_summary, payment_import_errors_file, payment_import_done, payment_import_changed, export_help, export_empty, export_failed
 ADMIN_USERS_PAGE_SIZE = 10
 
-bot = Bot(token=config.bot_token)
-dp = Dispatcher()
-dao = DAO(config.db_path)
+if config.telegram_api_url:
+    # Локальный Bot API server (или фейковый в бенчмарках)
+    bot = Bot(token=config.bot_token, session=AiohttpSession(api=TelegramAPIServer.from_base(config.telegram_api_url)))
+else:
+    bot = Bot(token=config.bot_token)
+dao = DAO(
+    config.db_path,
+    pool_size=config.db_pool_size,
+    pragmas=config.sqlite_pragmas(),
+    user_cache_size=config.user_cache_size,
+    user_cache_ttl=config.user_cache_ttl,
+    slow_query_ms=config.db_slow_query_ms,
+    stats_window=config.db_stats_window,
+    write_batch=config.db_write_batch,
+    write_delay_ms=config.db_write_delay_ms,
+)
+# Состояния админских сценариев переживают рестарт: хранятся в той же SQLite
+if config.fsm_storage == "sqlite":
+    fsm_storage = SQLiteStorage(dao, flush_interval=config.fsm_flush_interval, ttl=config.fsm_state_ttl)
+else:
+    fsm_storage = MemoryStorage()
+dp = Dispatcher(storage=fsm_storage)
 scheduler = AsyncIOScheduler()
+sender = FanOutSender(
+    rate=config.send_rate,
+    concurrency=config.send_concurrency,
+    per_chat_interval=config.send_per_chat_interval,
+    max_retries=config.send_max_retries,
+)
+# Потолок частоты ежедневных напоминаний поверх SEND_RATE, общий для всех слотов окна
+reminder_ceiling = TokenBucket(config.reminder_max_rate, capacity=1) if config.reminder_max_rate > 0 else None
+outbox = OutboxWorker(
+    bot, dao, sender,
+    chunk_size=config.outbox_chunk_size,
+    poll_interval=config.outbox_poll_interval,
+    max_attempts=config.outbox_max_attempts,
+    retry_delay=config.outbox_retry_delay,
+    admin_ids=config.admin_ids,
+)
+
+# Кэши этого процесса догоняют изменения, сделанные другими воркерами
+cache_sync = CacheSync(dao, interval=config.cache_sync_interval, prune=config.is_leader)
+supervisor = Supervisor(config.workers, leader_ids=config.admin_ids) if config.is_supervisor else None
+
+metrics_runner = None
+# Живость транспорта апдейтов для /healthz
+transport = Liveness()
+POLL_STALE_AFTER = 60
+LOG_FORMAT = f"%(asctime)s [%(levelname)s] {f'w{config.worker_index} ' if config.worker_index >= 0 else ''}%(message)s"
 
 ACCESS_DENIED = access_denied_message()
 
+def _keyset_window(rows: list, size: int, after, before) -> tuple[list, bool, bool]:
+    # rows запрошены с запасом в одну строку: она означает, что в этом направлении есть ещё страница
+    more = len(rows) > size
+    if before is not None:
+        return rows[-size:], more, True
+    return rows[:size], after is not None, more
+
+bot.session.middleware(ApiMetricsMiddleware(transport))
+dao.pool.on_release = DB_SECONDS.observe
+
+def observe_commit(seconds: float, ops: int):
+    DB_COMMIT_SECONDS.observe(seconds)
+    DB_COMMIT_OPS.observe(ops)
+
+dao.writer.on_commit = observe_commit
+dao.writer.on_error = lambda e: DB_COMMIT_ERRORS.inc(error=type(e).__name__)
+dao.stats.observer = lambda method, seconds: DAO_SECONDS.observe(seconds, method=method)
+dp.message.middleware(HandlerMetricsMiddleware("message"))
+dp.callback_query.middleware(HandlerMetricsMiddleware("callback_query"))
+# Пользователь-отправитель резолвится один раз на апдейт и передаётся в хэндлеры как `user`
+dp.message.middleware(UserMiddleware(dao))
+dp.callback_query.middleware(UserMiddleware(dao))
+if config.update_concurrency > 0:
+    dp.update.outer_middleware(ConcurrencyLimitMiddleware(config.update_concurrency))
+
 class AdminPaidDues(StatesGroup):
     waiting_input = State()
 
@@ -52,10 +135,12 @@ class AdminVpnAmount(StatesGroup):
 class AdminDuesAmount(StatesGroup):
     waiting_input = State()
 
+class AdminImportPayments(StatesGroup):
+    waiting_file = State()
+    waiting_confirm = State()
+
 @dp.message(Command("start"))
-async def cmd_start(message: Message):
-    await dao.init()
-    user = await dao.get_or_create_user(message.from_user.id)
+async def cmd_start(message: Message, user: User):
     logging.info(f"/start from tg_id={message.from_user.id}; user_active={user.is_active}")
     if user.is_active:
         kb = main_menu(is_admin=message.from_user.id in config.admin_ids)
@@ -68,10 +153,9 @@ async def cmd_start(message: Message):
     else:
         await message.answer(welcome_message())
 
-@dp.message(F.text)
-async def handle_text(message: Message):
-    await dao.init()
-    user = await dao.get_or_create_user(message.from_user.id)
+# Только вне FSM: иначе этот хэндлер перехватывает ввод админских сценариев
+@dp.message(StateFilter(None), F.text)
+async def handle_text(message: Message, user: User):
     text = (message.text or "").strip()
     logging.info(f"text from tg_id={message.from_user.id}: '{text}' | user_active={user.is_active}")
     if not user.is_active:
@@ -164,13 +248,32 @@ async def handle_text(message: Message):
             return
         await dao.set_savings(amount)
         await message.answer("Обновлено")
+    elif text.lower().startswith("/check_totals"):
+        if message.from_user.id not in config.admin_ids:
+            await message.answer("Только админ")
+            return
+        fix = text.lower().split()[1:] == ["fix"]
+        drift = await dao.check_payment_totals(fix=fix)
+        if drift:
+            logging.warning(f"payment totals drift: {drift}; fixed={fix}")
+        await message.answer(payment_totals_report(drift, fix))
+    elif text.lower().startswith("/export"):
+        if message.from_user.id not in config.admin_ids:
+            await message.answer("Только админ")
+            return
+        try:
+            request = parse_export_args(text.partition(" ")[2])
+        except ValueError as e:
+            await message.answer(f"⚠ {e}")
+            await message.answer(export_help(), parse_mode="Markdown")
+            return
+        await run_export(message.chat.id, request)
 
 # Главное меню
 @dp.callback_query(F.data == "menu_status")
-async def menu_status(cb: CallbackQuery):
-    u = await dao.get_or_create_user(cb.from_user.id)
-    show = await dao.get_show_status(u.id)
-    vis = await dao.get_component_visibility(u.id)
+async def menu_status(cb: CallbackQuery, user: User):
+    show = user.show_status
+    vis = user.visibility()
     if not show:
         await cb.message.edit_text(status_hidden_message(), reply_markup=status_toggle_menu(show))
     else:
@@ -190,18 +293,14 @@ async def menu_status(cb: CallbackQuery):
     await cb.answer()
 
 @dp.callback_query(F.data == "menu_notifications")
-async def menu_notifications(cb: CallbackQuery):
-    user = await dao.get_or_create_user(cb.from_user.id)
-    show = await dao.get_show_status(user.id)
-    kb = notifications_menu(user.allow_dues_notifications, user.allow_vpn_notifications, show)
+async def menu_notifications(cb: CallbackQuery, user: User):
+    kb = notifications_menu(user.allow_dues_notifications, user.allow_vpn_notifications, user.show_status)
     await cb.message.edit_text("🔔 Уведомления", reply_markup=kb)
     await cb.answer()
 @dp.callback_query(F.data == "toggle_status")
-async def toggle_status(cb: CallbackQuery):
-    u = await dao.get_or_create_user(cb.from_user.id)
-    show = await dao.get_show_status(u.id)
-    await dao.set_show_status(u.id, not show)
-    new_show = await dao.get_show_status(u.id)
+async def toggle_status(cb: CallbackQuery, user: User):
+    new_show = not user.show_status
+    await dao.set_show_status(user.id, new_show)
     if not new_show:
         await cb.message.edit_text(status_hidden_message(), reply_markup=status_toggle_menu(new_show))
     else:
@@ -260,21 +359,18 @@ async def custom_notify_text_all(message: Message, state: FSMContext):
     if not text:
         await message.answer("Текст не может быть пустым")
         return
-    ids = await dao.active_user_ids()
     from datetime import datetime
     sent_at = datetime.now().isoformat()
     import uuid
     batch_id = uuid.uuid4().hex
-    created = await dao.create_custom_notifications_batch(text, ids, sent_at, batch_id)
-    count = 0
-    for tg_id, notif_id in created:
-        try:
-            await bot.send_message(tg_id, text, reply_markup=ack_custom_keyboard(notif_id))
-            count += 1
-        except Exception:
-            pass
+    created = 0
+    # Аудитория читается порциями; каждая сразу ставится в очередь, и OutboxWorker начинает
+    # доставку первой, пока следующие ещё читаются и записываются
+    async for ids in dao.iter_active_user_ids():
+        created += len(await dao.create_custom_notifications_batch(text, ids, sent_at, batch_id, author_id=message.from_user.id))
+        outbox.wake()
     await state.clear()
-    await message.answer(custom_notify_sent(count))
+    await message.answer(custom_notify_queued(batch_id, created), reply_markup=batch_progress_keyboard(batch_id))
 
 @dp.message(AdminCustomAudience.waiting_text_list)
 async def custom_notify_text_list(message: Message, state: FSMContext):
@@ -288,33 +384,47 @@ async def custom_notify_text_list(message: Message, state: FSMContext):
     sent_at = datetime.now().isoformat()
     import uuid
     batch_id = uuid.uuid4().hex
-    created = await dao.create_custom_notifications_batch(text, ids, sent_at, batch_id)
-    count = 0
-    for tg_id, notif_id in created:
-        try:
-            await bot.send_message(tg_id, text, reply_markup=ack_custom_keyboard(notif_id))
-            count += 1
-        except Exception:
-            pass
+    created = await dao.create_custom_notifications_batch(text, ids, sent_at, batch_id, author_id=message.from_user.id)
+    outbox.wake()
     await state.clear()
-    await message.answer(custom_notify_sent(count))
+    await message.answer(custom_notify_queued(batch_id, len(created)), reply_markup=batch_progress_keyboard(batch_id))
+
+@dp.callback_query(F.data.startswith("batch_progress_"))
+async def batch_progress(cb: CallbackQuery):
+    if cb.from_user.id not in config.admin_ids:
+        await cb.answer("Недостаточно прав", show_alert=True)
+        return
+    batch_id = cb.data.replace("batch_progress_", "")
+    progress = await dao.batch_progress(batch_id)
+    try:
+        await cb.message.edit_text(batch_progress_message(batch_id, progress), reply_markup=batch_progress_keyboard(batch_id))
+    except TelegramBadRequest:
+        # message is not modified — прогресс не изменился
+        pass
+    await cb.answer()
 
 @dp.callback_query(F.data.startswith("admin_custom_history_"))
 async def custom_history(cb: CallbackQuery):
     if cb.from_user.id not in config.admin_ids:
         await cb.answer("Недостаточно прав", show_alert=True)
         return
-    try:
-        page = int(cb.data.split("_")[-1])
-    except Exception:
-        page = 1
-    total_batches = await dao.count_batches()
+    page, after, before = parse_page_cursor(cb.data, "admin_custom_history_")
     PAGE_SIZE = 5
-    total_pages = max(1, (total_batches + PAGE_SIZE - 1) // PAGE_SIZE)
-    page = max(1, min(page, total_pages))
-    batches = await dao.list_batches(page, PAGE_SIZE)
+    # Одна лишняя строка показывает, есть ли страница дальше в направлении перелистывания
+    batches = await dao.list_batches(PAGE_SIZE + 1, after=after, before=before)
+    if not batches and (after is not None or before is not None):
+        page, after, before = 1, None, None
+        batches = await dao.list_batches(PAGE_SIZE + 1)
+    batches, has_prev, has_next = _keyset_window(batches, PAGE_SIZE, after, before)
+    total_pages = max(1, (await dao.count_batches() + PAGE_SIZE - 1) // PAGE_SIZE)
+    if not has_prev:
+        page = 1
     text = custom_history_list(f"История (стр. {page})", batches)
-    kb = custom_history_page_keyboard(page, total_pages)
+    kb = custom_history_page_keyboard(
+        page, total_pages,
+        batches[0]["seq"] if has_prev else None,
+        batches[-1]["seq"] if has_next else None,
+    )
     await cb.message.edit_text(text, reply_markup=kb)
     await cb.answer()
 
@@ -324,32 +434,23 @@ async def resend_batch(cb: CallbackQuery):
         await cb.answer("Недостаточно прав", show_alert=True)
         return
     batch_id = cb.data.replace("resend_batch_", "")
-    unacked = await dao.unacked_in_batch(batch_id)
-    attempted = len(unacked)
-    sent = 0
-    for item in unacked:
-        try:
-            notif = await dao.get_custom_notif(item["notif_id"])
-            if notif:
-                await bot.send_message(item["tg_id"], notif["text"], reply_markup=ack_custom_keyboard(item["notif_id"]))
-                sent += 1
-        except Exception:
-            pass
-    await cb.message.edit_text(batch_resend_result(batch_id, attempted, sent), reply_markup=batch_actions_keyboard(batch_id))
+    requeued = await dao.requeue_unacked(batch_id)
+    outbox.wake()
+    await cb.message.edit_text(batch_requeued(batch_id, requeued), reply_markup=batch_progress_keyboard(batch_id))
     await cb.answer("Готово")
 
 @dp.callback_query(F.data.startswith("ackc_"))
-async def ack_custom(cb: CallbackQuery):
+async def ack_custom(cb: CallbackQuery, user: User):
     notif_id = cb.data.replace("ackc_", "")
     try:
         notif_id_int = int(notif_id)
     except ValueError:
         await cb.answer("Ошибка", show_alert=True)
         return
-    user = await dao.get_or_create_user(cb.from_user.id)
     await dao.acknowledge_custom(user.id, notif_id_int)
     await cb.message.edit_text(custom_acknowledged())
-    await cb.answer("OK")
+    # Возвращённый метод в webhook-режиме уходит в ответе на апдейт, в polling — выполняется диспетчером
+    return cb.answer("OK")
 
 @dp.message(AdminStatusVisibility.waiting_input)
 async def handle_admin_status_visibility(message: Message, state: FSMContext):
@@ -374,16 +475,21 @@ async def menu_admin(cb: CallbackQuery):
         if cb.from_user.id not in config.admin_ids:
             await cb.answer("Недостаточно прав", show_alert=True)
             return
-        try:
-            page = int(cb.data.split("_")[-1])
-        except Exception:
+        page, after, before = parse_page_cursor(cb.data, "admin_users_page_")
+        users = await dao.users_page(ADMIN_USERS_PAGE_SIZE + 1, after=after or 0, before=before)
+        if not users and (after is not None or before is not None):
+            page, after, before = 1, None, None
+            users = await dao.users_page(ADMIN_USERS_PAGE_SIZE + 1)
+        users, has_prev, has_next = _keyset_window(users, ADMIN_USERS_PAGE_SIZE, after, before)
+        total_pages = max(1, (await dao.total_users() + ADMIN_USERS_PAGE_SIZE - 1) // ADMIN_USERS_PAGE_SIZE)
+        if not has_prev:
             page = 1
-        total = await dao.total_users()
-        total_pages = max(1, (total + ADMIN_USERS_PAGE_SIZE - 1) // ADMIN_USERS_PAGE_SIZE)
-        page = max(1, min(page, total_pages))
-        users = await dao.users_page(page, ADMIN_USERS_PAGE_SIZE)
         text = admin_users_list(f"Пользователи (страница {page})", users)
-        kb = admin_users_page_keyboard(page, total_pages)
+        kb = admin_users_page_keyboard(
+            page, total_pages,
+            users[0]["id"] if has_prev else None,
+            users[-1]["id"] if has_next else None,
+        )
         await cb.message.edit_text(text, reply_markup=kb)
         await cb.answer()
 
@@ -398,10 +504,7 @@ async def menu_admin(cb: CallbackQuery):
             await cb.answer("Ошибка ID")
             return
         # Получаем tg_id
-        async with aiosqlite.connect(config.db_path) as db:
-            db.row_factory = aiosqlite.Row
-            cur = await db.execute("SELECT id, tg_id, show_status FROM users WHERE id=?", (user_id,))
-            row = await cur.fetchone()
+        row = await dao.get_user_row(user_id)
         if not row:
             await cb.answer("Не найден")
             return
@@ -423,10 +526,7 @@ async def menu_admin(cb: CallbackQuery):
         except Exception:
             await cb.answer("Ошибка данных")
             return
-        async with aiosqlite.connect(config.db_path) as db:
-            db.row_factory = aiosqlite.Row
-            cur = await db.execute("SELECT id, tg_id FROM users WHERE id=?", (user_id,))
-            row = await cur.fetchone()
+        row = await dao.get_user_row(user_id)
         if not row:
             await cb.answer("Не найден")
             return
@@ -446,6 +546,112 @@ async def menu_admin(cb: CallbackQuery):
     await cb.message.edit_text("🛠 Админ-панель", reply_markup=kb)
     await cb.answer()
 
+@dp.callback_query(F.data == "admin_cache_stats")
+async def admin_cache_stats(cb: CallbackQuery):
+    if cb.from_user.id not in config.admin_ids:
+        await cb.answer("Недостаточно прав", show_alert=True)
+        return
+    await cb.message.edit_text(cache_stats_message(dao.users.stats()), reply_markup=admin_menu())
+    await cb.answer()
+
+@dp.callback_query(F.data == "admin_db_stats")
+async def admin_db_stats(cb: CallbackQuery):
+    if cb.from_user.id not in config.admin_ids:
+        await cb.answer("Недостаточно прав", show_alert=True)
+        return
+    await cb.message.edit_text(dao_stats_message(dao.stats.summary(), dao.stats.window), reply_markup=admin_menu())
+    await cb.answer()
+
+@dp.callback_query(F.data == "admin_import_payments")
+async def admin_import_payments(cb: CallbackQuery, state: FSMContext):
+    if cb.from_user.id not in config.admin_ids:
+        await cb.answer("Недостаточно прав", show_alert=True)
+        return
+    await state.set_state(AdminImportPayments.waiting_file)
+    await cb.message.edit_text(payment_import_prompt(config.payment_import_max_rows), parse_mode="Markdown", reply_markup=payment_import_keyboard(False))
+    await cb.answer()
+
+payment_import_lock = asyncio.Lock()
+
+async def check_payment_file(file_id: str):
+    # Файл не держится в памяти целиком: больше 1 МБ — на диск, разбор построчно
+    with tempfile.SpooledTemporaryFile(max_size=1 << 20) as raw:
+        await bot.download(file_id, destination=raw)
+        return await check_payments_csv(dao, raw, config.payment_import_max_rows)
+
+@dp.message(StateFilter(AdminImportPayments.waiting_file, AdminImportPayments.waiting_confirm), F.document)
+async def handle_payment_import_file(message: Message, state: FSMContext):
+    check = await check_payment_file(message.document.file_id)
+    text = payment_import_summary(len(check.lines), check.totals(), check.new_users, check.errors)
+    await message.answer(text, reply_markup=payment_import_keyboard(check.ok))
+    if len(check.errors) > 20:
+        report = payment_import_errors_file(check.errors).encode()
+        await message.answer_document(BufferedInputFile(report, filename="import_errors.txt"))
+    if check.ok:
+        # В состоянии только file_id: при подтверждении файл разбирается и проверяется заново
+        await state.update_data(import_file_id=message.document.file_id)
+        await state.set_state(AdminImportPayments.waiting_confirm)
+    else:
+        await state.set_state(AdminImportPayments.waiting_file)
+
+@dp.message(AdminImportPayments.waiting_file)
+async def handle_payment_import_not_file(message: Message):
+    await message.answer("Пришлите CSV-файл документом или нажмите «Отмена»")
+
+@dp.callback_query(AdminImportPayments.waiting_confirm, F.data == "payments_import_apply")
+async def payments_import_apply(cb: CallbackQuery, state: FSMContext):
+    if cb.from_user.id not in config.admin_ids:
+        await cb.answer("Недостаточно прав", show_alert=True)
+        return
+    await cb.answer()
+    # Повторное нажатие не должно записать файл дважды: второе видит уже сброшенное состояние
+    async with payment_import_lock:
+        file_id = (await state.get_data()).get("import_file_id")
+        if not file_id:
+            return
+        await state.clear()
+        check = await check_payment_file(file_id)
+        if not check.ok:
+            await state.set_state(AdminImportPayments.waiting_file)
+            await cb.message.edit_text(payment_import_changed(), reply_markup=payment_import_keyboard(False))
+            return
+        result = await dao.import_payments([(p.tg_id, p.type, p.amount, p.paid_at) for p in check.lines])
+    logging.info(f"payments import by {cb.from_user.id}: {result}")
+    await cb.message.edit_text(payment_import_done(result["payments"], result["new_users"]), reply_markup=admin_menu())
+
+@dp.callback_query(F.data == "payments_import_cancel")
+async def payments_import_cancel(cb: CallbackQuery, state: FSMContext):
+    await state.clear()
+    await cb.message.edit_text("🛠 Админ-панель", reply_markup=admin_menu())
+    await cb.answer()
+
+@dp.callback_query(F.data == "admin_export")
+async def admin_export(cb: CallbackQuery):
+    if cb.from_user.id not in config.admin_ids:
+        await cb.answer("Недостаточно прав", show_alert=True)
+        return
+    await cb.message.edit_text(export_help(), parse_mode="Markdown", reply_markup=export_keyboard())
+    await cb.answer()
+
+async def run_export(chat_id: int, request: ExportRequest):
+    # Строки читаются порциями через пул, файл пишется вне цикла событий — другие апдейты не ждут
+    try:
+        rows = await send_export(bot, dao, chat_id, request, config.export_spool_bytes)
+    except ValueError as e:
+        await bot.send_message(chat_id, export_failed(str(e)))
+        return
+    logging.info(f"export {request.filename} to {chat_id}: {rows} rows")
+    if not rows:
+        await bot.send_message(chat_id, export_empty())
+
+@dp.callback_query(F.data.in_({"export_payments", "export_reminders", "export_notifications"}))
+async def export_all(cb: CallbackQuery):
+    if cb.from_user.id not in config.admin_ids:
+        await cb.answer("Недостаточно прав", show_alert=True)
+        return
+    await cb.answer("Готовлю файл…")
+    await run_export(cb.message.chat.id, ExportRequest(cb.data.removeprefix("export_")))
+
 @dp.callback_query(F.data == "back_main")
 async def back_main(cb: CallbackQuery):
     kb = main_menu(is_admin=cb.from_user.id in config.admin_ids)
@@ -454,22 +660,18 @@ async def back_main(cb: CallbackQuery):
 
 # Тогглы уведомлений
 @dp.callback_query(F.data == "toggle_dues")
-async def toggle_dues(cb: CallbackQuery):
-    user = await dao.get_or_create_user(cb.from_user.id)
-    await dao.set_notifications(user.id, dues=not user.allow_dues_notifications)
-    user = await dao.get_or_create_user(cb.from_user.id)
-    show = await dao.get_show_status(user.id)
-    kb = notifications_menu(user.allow_dues_notifications, user.allow_vpn_notifications, show)
+async def toggle_dues(cb: CallbackQuery, user: User):
+    allow_dues = not user.allow_dues_notifications
+    await dao.set_notifications(user.id, dues=allow_dues)
+    kb = notifications_menu(allow_dues, user.allow_vpn_notifications, user.show_status)
     await cb.message.edit_reply_markup(reply_markup=kb)
     await cb.answer("Сохранено")
 
 @dp.callback_query(F.data == "toggle_vpn")
-async def toggle_vpn(cb: CallbackQuery):
-    user = await dao.get_or_create_user(cb.from_user.id)
-    await dao.set_notifications(user.id, vpn=not user.allow_vpn_notifications)
-    user = await dao.get_or_create_user(cb.from_user.id)
-    show = await dao.get_show_status(user.id)
-    kb = notifications_menu(user.allow_dues_notifications, user.allow_vpn_notifications, show)
+async def toggle_vpn(cb: CallbackQuery, user: User):
+    allow_vpn = not user.allow_vpn_notifications
+    await dao.set_notifications(user.id, vpn=allow_vpn)
+    kb = notifications_menu(user.allow_dues_notifications, allow_vpn, user.show_status)
     await cb.message.edit_reply_markup(reply_markup=kb)
     await cb.answer("Сохранено")
 
@@ -507,8 +709,9 @@ async def admin_schedule(cb: CallbackQuery, state: FSMContext):
         await cb.answer("Недостаточно прав", show_alert=True)
         return
     hour, minute = await dao.get_schedule_time()
+    window = await dao.get_reminder_window()
     await state.set_state(AdminSchedule.waiting_input)
-    await cb.message.edit_text(admin_prompt_schedule(hour, minute), parse_mode="Markdown")
+    await cb.message.edit_text(admin_prompt_schedule(hour, minute, window), parse_mode="Markdown")
     await cb.answer()
 
 @dp.callback_query(F.data == "admin_vpn_amount")
@@ -538,33 +741,18 @@ async def admin_dues_amount(cb: CallbackQuery, state: FSMContext):
 
 @dp.message(AdminSchedule.waiting_input)
 async def handle_admin_schedule_input(message: Message, state: FSMContext):
-    try:
-        raw = (message.text or "").strip()
-        parts = raw.split(":")
-        hour = int(parts[0]); minute = int(parts[1])
-        if not (0 <= hour <= 23 and 0 <= minute <= 59):
-            raise ValueError()
-    except Exception:
-        await message.answer("Введите время как `HH:MM`", parse_mode="Markdown")
+    # `HH:MM` — все напоминания разом, `HH:MM-HH:MM` — окно, по которому рассылка распределяется
+    m = re.fullmatch(r"(\d{1,2}):(\d{2})(?:\s*[-–—]\s*(\d{1,2}):(\d{2}))?", (message.text or "").strip())
+    times = [int(x) for x in m.groups() if x is not None] if m else []
+    if not times or any(h > 23 or mm > 59 for h, mm in zip(times[::2], times[1::2])):
+        await message.answer("Введите время как `HH:MM` или окно как `HH:MM-HH:MM`", parse_mode="Markdown")
         return
-    await dao.set_schedule_time(hour, minute)
-    # Пересоздать job
-    try:
-        scheduler.remove_job("daily_reminders")
-    except Exception:
-        pass
-    vpn_amt = await dao.get_vpn_amount()
-    if vpn_amt == 0 and config.vpn_amount > 0:
-        vpn_amt = config.vpn_amount
-    scheduler.add_job(
-        send_daily_reminders,
-        CronTrigger(hour=hour, minute=minute, timezone=config.timezone),
-        args=[bot, dao, config.timezone, config.dues_amount, vpn_amt],
-        id="daily_reminders",
-        replace_existing=True,
-    )
+    hour, minute = times[0], times[1]
+    window = ((times[2] * 60 + times[3]) - (hour * 60 + minute)) % (24 * 60) if len(times) == 4 else 0
+    await dao.set_schedule_time(hour, minute, window)
+    await schedule_daily_reminders()
     await state.clear()
-    await message.answer(schedule_updated(hour, minute))
+    await message.answer(schedule_updated(hour, minute, window))
 
 @dp.message(AdminVpnAmount.waiting_input)
 async def handle_admin_vpn_amount_input(message: Message, state: FSMContext):
@@ -576,19 +764,8 @@ async def handle_admin_vpn_amount_input(message: Message, state: FSMContext):
         return
     amount = int(m.group(0))
     await dao.set_vpn_amount(amount)
-    # Пересоздать задачу с новой суммой (время берём из настроек)
-    hour, minute = await dao.get_schedule_time()
-    try:
-        scheduler.remove_job("daily_reminders")
-    except Exception:
-        pass
-    scheduler.add_job(
-        send_daily_reminders,
-        CronTrigger(hour=hour, minute=minute, timezone=config.timezone),
-        args=[bot, dao, config.timezone, config.dues_amount, amount],
-        id="daily_reminders",
-        replace_existing=True,
-    )
+    # Пересоздать задачи с новой суммой (время берём из настроек)
+    await schedule_daily_reminders()
     await state.clear()
     await message.answer(admin_vpn_amount_updated(amount))
     # Показать повторно админ-меню для удобства
@@ -604,22 +781,8 @@ async def handle_admin_dues_amount_input(message: Message, state: FSMContext):
         return
     amount = int(m.group(0))
     await dao.set_dues_amount(amount)
-    # Пересоздать задачу с новой суммой сбора
-    hour, minute = await dao.get_schedule_time()
-    try:
-        scheduler.remove_job("daily_reminders")
-    except Exception:
-        pass
-    vpn_amt = await dao.get_vpn_amount()
-    if vpn_amt == 0 and config.vpn_amount > 0:
-        vpn_amt = config.vpn_amount
-    scheduler.add_job(
-        send_daily_reminders,
-        CronTrigger(hour=hour, minute=minute, timezone=config.timezone),
-        args=[bot, dao, config.timezone, amount, vpn_amt],
-        id="daily_reminders",
-        replace_existing=True,
-    )
+    # Пересоздать задачи с новой суммой сбора
+    await schedule_daily_reminders()
     await state.clear()
     await message.answer(admin_dues_amount_updated(amount))
     kb = admin_menu()
@@ -668,42 +831,167 @@ async def handle_admin_savings_input(message: Message, state: FSMContext):
     await message.answer(saved_message())
 
 @dp.callback_query(F.data.startswith("ack_"))
-async def on_ack(cb: CallbackQuery):
-    await dao.init()
+async def on_ack(cb: CallbackQuery, user: User):
     type_ = cb.data.replace("ack_", "")
-    user = await dao.get_or_create_user(cb.from_user.id)
     await dao.upsert_reminder(user_id=user.id, type_=type_, acknowledged=True, last_sent_at=None)
     await cb.message.answer("Спасибо, отмечено.")
-    await cb.answer()
+    return cb.answer()
+
+@dp.callback_query(F.data == "noop")
+async def on_noop(cb: CallbackQuery):
+    # Кнопка-счётчик страниц: только снять «часики»
+    return cb.answer()
+
+def collect_scheduler_metrics():
+    for job in scheduler.get_jobs():
+        if job.next_run_time is not None:
+            SCHEDULER_NEXT_RUN.set(job.next_run_time.timestamp(), job=job.id)
+
+REGISTRY.on_collect(collect_scheduler_metrics)
+
+def collect_writer_metrics():
+    DB_WRITE_QUEUE.set(dao.writer.depth)
+
+REGISTRY.on_collect(collect_writer_metrics)
+
+async def health() -> tuple[bool, dict]:
+    if supervisor is not None:
+        alive = supervisor.alive()
+        age = transport.age()
+        details = {"mode": "supervisor", "workers": ["ok" if a else "down" for a in alive], "last_poll_age": None if age is None else round(age, 1)}
+        return all(alive) and age is not None and age < POLL_STALE_AFTER, details
+    db_error = await check_with_timeout(dao.ping(), 2.0)
+    details = {"db": db_error or "ok", "mode": config.bot_mode}
+    ok = db_error is None
+    if config.is_leader:
+        details["scheduler"] = "ok" if scheduler.running else "stopped"
+        ok = ok and scheduler.running
+    if config.worker_index >= 0:
+        details["worker"] = config.worker_index
+        details["updates_pipe"] = "ok" if transport.running else "down"
+        ok = ok and transport.running
+    elif config.bot_mode == "webhook":
+        details["webhook"] = "ok" if transport.running else "down"
+        ok = ok and transport.running
+    else:
+        age = transport.age()
+        details["last_poll_age"] = None if age is None else round(age, 1)
+        ok = ok and age is not None and age < POLL_STALE_AFTER
+    return ok, details
 
 async def on_startup():
-    await dao.init()
-    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
-    logging.info("Bot startup: init DB and scheduler")
+    logging.basicConfig(level=logging.INFO, format=LOG_FORMAT)
+    # Миграции строго до открытия пула; ошибка миграции останавливает запуск.
+    # Воркеров запускает супервизор уже после миграций
+    if config.worker_index < 0:
+        applied = await dao.migrate()
+        logging.info(f"DB schema migrations applied: {applied or 'none'}")
+    await dao.open()
+    cache_sync.start()
+    if config.is_leader:
+        await start_leader_jobs()
+    if isinstance(fsm_storage, SQLiteStorage):
+        await fsm_storage.start()
+    global metrics_runner
+    if config.metrics_port:
+        # У воркеров свои порты: METRICS_PORT+1+индекс
+        port = config.metrics_port + 1 + config.worker_index if config.worker_index >= 0 else config.metrics_port
+        metrics_runner = await start_metrics_server(config.metrics_host, port, health)
+
+async def schedule_daily_reminders():
+    # Задача на каждый слот окна рассылки: пользователь попадает в слот по хэшу id (db.dao.user_slot).
+    # Слот 0 сохраняет прежний id задачи
+    for job in scheduler.get_jobs():
+        if job.id.startswith("daily_reminders"):
+            job.remove()
     hour, minute = await dao.get_schedule_time()
-    vpn_amt = await dao.get_vpn_amount()
+    window = await dao.get_reminder_window()
+    # Подтянуть динамические суммы из БД с fallback на .env
+    dues_amt = await dao.get_dues_amount() or config.dues_amount
+    vpn_amt = await dao.get_vpn_amount() or config.vpn_amount
+    times = reminder_slot_times(hour, minute, window, config.reminder_slot_minutes)
+    for slot, (slot_hour, slot_minute) in enumerate(times):
+        scheduler.add_job(
+            send_daily_reminders,
+            CronTrigger(hour=slot_hour, minute=slot_minute, timezone=config.timezone),
+            args=[bot, dao, config.timezone, dues_amt, vpn_amt],
+            kwargs={"sender": sender, "slot": slot, "slots": len(times), "ceiling": reminder_ceiling, "admin_ids": config.admin_ids},
+            id="daily_reminders" if slot == 0 else f"daily_reminders_{slot}",
+            replace_existing=True,
+        )
+    logging.info(
+        f"Scheduler configured: daily_reminders at {hour:02d}:{minute:02d}, window {window} min, "
+        f"{len(times)} slot(s) tz={config.timezone}"
+    )
+
+async def start_leader_jobs():
+    logging.info("Bot startup: init DB and scheduler")
     # Инициализация из конфига если в БД не задано
-    if vpn_amt == 0 and config.vpn_amount > 0:
+    if await dao.get_vpn_amount() == 0 and config.vpn_amount > 0:
         await dao.set_vpn_amount(config.vpn_amount)
-        vpn_amt = config.vpn_amount
-    # Подтянуть динамические суммы из БД с fallback на .env
-    dues_amt = await dao.get_dues_amount()
-    if dues_amt == 0 and config.dues_amount > 0:
+    if await dao.get_dues_amount() == 0 and config.dues_amount > 0:
         await dao.set_dues_amount(config.dues_amount)
-        dues_amt = config.dues_amount
-    scheduler.add_job(
-        send_daily_reminders,
-        CronTrigger(hour=hour, minute=minute, timezone=config.timezone),
-        args=[bot, dao, config.timezone, dues_amt, vpn_amt],
-        id="daily_reminders",
-        replace_existing=True,
-    )
-    logging.info(f"Scheduler configured: daily_reminders at {hour:02d}:{minute:02d} tz={config.timezone}")
+    await schedule_daily_reminders()
     scheduler.start()
+    # Недоставленные после рестарта уведомления подхватываются сразу
+    outbox.start()
+
+async def on_shutdown():
+    global metrics_runner
+    if metrics_runner is not None:
+        await metrics_runner.cleanup()
+        metrics_runner = None
+    await outbox.stop()
+    await cache_sync.stop()
+    if scheduler.running:
+        scheduler.shutdown(wait=False)
+    # Последний flush FSM до закрытия пула
+    await fsm_storage.close()
+    await dao.close()
+
+async def run_supervisor():
+    logging.basicConfig(level=logging.INFO, format=LOG_FORMAT)
+    applied = await dao.migrate()
+    logging.info(f"DB schema migrations applied: {applied or 'none'}")
+    global metrics_runner
+    if config.metrics_port:
+        metrics_runner = await start_metrics_server(config.metrics_host, config.metrics_port, health)
+    try:
+        await bot.delete_webhook()
+        logging.info(f"Supervisor mode: {config.workers} workers, leader=0")
+        await run_supervised(supervisor, bot, dp.resolve_used_update_types(), liveness=transport)
+    finally:
+        if metrics_runner is not None:
+            await metrics_runner.cleanup()
+            metrics_runner = None
 
 async def main():
+    if supervisor is not None:
+        await run_supervisor()
+        return
     await on_startup()
-    await dp.start_polling(bot)
+    try:
+        if config.worker_index >= 0:
+            await run_worker(dp, bot, liveness=transport, max_in_flight=config.worker_max_in_flight)
+        elif config.bot_mode == "webhook":
+            await run_webhook(
+                dp, bot,
+                url=config.webhook_url,
+                path=config.webhook_path,
+                secret=config.webhook_secret,
+                host=config.webhook_host,
+                port=config.webhook_port,
+                max_connections=config.webhook_max_connections,
+                # В теле ответа — только подтверждения и «часики» (хэндлеры с return cb.answer())
+                reply_prefixes=(ACK_PREFIX, "ackc_", "noop") if config.webhook_reply_in_response else (),
+                liveness=transport,
+            )
+        else:
+            # Установленный ранее webhook блокирует getUpdates
+            await bot.delete_webhook()
+            await dp.start_polling(bot)
+    finally:
+        await on_shutdown()
 
 if __name__ == "__main__":
     asyncio.run(main())
@@ -0,0 +1,231 @@
+import asyncio
+import logging
+import os
+import signal
+import sys
+import time
+import zlib
+from typing import Optional, Sequence
+from aiogram import Bot, Dispatcher
+from aiogram.methods import TelegramMethod
+from aiogram.types import Update
+from db.dao import DAO
+from services.metrics import Liveness
+
+
+def update_user_id(update: Update) -> Optional[int]:
+    try:
+        event = update.event
+    except Exception:
+        return None
+    user = getattr(event, "from_user", None)
+    if user is not None:
+        return user.id
+    chat = getattr(event, "chat", None)
+    return chat.id if chat is not None else None
+
+
+def shard_for(tg_id: Optional[int], workers: int, leader_ids: Sequence[int] = ()) -> int:
+    # Один пользователь — всегда один воркер: порядок его апдейтов и его FSM-состояние живут в одном процессе.
+    # Админы — на лидера: их сценарии перенастраивают планировщик, который работает только там
+    if tg_id is None or tg_id in leader_ids:
+        return 0
+    return zlib.crc32(str(tg_id).encode()) % workers
+
+
+class Supervisor:
+    # Принимающий процесс: getUpdates и раздача апдейтов N воркерам (`main.py` с WORKER_INDEX) через stdin.
+    # Апдейт — строка JSON; очередь на воркера — pipe, полный pipe притормаживает приём (backpressure).
+    def __init__(self, workers: int, leader_ids: Sequence[int] = (), argv: Optional[list[str]] = None, restart_delay: float = 1.0):
+        self.workers = workers
+        self.leader_ids = set(leader_ids)
+        self.argv = argv or [sys.executable, os.path.abspath(sys.argv[0])]
+        self.restart_delay = restart_delay
+        self._procs: list[Optional[asyncio.subprocess.Process]] = [None] * workers
+        self._monitors: list[asyncio.Task] = []
+        self._stopping = False
+        self.routed = [0] * workers
+        self.dropped = 0
+        self.restarts = 0
+
+    async def start(self):
+        for index in range(self.workers):
+            await self._spawn(index)
+            self._monitors.append(asyncio.create_task(self._monitor(index), name=f"worker-{index}-monitor"))
+
+    async def _spawn(self, index: int):
+        env = {**os.environ, "WORKER_INDEX": str(index)}
+        self._procs[index] = await asyncio.create_subprocess_exec(*self.argv, stdin=asyncio.subprocess.PIPE, env=env)
+        logging.info(f"cluster: worker {index} started, pid={self._procs[index].pid}")
+
+    async def _monitor(self, index: int):
+        while True:
+            code = await self._procs[index].wait()
+            if self._stopping:
+                return
+            # Апдейты, уже записанные в pipe упавшего воркера, потеряны
+            logging.error(f"cluster: worker {index} exited with code {code}, restarting")
+            self.restarts += 1
+            await asyncio.sleep(self.restart_delay)
+            await self._spawn(index)
+
+    def alive(self) -> list[bool]:
+        return [p is not None and p.returncode is None for p in self._procs]
+
+    async def route(self, update: Update):
+        index = shard_for(update_user_id(update), self.workers, self.leader_ids)
+        proc = self._procs[index]
+        try:
+            proc.stdin.write(update.model_dump_json(exclude_unset=True).encode() + b"\n")
+            await proc.stdin.drain()
+        except (ConnectionError, AttributeError):
+            self.dropped += 1
+            logging.error(f"cluster: worker {index} is down, update {update.update_id} dropped")
+            return
+        self.routed[index] += 1
+
+    async def run_polling(self, bot: Bot, allowed_updates: list[str], liveness: Optional[Liveness] = None, timeout: int = 30):
+        offset = None
+        backoff = 1.0
+        while True:
+            try:
+                updates = await bot.get_updates(offset=offset, timeout=timeout, allowed_updates=allowed_updates)
+            except Exception as e:
+                logging.error(f"cluster: getUpdates failed: {type(e).__name__}: {e}")
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, 30.0)
+                continue
+            backoff = 1.0
+            if liveness is not None:
+                liveness.touch()
+            for update in updates:
+                await self.route(update)
+                offset = update.update_id + 1
+
+    async def stop(self, timeout: float = 30.0):
+        # EOF в stdin: воркер дорабатывает принятые апдейты и завершается сам
+        self._stopping = True
+        for task in self._monitors:
+            task.cancel()
+        for proc in self._procs:
+            if proc is not None and proc.returncode is None:
+                proc.stdin.close()
+        for index, proc in enumerate(self._procs):
+            if proc is None:
+                continue
+            try:
+                await asyncio.wait_for(proc.wait(), timeout)
+            except asyncio.TimeoutError:
+                logging.warning(f"cluster: worker {index} did not stop in {timeout}s, killing")
+                proc.kill()
+                await proc.wait()
+
+
+async def run_supervised(supervisor: Supervisor, bot: Bot, allowed_updates: list[str], liveness: Optional[Liveness] = None):
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop.set)
+        except (NotImplementedError, RuntimeError):
+            pass
+    await supervisor.start()
+    polling = asyncio.create_task(supervisor.run_polling(bot, allowed_updates, liveness), name="cluster-polling")
+    try:
+        await stop.wait()
+    finally:
+        polling.cancel()
+        try:
+            await polling
+        except asyncio.CancelledError:
+            pass
+        await supervisor.stop()
+        await bot.session.close()
+
+
+async def run_worker(dp: Dispatcher, bot: Bot, liveness: Optional[Liveness] = None, max_in_flight: int = 256):
+    # Воркер: апдейты из stdin, по одному на строку. Апдейты одного пользователя обрабатываются строго
+    # по очереди, разных — параллельно; не больше max_in_flight одновременно, дальше ждёт pipe.
+    loop = asyncio.get_running_loop()
+    try:
+        # Ctrl+C приходит всей группе процессов; воркер завершается по EOF от супервизора
+        loop.add_signal_handler(signal.SIGINT, lambda: None)
+    except (NotImplementedError, RuntimeError):
+        pass
+    reader = asyncio.StreamReader(limit=2 ** 22)
+    await loop.connect_read_pipe(lambda: asyncio.StreamReaderProtocol(reader), sys.stdin)
+    slots = asyncio.Semaphore(max_in_flight)
+    locks: dict[Optional[int], tuple[asyncio.Lock, list[int]]] = {}
+    tasks: set[asyncio.Task] = set()
+
+    async def process(update: Update):
+        key = update_user_id(update)
+        lock, users = locks.setdefault(key, (asyncio.Lock(), [0]))
+        users[0] += 1
+        try:
+            # Задачи стартуют в порядке создания, а Lock отдаёт очередь по порядку ожидания
+            async with lock:
+                result = await dp.feed_update(bot, update)
+                if isinstance(result, TelegramMethod):
+                    await bot(result)
+        except Exception:
+            logging.exception(f"cluster: update {update.update_id} failed")
+        finally:
+            users[0] -= 1
+            if not users[0]:
+                del locks[key]
+            slots.release()
+
+    if liveness is not None:
+        liveness.running = True
+    try:
+        while line := await reader.readline():
+            if liveness is not None:
+                liveness.touch()
+            update = Update.model_validate_json(line, context={"bot": bot})
+            await slots.acquire()
+            task = asyncio.create_task(process(update))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+        if tasks:
+            await asyncio.gather(*tasks)
+    finally:
+        if liveness is not None:
+            liveness.running = False
+        await bot.session.close()
+
+
+class CacheSync:
+    # Фоновое чтение cache_invalidations: кэш пользователей и снимок settings в этом процессе
+    # не отстают от изменений других процессов дольше чем на interval. Лидер ещё и чистит журнал.
+    def __init__(self, dao: DAO, interval: float = 1.0, prune: bool = False, retain: float = 3600.0):
+        self.dao = dao
+        self.interval = interval
+        self.prune = prune
+        self.retain = retain
+        self._last_prune = time.monotonic()
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run(), name="cache-sync")
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.dao.sync_invalidations()
+                if self.prune and time.monotonic() - self._last_prune >= self.retain / 4:
+                    self._last_prune = time.monotonic()
+                    await self.dao.prune_invalidations(self.retain)
+            except Exception:
+                logging.exception("cache sync failed")
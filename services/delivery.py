@@ -0,0 +1,214 @@
+import asyncio
+import logging
+import time
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterable, Awaitable, Callable, Iterable, Optional, Union
+import aiohttp
+from aiogram.exceptions import (
+    TelegramBadRequest,
+    TelegramForbiddenError,
+    TelegramNetworkError,
+    TelegramNotFound,
+    TelegramRetryAfter,
+    TelegramServerError,
+)
+
+# Глобальный лимит Bot API ~30 сообщений/с, в один чат — не чаще 1 сообщения/с
+DEFAULT_RATE = 30.0
+DEFAULT_PER_CHAT_INTERVAL = 1.0
+
+# Классы ошибок доставки
+UNREACHABLE = "unreachable"    # бот заблокирован, аккаунт удалён, чата нет — повторять бессмысленно
+RATE_LIMITED = "rate_limited"  # RetryAfter, повторы исчерпаны
+TRANSIENT = "transient"        # сеть, 5xx, таймауты — повторяется
+ERROR = "error"                # прочее (например, некорректный запрос)
+
+# Bad Request, которые означают, что получателя больше нет
+_UNREACHABLE_MESSAGES = ("chat not found", "user not found", "peer_id_invalid", "user is deactivated")
+
+
+def classify_error(error: BaseException) -> str:
+    if isinstance(error, TelegramForbiddenError):
+        return UNREACHABLE
+    if isinstance(error, (TelegramBadRequest, TelegramNotFound)):
+        message = str(error).lower()
+        return UNREACHABLE if any(m in message for m in _UNREACHABLE_MESSAGES) else ERROR
+    if isinstance(error, TelegramRetryAfter):
+        return RATE_LIMITED
+    if isinstance(error, (TelegramNetworkError, TelegramServerError, aiohttp.ClientError, asyncio.TimeoutError)):
+        return TRANSIENT
+    return ERROR
+
+
+def describe_error(error: BaseException) -> str:
+    return f"{type(error).__name__}: {error}"
+
+
+@dataclass
+class RunSummary:
+    sent: int = 0
+    failed: int = 0
+    # Часть failed: получатель недоступен навсегда (classify_error -> UNREACHABLE)
+    unreachable: int = 0
+    retried: int = 0
+    wall_time: float = 0.0
+    started_at: float = field(default_factory=time.monotonic, repr=False)
+
+    @property
+    def total(self) -> int:
+        return self.sent + self.failed
+
+    @property
+    def throughput(self) -> float:
+        return self.total / self.wall_time if self.wall_time > 0 else 0.0
+
+    def merge(self, other: "RunSummary") -> "RunSummary":
+        self.sent += other.sent
+        self.failed += other.failed
+        self.unreachable += other.unreachable
+        self.retried += other.retried
+        self.wall_time += other.wall_time
+        return self
+
+    def __str__(self) -> str:
+        return (
+            f"sent={self.sent} failed={self.failed} unreachable={self.unreachable} retried={self.retried} "
+            f"wall={self.wall_time:.2f}s rate={self.throughput:.1f}/s"
+        )
+
+
+class TokenBucket:
+    def __init__(self, rate: float = DEFAULT_RATE, capacity: Optional[float] = None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else rate
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def _refill(self, now: float):
+        if now > self._updated:
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self._paused_until:
+                    await asyncio.sleep(self._paused_until - now)
+                    continue
+                self._refill(now)
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+    def pause(self, seconds: float):
+        # RetryAfter касается всего бота, поэтому останавливаем всю корзину
+        until = time.monotonic() + seconds
+        if until > self._paused_until:
+            self._paused_until = until
+            self._tokens = 0
+            self._updated = until
+
+
+Job = tuple[int, Any]  # (chat_id, произвольный контекст)
+SendFn = Callable[[int, Any], Awaitable[Any]]
+ResultFn = Callable[[int, Any, Any, Optional[BaseException]], Awaitable[None]]
+
+
+class FanOutSender:
+    def __init__(
+        self,
+        rate: float = DEFAULT_RATE,
+        concurrency: int = 16,
+        per_chat_interval: float = DEFAULT_PER_CHAT_INTERVAL,
+        max_retries: int = 3,
+        bucket: Optional[TokenBucket] = None,
+    ):
+        self.bucket = bucket or TokenBucket(rate)
+        self.concurrency = max(1, concurrency)
+        self.per_chat_interval = per_chat_interval
+        self.max_retries = max_retries
+        self._chat_next: dict[int, float] = {}
+
+    async def _chat_slot(self, chat_id: int):
+        now = time.monotonic()
+        if len(self._chat_next) > 10000:
+            self._chat_next = {k: v for k, v in self._chat_next.items() if v > now}
+        ready_at = max(now, self._chat_next.get(chat_id, 0.0))
+        self._chat_next[chat_id] = ready_at + self.per_chat_interval
+        if ready_at > now:
+            await asyncio.sleep(ready_at - now)
+
+    async def _deliver(self, chat_id: int, ctx: Any, send: SendFn, summary: RunSummary):
+        attempt = 0
+        while True:
+            await self._chat_slot(chat_id)
+            await self.bucket.acquire()
+            try:
+                result = await send(chat_id, ctx)
+                summary.sent += 1
+                return result, None
+            except TelegramRetryAfter as e:
+                self.bucket.pause(e.retry_after)
+                if attempt >= self.max_retries:
+                    summary.failed += 1
+                    return None, e
+                attempt += 1
+                summary.retried += 1
+                logging.warning(f"flood control: pause {e.retry_after}s (chat {chat_id}, attempt {attempt})")
+            except Exception as e:
+                kind = classify_error(e)
+                if kind == TRANSIENT and attempt < self.max_retries:
+                    attempt += 1
+                    summary.retried += 1
+                    await asyncio.sleep(min(0.5 * 2 ** attempt, 10.0))
+                    continue
+                summary.failed += 1
+                if kind == UNREACHABLE:
+                    summary.unreachable += 1
+                return None, e
+
+    async def run(
+        self,
+        jobs: Union[Iterable[Job], AsyncIterable[Job]],
+        send: SendFn,
+        on_result: Optional[ResultFn] = None,
+    ) -> RunSummary:
+        summary = RunSummary()
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self.concurrency * 2)
+
+        async def worker():
+            while True:
+                job = await queue.get()
+                try:
+                    if job is None:
+                        return
+                    chat_id, ctx = job
+                    result, error = await self._deliver(chat_id, ctx, send, summary)
+                    if on_result is not None:
+                        try:
+                            await on_result(chat_id, ctx, result, error)
+                        except Exception:
+                            logging.exception(f"delivery result handler failed for chat {chat_id}")
+                finally:
+                    queue.task_done()
+
+        workers = [asyncio.create_task(worker()) for _ in range(self.concurrency)]
+        try:
+            if hasattr(jobs, "__aiter__"):
+                async for job in jobs:
+                    await queue.put(job)
+            else:
+                for job in jobs:
+                    await queue.put(job)
+            for _ in workers:
+                await queue.put(None)
+            await asyncio.gather(*workers)
+        finally:
+            for w in workers:
+                w.cancel()
+        summary.wall_time = time.monotonic() - summary.started_at
+        return summary
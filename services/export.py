@@ -0,0 +1,127 @@
+import asyncio
+import csv
+import io
+import tempfile
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta
+from typing import AsyncGenerator, BinaryIO, Optional
+from aiogram import Bot
+from aiogram.types.input_file import DEFAULT_CHUNK_SIZE, InputFile
+from db.dao import DAO, EXPORT_COLUMNS, EXPORT_TYPES
+from services.payment_import import TYPE_ALIASES
+from ui.messages import export_caption
+
+# Лимит Bot API на документ, отправленный ботом
+MAX_DOCUMENT_BYTES = 50 * 1024 * 1024
+KIND_ALIASES = {
+    "payments": "payments", "оплаты": "payments",
+    "reminders": "reminders", "напоминания": "reminders",
+    "notifications": "notifications", "уведомления": "notifications",
+}
+DATE_FORMATS = ("%Y-%m-%d", "%d.%m.%Y")
+
+
+@dataclass
+class ExportRequest:
+    kind: str
+    # Включительно; None — без границы
+    start: Optional[date] = None
+    end: Optional[date] = None
+    type: Optional[str] = None
+
+    @property
+    def since(self) -> Optional[str]:
+        return self.start.isoformat() if self.start else None
+
+    @property
+    def until(self) -> Optional[str]:
+        # Даты в БД — ISO-строки со временем: конец дня end = начало следующего
+        return (self.end + timedelta(days=1)).isoformat() if self.end else None
+
+    @property
+    def filename(self) -> str:
+        parts = [self.kind, self.start.isoformat() if self.start else "all"]
+        if self.end and self.end != self.start:
+            parts.append(self.end.isoformat())
+        if self.type:
+            parts.append(self.type)
+        return "_".join(parts) + ".csv"
+
+
+def _parse_day(raw: str) -> date:
+    for fmt in DATE_FORMATS:
+        try:
+            return datetime.strptime(raw, fmt).date()
+        except ValueError:
+            continue
+    raise ValueError(f"дата «{raw}» не распознана (ожидается ГГГГ-ММ-ДД или ДД.ММ.ГГГГ)")
+
+
+def parse_export_args(args: str) -> ExportRequest:
+    # "<что> [дата | дата..дата] [тип]"
+    tokens = args.split()
+    if not tokens:
+        raise ValueError("не указано, что выгружать")
+    kind = KIND_ALIASES.get(tokens[0].lower())
+    if kind is None:
+        raise ValueError(f"«{tokens[0]}» — ожидается payments, reminders или notifications")
+    request = ExportRequest(kind)
+    for token in tokens[1:]:
+        value = token.lower()
+        type_ = TYPE_ALIASES.get(value, value) if kind != "notifications" else value
+        if type_ in EXPORT_TYPES[kind]:
+            request.type = type_
+            continue
+        start, sep, end = token.partition("..")
+        request.start = _parse_day(start) if start else None
+        request.end = (_parse_day(end) if end else None) if sep else request.start
+        if request.start and request.end and request.start > request.end:
+            raise ValueError(f"начало периода {request.start} позже конца {request.end}")
+    return request
+
+
+async def write_export(dao: DAO, request: ExportRequest, out: BinaryIO, max_bytes: int = MAX_DOCUMENT_BYTES) -> int:
+    # Порции из курсора DAO сразу пишутся в out: память не зависит от числа строк.
+    # BOM и «;» — чтобы Excel открыл кириллицу и колонки без мастера импорта
+    text = io.TextIOWrapper(out, encoding="utf-8-sig", newline="")
+    writer = csv.writer(text, delimiter=";")
+
+    def write(rows) -> int:
+        writer.writerows(rows)
+        text.flush()
+        return out.tell()
+
+    rows = 0
+    try:
+        await asyncio.to_thread(write, [EXPORT_COLUMNS[request.kind]])
+        async for chunk in dao.iter_export(request.kind, request.since, request.until, request.type):
+            # Запись на диск (после переполнения буфера) — не в цикле событий
+            size = await asyncio.to_thread(write, chunk)
+            rows += len(chunk)
+            if size > max_bytes:
+                raise ValueError(f"файл больше {max_bytes // (1024 * 1024)} МБ — сузьте период или выберите тип")
+    finally:
+        text.detach()
+    return rows
+
+
+class SpooledInputFile(InputFile):
+    # Отправка из открытого файла (в т.ч. SpooledTemporaryFile) порциями, без чтения целиком
+    def __init__(self, file: BinaryIO, filename: str, chunk_size: int = DEFAULT_CHUNK_SIZE):
+        super().__init__(filename=filename, chunk_size=chunk_size)
+        self.file = file
+
+    async def read(self, bot: Bot) -> AsyncGenerator[bytes, None]:
+        self.file.seek(0)
+        while chunk := await asyncio.to_thread(self.file.read, self.chunk_size):
+            yield chunk
+
+
+async def send_export(bot: Bot, dao: DAO, chat_id: int, request: ExportRequest, spool_bytes: int) -> int:
+    # До spool_bytes файл собирается в памяти, дальше — во временном файле на диске.
+    # Пустая выгрузка не отправляется; возвращает число строк
+    with tempfile.SpooledTemporaryFile(max_size=spool_bytes) as out:
+        rows = await write_export(dao, request, out)
+        if rows:
+            await bot.send_document(chat_id, SpooledInputFile(out, request.filename), caption=export_caption(request.kind, rows))
+    return rows
@@ -0,0 +1,144 @@
+import asyncio
+import json
+import logging
+import time
+from dataclasses import dataclass, field
+from typing import Any, Dict, Optional
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, DefaultKeyBuilder, StateType, StorageKey
+from db.dao import DAO
+
+
+@dataclass
+class _Record:
+    state: Optional[str] = None
+    data: Dict[str, Any] = field(default_factory=dict)
+    # JSON data: сериализуется при записи, чтобы несериализуемые данные падали в хэндлере, а не во flush
+    raw: str = "{}"
+    updated_at: float = 0.0
+
+
+class SQLiteStorage(BaseStorage):
+    # FSM-хранилище в таблице fsm_states. Чтения — из памяти; изменения копятся и пишутся
+    # в БД одной транзакцией раз в flush_interval (write-behind) и при close().
+    # Состояния без записи дольше ttl считаются брошенными и удаляются.
+    # Кэш в памяти рассчитан на то, что ключи одного пользователя обслуживает один процесс.
+    def __init__(self, dao: DAO, flush_interval: float = 1.0, ttl: float = 86400.0, sweep_interval: float = 60.0):
+        self.dao = dao
+        self.flush_interval = flush_interval
+        self.ttl = ttl
+        self.sweep_interval = sweep_interval
+        self.key_builder = DefaultKeyBuilder(with_bot_id=True, with_business_connection_id=True, with_destiny=True)
+        self._records: dict[str, _Record] = {}
+        self._dirty: set[str] = set()
+        self._last_sweep = time.monotonic()
+        self._task: Optional[asyncio.Task] = None
+        self.flushes = 0
+        self.flushed_rows = 0
+
+    async def start(self):
+        # После dao.open(): поднимает неистёкшие состояния и запускает фоновый flush
+        since = time.time() - self.ttl if self.ttl > 0 else 0.0
+        for key, state, raw, updated_at in await self.dao.load_fsm_states(since):
+            self._records[key] = _Record(state, json.loads(raw), raw, updated_at)
+        logging.info(f"FSM storage: {len(self._records)} states loaded")
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run(), name="fsm-flush")
+
+    async def close(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except Exception:
+                logging.exception("FSM storage: flush failed")
+
+    def _expired(self, record: _Record, now: float) -> bool:
+        return self.ttl > 0 and record.updated_at < now - self.ttl
+
+    def _get(self, key: StorageKey) -> Optional[_Record]:
+        k = self.key_builder.build(key)
+        record = self._records.get(k)
+        if record is not None and self._expired(record, time.time()):
+            del self._records[k]
+            self._dirty.add(k)
+            return None
+        return record
+
+    def _put(self, key: StorageKey, state: Optional[str], data: Dict[str, Any], raw: str):
+        k = self.key_builder.build(key)
+        if state is None and not data:
+            # Пустая запись (state.clear()) в БД не хранится
+            self._records.pop(k, None)
+        else:
+            self._records[k] = _Record(state, data, raw, time.time())
+        self._dirty.add(k)
+
+    async def flush(self) -> int:
+        expired_before = None
+        if self.ttl > 0 and time.monotonic() - self._last_sweep >= self.sweep_interval:
+            self._last_sweep = time.monotonic()
+            now = time.time()
+            for k in [k for k, r in self._records.items() if self._expired(r, now)]:
+                del self._records[k]
+                self._dirty.add(k)
+            expired_before = now - self.ttl
+        if not self._dirty and expired_before is None:
+            return 0
+        keys, self._dirty = self._dirty, set()
+        upserts = []
+        deletes = []
+        for k in keys:
+            record = self._records.get(k)
+            if record is None:
+                deletes.append(k)
+            else:
+                upserts.append((k, record.state, record.raw, record.updated_at))
+        try:
+            await self.dao.save_fsm_states(upserts, deletes, expired_before)
+        except Exception:
+            # Ключи вернутся в следующий flush; более свежие значения возьмутся из памяти
+            self._dirty |= keys
+            raise
+        self.flushes += 1
+        self.flushed_rows += len(keys)
+        return len(keys)
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        state = state.state if isinstance(state, State) else state
+        record = self._get(key)
+        if record is None:
+            self._put(key, state, {}, "{}")
+        else:
+            self._put(key, state, record.data, record.raw)
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        record = self._get(key)
+        return record.state if record is not None else None
+
+    async def set_data(self, key: StorageKey, data: Dict[str, Any]) -> None:
+        raw = json.dumps(data, ensure_ascii=False)
+        record = self._get(key)
+        self._put(key, record.state if record is not None else None, data.copy(), raw)
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        record = self._get(key)
+        return record.data.copy() if record is not None else {}
+
+    def stats(self) -> dict:
+        return {
+            "states": len(self._records),
+            "dirty": len(self._dirty),
+            "flushes": self.flushes,
+            "flushed_rows": self.flushed_rows,
+        }
@@ -0,0 +1,202 @@
+import asyncio
+import logging
+import math
+import time
+from typing import Awaitable, Callable, Iterable, Optional
+from aiohttp import web
+
+# Минимальная реализация текстового формата Prometheus: счётчики, gauge и гистограммы с метками.
+# Всё обновляется из одного event loop, поэтому блокировки не нужны.
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: tuple, values: tuple, extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _number(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    type_ = ""
+
+    def __init__(self, name: str, help_: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.help = help_
+        self.labelnames = tuple(labelnames)
+        REGISTRY.register(self)
+
+    def _key(self, labels: dict) -> tuple:
+        return tuple(str(labels.get(n, "")) for n in self.labelnames)
+
+    def header(self) -> list[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.type_}"]
+
+
+class Counter(_Metric):
+    type_ = "counter"
+
+    def __init__(self, name: str, help_: str, labelnames: Iterable[str] = ()):
+        super().__init__(name, help_, labelnames)
+        self._values: dict[tuple, float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0)
+
+    def render(self) -> list[str]:
+        return self.header() + [
+            f"{self.name}{_labels(self.labelnames, key)} {_number(v)}" for key, v in sorted(self._values.items())
+        ]
+
+
+class Gauge(Counter):
+    type_ = "gauge"
+
+    def set(self, value: float, **labels):
+        self._values[self._key(labels)] = value
+
+
+class Histogram(_Metric):
+    type_ = "histogram"
+
+    def __init__(self, name: str, help_: str, labelnames: Iterable[str] = (), buckets: Iterable[float] = DEFAULT_BUCKETS):
+        super().__init__(name, help_, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+        # key -> (счётчики по бакетам, сумма, количество)
+        self._values: dict[tuple, tuple[list[int], float, int]] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        counts, total, count = self._values.get(key) or ([0] * len(self.buckets), 0.0, 0)
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                counts[i] += 1
+                break
+        self._values[key] = (counts, total + value, count + 1)
+
+    def samples(self, **labels) -> tuple[list[int], float, int]:
+        return self._values.get(self._key(labels)) or ([0] * len(self.buckets), 0.0, 0)
+
+    def render(self) -> list[str]:
+        lines = self.header()
+        for key, (counts, total, count) in sorted(self._values.items()):
+            cumulative = 0
+            for bound, c in zip(self.buckets, counts):
+                cumulative += c
+                le = 'le="' + _number(bound) + '"'
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, key)} {_number(total)}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, key)} {count}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: list[_Metric] = []
+        self._collectors: list[Callable[[], None]] = []
+
+    def register(self, metric: _Metric):
+        self._metrics.append(metric)
+
+    def on_collect(self, fn: Callable[[], None]):
+        # Значения, которые дешевле снять в момент запроса (например next_run_time планировщика)
+        self._collectors.append(fn)
+
+    def render(self) -> str:
+        for fn in self._collectors:
+            try:
+                fn()
+            except Exception:
+                logging.exception("metrics collector failed")
+        lines: list[str] = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+HANDLER_SECONDS = Histogram("bzkbot_handler_seconds", "Handler latency", ("event", "handler"))
+HANDLER_ERRORS = Counter("bzkbot_handler_errors_total", "Handler exceptions", ("event", "handler"))
+API_REQUESTS = Counter("bzkbot_api_requests_total", "Bot API calls", ("method",))
+API_ERRORS = Counter("bzkbot_api_errors_total", "Bot API call errors", ("method", "error"))
+API_SECONDS = Histogram("bzkbot_api_seconds", "Bot API call latency", ("method",))
+DAO_SECONDS = Histogram("bzkbot_dao_seconds", "DAO method latency", ("method",))
+DB_SECONDS = Histogram("bzkbot_db_seconds", "Time a pooled DB connection is held per DAO call")
+RUN_SECONDS = Gauge("bzkbot_delivery_last_run_seconds", "Wall time of the last delivery run", ("job",))
+RUN_THROUGHPUT = Gauge("bzkbot_delivery_last_run_throughput", "Messages per second in the last delivery run", ("job",))
+RUN_MESSAGES = Counter("bzkbot_delivery_messages_total", "Delivered messages", ("job", "result"))
+DB_WRITE_QUEUE = Gauge("bzkbot_db_write_queue_depth", "DB writes waiting for the writer")
+DB_COMMIT_SECONDS = Histogram("bzkbot_db_commit_seconds", "Group commit transaction latency", buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0))
+DB_COMMIT_OPS = Histogram("bzkbot_db_commit_ops", "Write operations per group commit", buckets=(1, 2, 5, 10, 25, 50, 100, 250))
+DB_COMMIT_ERRORS = Counter("bzkbot_db_commit_errors_total", "Failed group commits", ("error",))
+SCHEDULER_NEXT_RUN = Gauge("bzkbot_scheduler_next_run_timestamp_seconds", "Next fire time of a scheduler job", ("job",))
+
+
+def record_run(job: str, summary):
+    # summary — services.delivery.RunSummary
+    RUN_SECONDS.set(summary.wall_time, job=job)
+    RUN_THROUGHPUT.set(summary.throughput, job=job)
+    RUN_MESSAGES.inc(summary.sent, job=job, result="sent")
+    RUN_MESSAGES.inc(summary.failed - summary.unreachable, job=job, result="failed")
+    RUN_MESSAGES.inc(summary.unreachable, job=job, result="unreachable")
+
+
+class Liveness:
+    # polling: время последнего успешного getUpdates; webhook: поднят ли сервер
+    def __init__(self):
+        self.last_seen: Optional[float] = None
+        self.running = False
+
+    def touch(self):
+        self.last_seen = time.monotonic()
+
+    def age(self) -> Optional[float]:
+        return None if self.last_seen is None else time.monotonic() - self.last_seen
+
+
+def build_metrics_app(health: Callable[[], Awaitable[tuple[bool, dict]]]) -> web.Application:
+    async def metrics_handler(request: web.Request) -> web.Response:
+        return web.Response(text=REGISTRY.render(), content_type="text/plain", charset="utf-8", headers={"X-Content-Type-Options": "nosniff"})
+
+    async def healthz_handler(request: web.Request) -> web.Response:
+        ok, details = await health()
+        details["status"] = "ok" if ok else "fail"
+        return web.json_response(details, status=200 if ok else 503)
+
+    app = web.Application()
+    app.router.add_get("/metrics", metrics_handler)
+    app.router.add_get("/healthz", healthz_handler)
+    return app
+
+
+async def start_metrics_server(host: str, port: int, health: Callable[[], Awaitable[tuple[bool, dict]]]) -> web.AppRunner:
+    runner = web.AppRunner(build_metrics_app(health), access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    logging.info(f"Metrics endpoint: http://{host}:{port}/metrics, /healthz")
+    return runner
+
+
+async def check_with_timeout(coro: Awaitable, timeout: float) -> Optional[str]:
+    # None — проверка прошла, иначе текст ошибки
+    try:
+        await asyncio.wait_for(coro, timeout)
+        return None
+    except Exception as e:
+        return f"{type(e).__name__}: {e}" if str(e) else type(e).__name__
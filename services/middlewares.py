@@ -0,0 +1,96 @@
+import asyncio
+import time
+from typing import Any, Awaitable, Callable, Dict
+from aiogram import BaseMiddleware, Bot
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware, NextRequestMiddlewareType
+from aiogram.methods import GetUpdates, Response, TelegramMethod
+from aiogram.methods.base import TelegramType
+from aiogram.types import TelegramObject
+from db.dao import DAO
+from services.metrics import API_ERRORS, API_REQUESTS, API_SECONDS, HANDLER_ERRORS, HANDLER_SECONDS, Liveness
+
+
+class UserMiddleware(BaseMiddleware):
+    # Один раз на апдейт: кладёт db.dao.User отправителя в data["user"]
+    def __init__(self, dao: DAO):
+        self.dao = dao
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        from_user = data.get("event_from_user")
+        if from_user is not None and "user" not in data:
+            user = await self.dao.get_or_create_user(from_user.id)
+            if user.unreachable:
+                # Пишет боту — значит, снова доступен для рассылок
+                await self.dao.mark_reachable(from_user.id)
+                user = await self.dao.get_or_create_user(from_user.id)
+            data["user"] = user
+        return await handler(event, data)
+
+
+class ConcurrencyLimitMiddleware(BaseMiddleware):
+    # Ограничивает число одновременно обрабатываемых апдейтов (polling и webhook создают задачу на каждый)
+    def __init__(self, limit: int):
+        self._semaphore = asyncio.Semaphore(limit)
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        async with self._semaphore:
+            return await handler(event, data)
+
+
+class HandlerMetricsMiddleware(BaseMiddleware):
+    # Внутренний middleware: выполняется только для найденного хэндлера, метка — имя функции
+    def __init__(self, event: str):
+        self.event = event
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        handler_object = data.get("handler")
+        name = getattr(getattr(handler_object, "callback", None), "__name__", "unknown")
+        started = time.perf_counter()
+        try:
+            return await handler(event, data)
+        except Exception:
+            HANDLER_ERRORS.inc(event=self.event, handler=name)
+            raise
+        finally:
+            HANDLER_SECONDS.observe(time.perf_counter() - started, event=self.event, handler=name)
+
+
+class ApiMetricsMiddleware(BaseRequestMiddleware):
+    # Middleware сессии бота: счётчики и латентность вызовов Bot API; успешный getUpdates отмечает живость polling
+    def __init__(self, liveness: Liveness):
+        self.liveness = liveness
+
+    async def __call__(
+        self,
+        make_request: NextRequestMiddlewareType[TelegramType],
+        bot: Bot,
+        method: TelegramMethod[TelegramType],
+    ) -> Response[TelegramType]:
+        name = method.__api_method__
+        API_REQUESTS.inc(method=name)
+        started = time.perf_counter()
+        try:
+            response = await make_request(bot, method)
+        except Exception as e:
+            API_ERRORS.inc(method=name, error=type(e).__name__)
+            raise
+        finally:
+            API_SECONDS.observe(time.perf_counter() - started, method=name)
+        if isinstance(method, GetUpdates):
+            self.liveness.touch()
+        return response
@@ -0,0 +1,95 @@
+import asyncio
+import logging
+from datetime import datetime
+from typing import Optional, Sequence
+from aiogram import Bot
+from db.dao import DAO
+from services.delivery import UNREACHABLE, FanOutSender, classify_error, describe_error
+from services.metrics import record_run
+from services.reminders import mark_unreachable, report_unreachable
+from ui.keyboards import ack_custom_keyboard
+
+
+class OutboxWorker:
+    # Фоновая доставка custom_notifications в состоянии pending.
+    # Состояние хранится в БД, поэтому после рестарта рассылка продолжается с того же места.
+    def __init__(self, bot: Bot, dao: DAO, sender: FanOutSender, chunk_size: int = 200, poll_interval: float = 5.0, max_attempts: int = 3, retry_delay: float = 10.0, admin_ids: Sequence[int] = ()):
+        self.bot = bot
+        self.dao = dao
+        self.sender = sender
+        self.chunk_size = chunk_size
+        self.poll_interval = poll_interval
+        self.max_attempts = max_attempts
+        # Задержка перед повтором неудачной отправки, удваивается с каждой попыткой: без неё
+        # следующий проход сразу брал бы ту же строку и короткий сбой сети съедал все попытки
+        self.retry_delay = retry_delay
+        self.admin_ids = admin_ids
+        # Впервые недоступные с начала текущей рассылки; отчёт — когда очередь опустеет
+        self._unreachable: list[tuple[int, str]] = []
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run(), name="outbox-worker")
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def wake(self):
+        self._wakeup.set()
+
+    async def _run(self):
+        while True:
+            try:
+                drained = await self.drain_once()
+            except Exception:
+                logging.exception("outbox: drain failed")
+                drained = 0
+            if drained:
+                continue
+            if self._unreachable:
+                users, self._unreachable = self._unreachable, []
+                await report_unreachable(self.bot, self.admin_ids, "Кастомные уведомления", users)
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+    async def drain_once(self) -> int:
+        items = await self.dao.fetch_outbox(self.chunk_size)
+        if not items:
+            return 0
+        results: list[tuple[int, Optional[int], Optional[str]]] = []
+        unreachable: dict[int, str] = {}
+        # Текст читается один раз на батч, а не на каждого получателя
+        texts: dict[str, str] = {}
+        for batch_id in {item["batch_id"] for item in items}:
+            batch = await self.dao.get_batch(batch_id)
+            texts[batch_id] = batch["text"] if batch else ""
+
+        async def send(tg_id: int, item: dict):
+            return await self.bot.send_message(tg_id, texts[item["batch_id"]], reply_markup=ack_custom_keyboard(item["notif_id"]))
+
+        async def on_result(tg_id: int, item: dict, message, error):
+            if error is None:
+                results.append((item["notif_id"], message.message_id, None))
+            else:
+                results.append((item["notif_id"], None, describe_error(error)))
+                if classify_error(error) == UNREACHABLE:
+                    unreachable[tg_id] = describe_error(error)
+
+        summary = await self.sender.run(((item["tg_id"], item) for item in items), send, on_result)
+        await self.dao.record_outbox_results(results, self.max_attempts, self.retry_delay)
+        # Оставшиеся в очереди уведомления недоступным сразу уходят в failed
+        self._unreachable += await mark_unreachable(self.dao, unreachable, datetime.now().isoformat())
+        logging.info(f"outbox chunk: {summary}")
+        record_run("outbox", summary)
+        return len(items)
@@ -0,0 +1,153 @@
+import csv
+import io
+import re
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import BinaryIO, Iterator, Optional
+from db.dao import DAO, PAYMENT_TYPES
+
+# Обязательные колонки; остальные (например, из банковской выписки) игнорируются
+REQUIRED_COLUMNS = ("tg_id", "type", "amount")
+DATE_FORMATS = ("%d.%m.%Y", "%d.%m.%Y %H:%M")
+TYPE_ALIASES = {"dues": "dues", "сбор": "dues", "vpn": "vpn", "впн": "vpn"}
+# Банковский формат суммы: пробелы между разрядами, копейки через запятую или точку
+_AMOUNT = re.compile(r"(\d+)(?:[.,](\d{1,2}))?")
+
+
+@dataclass
+class PaymentLine:
+    line: int
+    tg_id: int
+    type: str
+    amount: int
+    paid_at: str
+
+
+@dataclass
+class ImportCheck:
+    lines: list[PaymentLine] = field(default_factory=list)
+    # (номер строки файла, описание ошибки); строка 0 — ошибка файла целиком
+    errors: list[tuple[int, str]] = field(default_factory=list)
+    new_users: int = 0
+
+    @property
+    def ok(self) -> bool:
+        return bool(self.lines) and not self.errors
+
+    def totals(self) -> dict[str, tuple[int, int]]:
+        # type -> (число оплат, сумма)
+        result = {t: (0, 0) for t in PAYMENT_TYPES}
+        for p in self.lines:
+            count, amount = result[p.type]
+            result[p.type] = (count + 1, amount + p.amount)
+        return result
+
+
+def _text_stream(raw: BinaryIO) -> io.TextIOWrapper:
+    # Выгрузки бывают в UTF-8 (в т.ч. с BOM) и в cp1251: кодировку определяем по началу файла
+    head = raw.read(64 * 1024)
+    raw.seek(0)
+    try:
+        head.decode("utf-8")
+        encoding = "utf-8-sig"
+    except UnicodeDecodeError as e:
+        # Оборванный на границе блока многобайтовый символ — всё ещё UTF-8
+        encoding = "utf-8-sig" if e.start >= len(head) - 3 else "cp1251"
+    return io.TextIOWrapper(raw, encoding=encoding, errors="replace", newline="")
+
+
+def _parse_amount(raw: str) -> int:
+    m = _AMOUNT.fullmatch(raw.replace(" ", "").replace("\u00a0", ""))
+    if not m:
+        raise ValueError(f"сумма «{raw}» — не число")
+    if m.group(2) and int(m.group(2)):
+        raise ValueError(f"сумма «{raw}» — только целые рубли")
+    amount = int(m.group(1))
+    if amount <= 0:
+        raise ValueError("сумма должна быть больше нуля")
+    return amount
+
+
+def _parse_date(raw: str, default: str) -> str:
+    if not raw:
+        return default
+    # ISO 8601 целиком (микросекунды, смещение пояса) — так пишет paid_at бот и выгрузка /export
+    try:
+        return datetime.fromisoformat(raw).isoformat()
+    except ValueError:
+        pass
+    for fmt in DATE_FORMATS:
+        try:
+            return datetime.strptime(raw, fmt).isoformat()
+        except ValueError:
+            continue
+    raise ValueError(f"дата «{raw}» не распознана (ожидается ГГГГ-ММ-ДД или ДД.ММ.ГГГГ)")
+
+
+def parse_payments_csv(raw: BinaryIO, now: str) -> Iterator[tuple[int, Optional[PaymentLine], Optional[str]]]:
+    # Построчно, без чтения файла целиком: (номер строки, оплата | None, ошибка | None)
+    text = _text_stream(raw)
+    try:
+        header_line = text.readline()
+        delimiter = ";" if header_line.count(";") > header_line.count(",") else ","
+        header = [h.strip().lower() for h in next(csv.reader([header_line], delimiter=delimiter), [])]
+        missing = [c for c in REQUIRED_COLUMNS if c not in header]
+        if missing:
+            yield 1, None, f"нет колонок: {', '.join(missing)} (нужна строка заголовка tg_id{delimiter}type{delimiter}amount{delimiter}paid_at)"
+            return
+        index = {name: header.index(name) for name in (*REQUIRED_COLUMNS, "paid_at") if name in header}
+        for number, row in enumerate(csv.reader(text, delimiter=delimiter), start=2):
+            if not any(cell.strip() for cell in row):
+                continue
+            if len(row) <= max(index[c] for c in REQUIRED_COLUMNS):
+                yield number, None, f"{len(row)} колонок, в заголовке {len(header)}"
+                continue
+            cells = {name: (row[i].strip() if i < len(row) else "") for name, i in index.items()}
+            try:
+                try:
+                    tg_id = int(cells["tg_id"])
+                except ValueError:
+                    raise ValueError(f"tg_id «{cells['tg_id']}» — не число")
+                if tg_id <= 0:
+                    raise ValueError("tg_id должен быть положительным")
+                type_ = TYPE_ALIASES.get(cells["type"].lower())
+                if type_ is None:
+                    raise ValueError(f"тип «{cells['type']}» — ожидается dues или vpn")
+                payment = PaymentLine(number, tg_id, type_, _parse_amount(cells["amount"]), _parse_date(cells.get("paid_at", ""), now))
+            except ValueError as e:
+                yield number, None, str(e)
+                continue
+            yield number, payment, None
+    finally:
+        # raw остаётся открытым у вызывающего
+        text.detach()
+
+
+async def check_payments_csv(dao: DAO, raw: BinaryIO, max_rows: int, now: Optional[str] = None) -> ImportCheck:
+    # Пробный прогон: разбор, проверка строк и сверка с БД (новые пользователи, уже записанные оплаты). БД не меняется
+    check = ImportCheck()
+    now = now or datetime.now().isoformat()
+    seen: dict[tuple[int, str, int, str], int] = {}
+    for number, payment, error in parse_payments_csv(raw, now):
+        if error is not None:
+            check.errors.append((number, error))
+            continue
+        if len(check.lines) >= max_rows:
+            check.errors.append((number, f"больше {max_rows} оплат в одном файле"))
+            break
+        key = (payment.tg_id, payment.type, payment.amount, payment.paid_at)
+        if key in seen:
+            check.errors.append((number, f"повтор строки {seen[key]}"))
+            continue
+        seen[key] = number
+        check.lines.append(payment)
+    if not check.lines:
+        if not check.errors:
+            check.errors.append((0, "в файле нет оплат"))
+        return check
+    preview = await dao.preview_payment_import([(p.tg_id, p.type, p.amount, p.paid_at) for p in check.lines])
+    check.new_users = preview["new_users"]
+    for i in preview["duplicates"]:
+        check.errors.append((check.lines[i].line, "такая оплата уже записана"))
+    check.errors.sort()
+    return check
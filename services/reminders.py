@@ -1,28 +1,138 @@
+import asyncio
+import logging
 from datetime import datetime
+from typing import Optional, Sequence
 import pytz
 from aiogram import Bot
-from aiogram.types import InlineKeyboardButton, InlineKeyboardMarkup
 from ui.keyboards import ack_button
 from db.dao import DAO
-from ui.messages import reminder_text
-from db.dao import DAO
-from ui.messages import reminder_text
+from ui.messages import reminder_text, unreachable_report
+from services.delivery import UNREACHABLE, FanOutSender, RunSummary, TokenBucket, classify_error, describe_error
+from services.metrics import record_run
 
 ACK_PREFIX = "ack_"
+RECORD_CHUNK_SIZE = 500
 
 def ack_callback_data(type_: str) -> str:
     return f"{ACK_PREFIX}{type_}"
 
-async def send_daily_reminders(bot: Bot, dao: DAO, tzname: str, dues_amount: int, vpn_amount: int):
+
+def reminder_slot_times(hour: int, minute: int, window_minutes: int, slot_minutes: int) -> list[tuple[int, int]]:
+    # Время начала каждого слота окна [HH:MM, HH:MM + window): слоты равной длины, не короче slot_minutes
+    slots = max(1, window_minutes // max(1, slot_minutes))
+    start = hour * 60 + minute
+    times = []
+    for i in range(slots):
+        at = (start + i * window_minutes // slots) % (24 * 60)
+        times.append((at // 60, at % 60))
+    return times
+
+
+async def mark_unreachable(dao: DAO, failures: dict[int, str], at: str) -> list[tuple[int, str]]:
+    # failures: tg_id -> причина; возвращает впервые отмеченных, с причиной
+    newly = await dao.mark_unreachable(list(failures), at)
+    return [(tg_id, failures[tg_id]) for tg_id in newly]
+
+
+async def report_unreachable(bot: Bot, admin_ids: Sequence[int], run: str, users: list[tuple[int, str]]):
+    if not users:
+        return
+    logging.warning(f"{run}: {len(users)} users became unreachable")
+    text = unreachable_report(run, users)
+    for admin_id in admin_ids:
+        try:
+            await bot.send_message(admin_id, text)
+        except Exception as e:
+            logging.error(f"unreachable report to admin {admin_id} failed: {describe_error(e)}")
+
+
+class ReminderRecorder:
+    # Запись результатов отправки порциями в фоне: воркеры рассылки не ждут commit
+    def __init__(self, dao: DAO, chunk_size: int = RECORD_CHUNK_SIZE):
+        self.dao = dao
+        self.chunk_size = chunk_size
+        self._pending: list[tuple[int, str, bool, str]] = []
+        self._tasks: set[asyncio.Task] = set()
+
+    def add(self, row: tuple[int, str, bool, str]):
+        self._pending.append(row)
+        if len(self._pending) >= self.chunk_size:
+            self._flush()
+
+    def _flush(self):
+        chunk, self._pending = self._pending, []
+        task = asyncio.create_task(self._record(chunk))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _record(self, chunk: list[tuple[int, str, bool, str]]):
+        try:
+            await self.dao.record_reminders(chunk)
+        except Exception:
+            logging.exception(f"failed to record {len(chunk)} reminders")
+
+    async def close(self):
+        if self._pending:
+            self._flush()
+        if self._tasks:
+            await asyncio.gather(*self._tasks)
+
+async def send_daily_reminders(
+    bot: Bot,
+    dao: DAO,
+    tzname: str,
+    dues_amount: int,
+    vpn_amount: int,
+    sender: Optional[FanOutSender] = None,
+    slot: int = 0,
+    slots: int = 1,
+    ceiling: Optional[TokenBucket] = None,
+    admin_ids: Sequence[int] = (),
+) -> RunSummary:
+    # slots > 1: только получатели слота slot (окно рассылки, см. reminder_slot_times).
+    # ceiling — общий для всех слотов потолок частоты: подтверждения приходят вслед за отправками,
+    # поэтому он же ограничивает и пик нажатий «Прочитано».
+    # Впервые недоступные получатели отмечаются в users и попадают в отчёт admin_ids
     tz = pytz.timezone(tzname)
     now = datetime.now(tz).isoformat()
+    sender = sender or FanOutSender()
+    total = RunSummary()
+    run_name = f"slot {slot + 1}/{slots}" if slots > 1 else "run"
+    newly_unreachable: list[tuple[int, str]] = []
     for type_ in ("dues", "vpn"):
-        users = await dao.users_for_reminder(type_)
-        for user_id, tg_id in users:
-            text = reminder_text(type_, dues_amount, vpn_amount)
-            kb = ack_button(type_)
-            try:
-                await bot.send_message(chat_id=tg_id, text=text, reply_markup=kb)
-                await dao.upsert_reminder(user_id=user_id, type_=type_, acknowledged=False, last_sent_at=now)
-            except Exception:
-                await dao.upsert_reminder(user_id=user_id, type_=type_, acknowledged=False, last_sent_at=now)
+        text = reminder_text(type_, dues_amount, vpn_amount)
+        kb = ack_button(type_)
+        recorder = ReminderRecorder(dao)
+        unreachable: dict[int, str] = {}
+
+        # Конвейер: получатели читаются порциями по id, пока идёт отправка предыдущих,
+        # а результаты пишутся в фоне
+        async def jobs(type_=type_):
+            async for chunk in dao.iter_users_for_reminder(type_, slot=slot, slots=slots):
+                for user_id, tg_id in chunk:
+                    if ceiling is not None:
+                        await ceiling.acquire()
+                    yield tg_id, user_id
+
+        async def send(tg_id: int, user_id: int):
+            return await bot.send_message(chat_id=tg_id, text=text, reply_markup=kb)
+
+        async def on_result(tg_id: int, user_id: int, result, error, type_=type_, unreachable=unreachable):
+            # Неудачная отправка не записывается: пользователь и так останется в выборке
+            if error is None:
+                recorder.add((user_id, type_, False, now))
+            elif classify_error(error) == UNREACHABLE:
+                unreachable[tg_id] = describe_error(error)
+
+        try:
+            summary = await sender.run(jobs(), send, on_result)
+        finally:
+            await recorder.close()
+        # До следующего типа: ему недоступные уже не попадут в выборку
+        newly_unreachable += await mark_unreachable(dao, unreachable, now)
+        logging.info(f"daily reminders [{type_}] {run_name}: {summary}")
+        total.merge(summary)
+    logging.info(f"daily reminders {run_name} finished: {total}")
+    record_run("daily_reminders", total)
+    await report_unreachable(bot, admin_ids, f"Ежедневные напоминания ({run_name})", newly_unreachable)
+    return total
@@ -0,0 +1,94 @@
+import asyncio
+import logging
+import secrets
+import signal
+from typing import Optional
+from aiohttp import web
+from aiogram import Bot, Dispatcher
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler
+from services.metrics import Liveness
+
+
+class ReplyInResponseHandler(SimpleRequestHandler):
+    # Апдейты обрабатываются в фоне (Telegram сразу получает 200), кроме callback'ов с data на
+    # reply_prefixes: их хэндлер выполняется до ответа, и метод, который он вернул (например
+    # cb.answer()), уходит прямо в теле ответа без отдельного запроса к Bot API. Так — только
+    # короткие хэндлеры: пока идёт обработка, Telegram держит соединение открытым
+    def __init__(self, *args, reply_prefixes: tuple[str, ...] = (), **kwargs):
+        super().__init__(*args, handle_in_background=True, **kwargs)
+        self.reply_prefixes = reply_prefixes
+
+    async def handle(self, request: web.Request) -> web.Response:
+        bot = await self.resolve_bot(request)
+        if not self.verify_secret(request.headers.get("X-Telegram-Bot-Api-Secret-Token", ""), bot):
+            return web.Response(body="Unauthorized", status=401)
+        update = await request.json(loads=bot.session.json_loads)
+        data = (update.get("callback_query") or {}).get("data") or ""
+        if self.reply_prefixes and data.startswith(self.reply_prefixes):
+            result = await self.dispatcher.feed_webhook_update(bot, update, **self.data)
+            return web.Response(body=self._build_response_writer(bot=bot, result=result))
+        task = asyncio.create_task(self._background_feed_update(bot=bot, update=update))
+        self._background_feed_update_tasks.add(task)
+        task.add_done_callback(self._background_feed_update_tasks.discard)
+        return web.json_response({}, dumps=bot.session.json_dumps)
+
+
+def build_webhook_app(dp: Dispatcher, bot: Bot, path: str, secret: str, reply_prefixes: tuple[str, ...] = ()) -> web.Application:
+    # reply_prefixes пуст — все апдейты в фоне
+    app = web.Application()
+    ReplyInResponseHandler(
+        dispatcher=dp,
+        bot=bot,
+        secret_token=secret,
+        reply_prefixes=reply_prefixes,
+    ).register(app, path=path)
+    return app
+
+
+async def run_webhook(
+    dp: Dispatcher,
+    bot: Bot,
+    url: str,
+    path: str,
+    secret: str,
+    host: str,
+    port: int,
+    max_connections: int,
+    reply_prefixes: tuple[str, ...] = (),
+    liveness: Optional[Liveness] = None,
+):
+    if not secret and url:
+        # Telegram присылает секрет в X-Telegram-Bot-Api-Secret-Token; без него чужие POST не отличить
+        secret = secrets.token_urlsafe(32)
+        logging.info("WEBHOOK_SECRET не задан: сгенерирован случайный на время работы процесса")
+    app = build_webhook_app(dp, bot, path, secret, reply_prefixes)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    if liveness is not None:
+        liveness.running = True
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop.set)
+        except (NotImplementedError, RuntimeError):
+            pass
+    try:
+        if url:
+            await bot.set_webhook(
+                url=url + path,
+                secret_token=secret,
+                max_connections=max_connections,
+                allowed_updates=dp.resolve_used_update_types(),
+            )
+        else:
+            # Без WEBHOOK_URL вебхук в Telegram не регистрируется: локальная отладка POST-запросами
+            logging.info("WEBHOOK_URL не задан: setWebhook пропущен")
+        logging.info(f"Webhook mode: listening on {host}:{port}{path}, url={url + path if url else '-'}, reply_in_response={','.join(reply_prefixes) or '-'}")
+        await stop.wait()
+    finally:
+        if liveness is not None:
+            liveness.running = False
+        await runner.cleanup()
+        await bot.session.close()
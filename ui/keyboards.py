@@ -1,3 +1,4 @@
+from typing import Optional
 from aiogram.types import InlineKeyboardButton, InlineKeyboardMarkup, KeyboardButton, ReplyKeyboardMarkup
 
 def main_menu(is_admin: bool) -> InlineKeyboardMarkup:
@@ -27,6 +28,8 @@ def admin_menu() -> InlineKeyboardMarkup:
     return InlineKeyboardMarkup(inline_keyboard=[
         [InlineKeyboardButton(text="Отметить оплату сбора", callback_data="admin_paid_dues")],
         [InlineKeyboardButton(text="Отметить оплату VPN", callback_data="admin_paid_vpn")],
+        [InlineKeyboardButton(text="Импорт оплат (CSV)", callback_data="admin_import_payments")],
+        [InlineKeyboardButton(text="Экспорт (CSV)", callback_data="admin_export")],
         [InlineKeyboardButton(text="Сберегательный счёт", callback_data="admin_savings")],
         [InlineKeyboardButton(text="Сумма сбора", callback_data="admin_dues_amount")],
         [InlineKeyboardButton(text="Сумма VPN", callback_data="admin_vpn_amount")],
@@ -35,6 +38,8 @@ def admin_menu() -> InlineKeyboardMarkup:
         [InlineKeyboardButton(text="Пользователи", callback_data="admin_users_page_1")],
         [InlineKeyboardButton(text="Кастом уведомление", callback_data="admin_custom_notification")],
         [InlineKeyboardButton(text="История уведомлений", callback_data="admin_custom_history_1")],
+        [InlineKeyboardButton(text="Кэш пользователей", callback_data="admin_cache_stats")],
+        [InlineKeyboardButton(text="Статистика БД", callback_data="admin_db_stats")],
         [InlineKeyboardButton(text="Назад", callback_data="back_main")]
     ])
 
@@ -45,32 +50,59 @@ def custom_notify_audience_keyboard() -> InlineKeyboardMarkup:
         [InlineKeyboardButton(text="Отмена", callback_data="menu_admin")]
     ])
 
-def custom_history_page_keyboard(page: int, total_pages: int) -> InlineKeyboardMarkup:
+def parse_page_cursor(data: str, prefix: str) -> tuple[int, Optional[int], Optional[int]]:
+    # "<prefix><page>[_a<after>|_b<before>]" -> (page, after, before)
+    page_part, _, cursor = data[len(prefix):].partition("_")
+    try:
+        page = max(1, int(page_part))
+        if cursor[:1] == "a":
+            return page, int(cursor[1:]), None
+        if cursor[:1] == "b":
+            return page, None, int(cursor[1:])
+    except ValueError:
+        return 1, None, None
+    return page, None, None
+
+def _page_nav(prefix: str, page: int, total_pages: int, prev_cursor: Optional[int], next_cursor: Optional[int]) -> list[InlineKeyboardButton]:
+    # Курсор (ключ первой/последней строки страницы) едет в callback_data вместо OFFSET
     nav = []
-    if page > 1:
-        nav.append(InlineKeyboardButton(text="«", callback_data=f"admin_custom_history_{page-1}"))
-    nav.append(InlineKeyboardButton(text=f"{page}/{total_pages}", callback_data="noop"))
-    if page < total_pages:
-        nav.append(InlineKeyboardButton(text="»", callback_data=f"admin_custom_history_{page+1}"))
+    if prev_cursor is not None:
+        nav.append(InlineKeyboardButton(text="«", callback_data=f"{prefix}{max(1, page-1)}_b{prev_cursor}"))
+    nav.append(InlineKeyboardButton(text=f"{page}/{max(page, total_pages)}", callback_data="noop"))
+    if next_cursor is not None:
+        nav.append(InlineKeyboardButton(text="»", callback_data=f"{prefix}{page+1}_a{next_cursor}"))
+    return nav
+
+def custom_history_page_keyboard(page: int, total_pages: int, prev_cursor: Optional[int], next_cursor: Optional[int]) -> InlineKeyboardMarkup:
+    nav = _page_nav("admin_custom_history_", page, total_pages, prev_cursor, next_cursor)
     return InlineKeyboardMarkup(inline_keyboard=[nav, [InlineKeyboardButton(text="Назад", callback_data="menu_admin")]])
 
-def batch_actions_keyboard(batch_id: str) -> InlineKeyboardMarkup:
+def batch_progress_keyboard(batch_id: str) -> InlineKeyboardMarkup:
     return InlineKeyboardMarkup(inline_keyboard=[
+        [InlineKeyboardButton(text="Обновить", callback_data=f"batch_progress_{batch_id}")],
         [InlineKeyboardButton(text="Повторить непрочитавшим", callback_data=f"resend_batch_{batch_id}")],
         [InlineKeyboardButton(text="Назад", callback_data="admin_custom_history_1")]
     ])
 
+def payment_import_keyboard(can_apply: bool) -> InlineKeyboardMarkup:
+    rows = [[InlineKeyboardButton(text="Записать оплаты", callback_data="payments_import_apply")]] if can_apply else []
+    rows.append([InlineKeyboardButton(text="Отмена", callback_data="payments_import_cancel")])
+    return InlineKeyboardMarkup(inline_keyboard=rows)
+
+def export_keyboard() -> InlineKeyboardMarkup:
+    return InlineKeyboardMarkup(inline_keyboard=[
+        [InlineKeyboardButton(text="Оплаты", callback_data="export_payments")],
+        [InlineKeyboardButton(text="Напоминания", callback_data="export_reminders")],
+        [InlineKeyboardButton(text="Уведомления", callback_data="export_notifications")],
+        [InlineKeyboardButton(text="Назад", callback_data="menu_admin")]
+    ])
+
 def ack_custom_keyboard(notif_id: int) -> InlineKeyboardMarkup:
     return InlineKeyboardMarkup(inline_keyboard=[[InlineKeyboardButton(text="Прочитано", callback_data=f"ackc_{notif_id}")]])
 
-def admin_users_page_keyboard(page: int, total_pages: int) -> InlineKeyboardMarkup:
+def admin_users_page_keyboard(page: int, total_pages: int, prev_cursor: Optional[int], next_cursor: Optional[int]) -> InlineKeyboardMarkup:
     buttons = []
-    nav_row = []
-    if page > 1:
-        nav_row.append(InlineKeyboardButton(text="«", callback_data=f"admin_users_page_{page-1}"))
-    nav_row.append(InlineKeyboardButton(text=f"{page}/{total_pages}", callback_data="noop"))
-    if page < total_pages:
-        nav_row.append(InlineKeyboardButton(text="»", callback_data=f"admin_users_page_{page+1}"))
+    nav_row = _page_nav("admin_users_page_", page, total_pages, prev_cursor, next_cursor)
     buttons.append(nav_row)
     buttons.append([InlineKeyboardButton(text="Назад", callback_data="menu_admin")])
     return InlineKeyboardMarkup(inline_keyboard=buttons)
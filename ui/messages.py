@@ -53,15 +53,22 @@ def saved_message() -> str:
 def marked_message() -> str:
     return "✅ Отмечено"
 
-def admin_prompt_schedule(hour: int, minute: int) -> str:
+def schedule_text(hour: int, minute: int, window: int = 0) -> str:
+    if not window:
+        return f"{hour:02d}:{minute:02d}"
+    end = (hour * 60 + minute + window) % (24 * 60)
+    return f"{hour:02d}:{minute:02d}–{end // 60:02d}:{end % 60:02d}"
+
+def admin_prompt_schedule(hour: int, minute: int, window: int = 0) -> str:
     return (
         "⏰ Текущее время рассылки: "
-        f"{hour:02d}:{minute:02d}\n"
-        "Введите новое время в формате `HH:MM`"
+        f"{schedule_text(hour, minute, window)}\n"
+        "Введите новое время в формате `HH:MM` или окно `HH:MM-HH:MM` — "
+        "тогда напоминания распределятся по всему окну"
     )
 
-def schedule_updated(hour: int, minute: int) -> str:
-    return f"✅ Время рассылки обновлено: {hour:02d}:{minute:02d}"
+def schedule_updated(hour: int, minute: int, window: int = 0) -> str:
+    return f"✅ Время рассылки обновлено: {schedule_text(hour, minute, window)}"
 
 def admin_prompt_status_visibility() -> str:
     return ("👁 Введите управление видимостью статуса:\n"
@@ -83,6 +90,7 @@ def admin_users_list(title: str, users: list[dict]) -> str:
             f" | VDUES:{'👁' if u.get('show_dues', True) else '🙈'} "
             f"VVPN:{'👁' if u.get('show_vpn', True) else '🙈'} "
             f"VSAV:{'👁' if u.get('show_savings', True) else '🙈'}"
+            f"{' ⛔ недоступен' if u.get('unreachable') else ''}"
         )
     lines.append("\nНажмите номер для управления (пока через ввод команды или кнопку действия).")
     return "\n".join(lines)
@@ -103,9 +111,6 @@ def custom_notify_enter_ids() -> str:
 def custom_notify_enter_text(audience_desc: str) -> str:
     return f"Введите текст уведомления для: {audience_desc}"
 
-def custom_notify_sent(count: int) -> str:
-    return f"✅ Отправлено уведомлений: {count}"
-
 def custom_notify_invalid_ids() -> str:
     return "Некорректный формат списка ID."
 
@@ -120,8 +125,115 @@ def custom_history_list(title: str, batches: list[dict]) -> str:
         )
     return "\n".join(lines)
 
-def batch_resend_result(batch_id: str, attempted: int, sent: int) -> str:
-    return f"🔁 Батч {batch_id[:6]}: повторно попыток={attempted}, доставлено={sent}"
-
 def custom_acknowledged() -> str:
     return "✅ Уведомление отмечено прочитанным"
+
+def cache_stats_message(stats: dict) -> str:
+    return (
+        "🗃 Кэш пользователей\n"
+        f"• Записей: {stats['size']}/{stats['max_size']}\n"
+        f"• Попадания: {stats['hits']} / промахи: {stats['misses']} ({stats['hit_rate']:.1%})\n"
+        f"• Вытеснено: {stats['evictions']}, инвалидаций: {stats['invalidations']}"
+    )
+
+def dao_stats_message(summary: list[dict], window: float, limit: int = 15) -> str:
+    lines = [f"⏱ Запросы DAO за {int(window // 60)} мин (по суммарному времени)"]
+    if not summary:
+        lines.append("(Нет вызовов)")
+    for r in summary[:limit]:
+        lines.append(
+            f"• {r['method']}: {r['calls']} ({r['rate']:.2f}/с), "
+            f"p50 {r['p50'] * 1000:.1f} / p95 {r['p95'] * 1000:.1f} / p99 {r['p99'] * 1000:.1f} мс, строк {r['rows']:.1f}"
+        )
+    if len(summary) > limit:
+        lines.append(f"… и ещё {len(summary) - limit}")
+    return "\n".join(lines)
+
+def payment_totals_report(drift: list[dict], fixed: bool) -> str:
+    if not drift:
+        return "✅ Итоги оплат сходятся с таблицей payments"
+    lines = ["⚠ Расхождение итогов оплат:"]
+    for d in drift:
+        lines.append(f"• {d['type']}: сохранено {d['stored']}₽ ({d['stored_count']}), фактически {d['actual']}₽ ({d['actual_count']})")
+    lines.append("Исправлено." if fixed else "Для исправления: /check_totals fix")
+    return "\n".join(lines)
+
+def custom_notify_queued(batch_id: str, count: int) -> str:
+    return f"📨 Батч {batch_id[:6]} поставлен в очередь: {count} получателей. Прогресс — кнопкой ниже."
+
+def batch_progress_message(batch_id: str, progress: dict) -> str:
+    return (
+        f"📨 Батч {batch_id[:6]}\n"
+        f"• В очереди: {progress['pending']}\n"
+        f"• Доставлено: {progress['sent']}\n"
+        f"• Ошибки: {progress['failed']}\n"
+        f"• Прочитано: {progress['acked']}/{progress['total']}"
+    )
+
+def batch_requeued(batch_id: str, count: int) -> str:
+    return f"🔁 Батч {batch_id[:6]}: повторно в очередь поставлено {count}"
+
+def unreachable_report(run: str, users: list[tuple[int, str]], limit: int = 30) -> str:
+    lines = [f"⛔ {run}: недоступны {len(users)} пользователей, рассылки им больше не отправляются"]
+    for tg_id, reason in users[:limit]:
+        lines.append(f"• {tg_id} — {reason}")
+    if len(users) > limit:
+        lines.append(f"… и ещё {len(users) - limit}")
+    lines.append("Пользователь снова станет доступен, как только напишет боту.")
+    return "\n".join(lines)
+
+def payment_import_prompt(max_rows: int) -> str:
+    return (
+        "📥 Пришлите CSV-файл с оплатами документом.\n"
+        "Первая строка — заголовок с колонками `tg_id`, `type` (dues или vpn), `amount` и необязательной `paid_at` "
+        "(ГГГГ-ММ-ДД или ДД.ММ.ГГГГ; пусто — сейчас). Разделитель `,` или `;`, остальные колонки игнорируются.\n"
+        f"До {max_rows} оплат в файле. Сначала будет пробный прогон, запись — после подтверждения."
+    )
+
+def payment_import_summary(count: int, totals: dict[str, tuple[int, int]], new_users: int, errors: list[tuple[int, str]], limit: int = 20) -> str:
+    names = {"dues": "Сбор", "vpn": "VPN"}
+    lines = [f"📥 Пробный прогон, оплат в файле: {count}"]
+    for type_, (n, amount) in totals.items():
+        if n:
+            lines.append(f"• {names.get(type_, type_)}: {n} на {amount}₽")
+    if new_users:
+        lines.append(f"• Новых пользователей: {new_users}")
+    if errors:
+        lines.append(f"\n⚠ Ошибок: {len(errors)} — ничего не записано. Исправьте файл и пришлите снова.")
+        for line, error in errors[:limit]:
+            lines.append(f"• {'файл' if line == 0 else f'строка {line}'}: {error}")
+        if len(errors) > limit:
+            lines.append(f"… и ещё {len(errors) - limit} (полный список — в файле)")
+    else:
+        lines.append("\nОшибок нет. Записать все оплаты одной транзакцией?")
+    return "\n".join(lines)
+
+def payment_import_errors_file(errors: list[tuple[int, str]]) -> str:
+    return "\n".join(f"{'file' if line == 0 else line}\t{error}" for line, error in errors) + "\n"
+
+def payment_import_done(payments: int, new_users: int) -> str:
+    return f"✅ Записано оплат: {payments}, создано пользователей: {new_users}"
+
+def payment_import_changed() -> str:
+    return "⚠ С момента проверки данные изменились (например, часть оплат уже записана). Пришлите файл снова."
+
+EXPORT_NAMES = {"payments": "Оплаты", "reminders": "Напоминания", "notifications": "Уведомления"}
+
+def export_help() -> str:
+    return (
+        "📤 Выгрузка в CSV (разделитель `;`). Кнопки ниже — всё целиком, с фильтрами — командой:\n"
+        "`/export <что> [период] [тип]`\n"
+        "• что: `payments`, `reminders` или `notifications`\n"
+        "• период: `2024-05-01`, `2024-05-01..2024-05-31`, `2024-05-01..` или `..2024-05-31`\n"
+        "• тип: `dues`/`vpn` для оплат и напоминаний, `pending`/`sent`/`failed` для уведомлений\n"
+        "Например: `/export payments 2024-01-01..2024-03-31 vpn`"
+    )
+
+def export_caption(kind: str, rows: int) -> str:
+    return f"📤 {EXPORT_NAMES.get(kind, kind)}: {rows} строк"
+
+def export_empty() -> str:
+    return "По этим фильтрам строк нет — файл не отправлен."
+
+def export_failed(error: str) -> str:
+    return f"⚠ Выгрузка не удалась: {error}"